@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: header probe vs. full OpenCV decode for validation + staging.
+
+Generates a small set of synthetic images in a temporary directory and times,
+per file:
+
+- decode: the pre-probe path. Validation does cv2.imread, then staging does
+  IMREAD_UNCHANGED to count channels and IMREAD_COLOR again to convert.
+- probe:  media_probe.probe_image for validation and for the channel check,
+  plus a single IMREAD_COLOR for images that still need converting.
+
+Usage:
+    python3 benchmarks/bench_media_probe.py [--size 2048] [--count 20]
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from media_probe import probe_image  # noqa: E402
+
+KINDS = {
+    "gray8.tif": lambda size: np.random.randint(0, 255, (size, size), np.uint8),
+    "gray16.tif": lambda size: np.random.randint(0, 65535, (size, size), np.uint16),
+    "rgb.tif": lambda size: np.random.randint(0, 255, (size, size, 3), np.uint8),
+    "rgba.png": lambda size: np.random.randint(0, 255, (size, size, 4), np.uint8),
+    "rgb.jpg": lambda size: np.random.randint(0, 255, (size, size, 3), np.uint8),
+}
+
+
+def decode_path(path):
+    img = cv2.imread(path)
+    if img is None:
+        return
+    img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if img.ndim == 3 and img.shape[2] == 3:
+        return
+    cv2.imread(path, cv2.IMREAD_COLOR)
+
+
+def probe_path(path):
+    info = probe_image(path)
+    if info is None or info.width <= 0:
+        return
+    info = probe_image(path)
+    if info.channels == 3:
+        return
+    cv2.imread(path, cv2.IMREAD_COLOR)
+
+
+def time_per_file(fn, paths, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in paths:
+            fn(path)
+        best = min(best, time.perf_counter() - start)
+    return best / len(paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=2048, help="Image side length")
+    parser.add_argument("--count", type=int, default=20, help="Files per image kind")
+    parser.add_argument("--repeat", type=int, default=3, help="Best-of repetitions")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-probe-") as tmp:
+        print(f"Generating {args.count} x {len(KINDS)} images of {args.size}px...")
+        by_kind = {}
+        for kind, make in KINDS.items():
+            img = make(args.size)
+            paths = []
+            for i in range(args.count):
+                path = str(Path(tmp) / f"{i:04d}-{kind}")
+                cv2.imwrite(path, img)
+                paths.append(path)
+            by_kind[kind] = paths
+
+        print(f"{'kind':<12} {'decode ms':>10} {'probe ms':>10} {'speedup':>8}")
+        for kind, paths in by_kind.items():
+            decode = time_per_file(decode_path, paths, args.repeat) * 1000
+            probe = time_per_file(probe_path, paths, args.repeat) * 1000
+            print(f"{kind:<12} {decode:>10.2f} {probe:>10.2f} {decode / probe:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for yolo_inference.py: discovery, validation, staging and
+the full worker loop, on CPU, without GPUs or network access.
+
+Generates a synthetic source tree (grayscale 8- and 16-bit TIFFs, RGBA PNGs,
+short MJPG AVIs and a sprinkling of corrupt files), then runs every
+combination of the configuration lists given on the command line. Each
+configuration runs in a fresh subprocess so its peak RSS is its own, and
+reports files/s for:
+
+- discover: discover_files()
+- validate: validate_files() with validation_workers
+- stage:    stage_batch_to_disk() / stage_batch_in_memory() on one batch
+- loop:     process_files_on_device() over every valid file, on one worker
+
+By default the loop predicts with a stub model that decodes and resizes each
+image or video frame the way Ultralytics' loaders would, but runs no network;
+it measures the pipeline around the model. Pass --model with local weights
+(e.g. a yolov8n.pt) to run the real model on CPU instead; that needs torch
+and ultralytics installed. Memory staging builds an Ultralytics loader, so it
+needs ultralytics installed even with the stub model, as does
+--decode-workers above 0 (video runs only).
+
+Usage:
+    python3 benchmarks/bench_yolo_inference.py --ext .tif,.avi \\
+        --files-per-call 50,500 --convert-workers 1,8 --validation-workers 0
+"""
+import argparse
+import itertools
+import json
+import os
+import queue
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Image kinds written for each generated image slot, by extension.
+IMAGE_KINDS = {
+    "gray8.tif": lambda rng, size: rng.integers(0, 255, (size, size), np.uint8),
+    "gray16.tif": lambda rng, size: rng.integers(0, 65535, (size, size), np.uint16),
+    "rgba.png": lambda rng, size: rng.integers(0, 255, (size, size, 4), np.uint8),
+}
+CORRUPT_EVERY = 50
+FILES_PER_DIR = 200
+
+
+def generate_tree(root, images, videos, size, video_frames, seed=0):
+    """Write the synthetic source tree under `root`."""
+    rng = np.random.default_rng(seed)
+    root = Path(root)
+
+    def target(index, name):
+        directory = root / f"d{index // FILES_PER_DIR:04d}"
+        directory.mkdir(parents=True, exist_ok=True)
+        return directory / name
+
+    for kind, make in IMAGE_KINDS.items():
+        # A handful of distinct images, written many times: generation stays
+        # fast, and decode cost does not depend on pixel values.
+        samples = [make(rng, size) for _ in range(4)]
+        for i in range(images):
+            path = target(i, f"{i:06d}-{kind}")
+            if i % CORRUPT_EVERY == CORRUPT_EVERY - 1:
+                # Alternate between garbage and a truncated real file.
+                if i // CORRUPT_EVERY % 2:
+                    path.write_bytes(rng.bytes(1024))
+                else:
+                    ok, encoded = cv2.imencode(path.suffix, samples[0])
+                    path.write_bytes(encoded.tobytes()[:200])
+                continue
+            cv2.imwrite(str(path), samples[i % len(samples)])
+
+    frame = rng.integers(0, 255, (size, size, 3), np.uint8)
+    for i in range(videos):
+        path = target(i, f"{i:06d}-clip.avi")
+        if i % CORRUPT_EVERY == CORRUPT_EVERY - 1:
+            path.write_bytes(rng.bytes(4096))
+            continue
+        writer = cv2.VideoWriter(
+            str(path), cv2.VideoWriter_fourcc(*"MJPG"), 10, (size, size)
+        )
+        for n in range(video_frames):
+            writer.write(np.roll(frame, n, axis=1))
+        writer.release()
+
+
+class StubResult:
+    def __init__(self, path, orig_shape):
+        self.path = path
+        self.orig_shape = orig_shape
+        self.boxes = None
+        self.names = {}
+
+
+class StubModel:
+    """
+    Stands in for YOLO: reads every image or kept video frame from the
+    source it is given, letterboxes it to imgsz, and returns empty results.
+    """
+
+    def predict(self, source, stream=True, imgsz=640, vid_stride=1, **kwargs):
+        if hasattr(source, "__next__"):
+            # An in-memory loader from yolo_sources.
+            for paths, imgs, _ in source:
+                for path, img in zip(paths, imgs):
+                    yield self._infer(path, img, imgsz)
+            return
+
+        source = str(source)
+        if source.endswith(".txt"):
+            paths = Path(source).read_text().splitlines()
+        else:
+            paths = [source]
+        for path in paths:
+            if path.lower().endswith((".avi", ".mp4", ".mov", ".mkv")):
+                yield from self._video(path, imgsz, max(1, vid_stride))
+                continue
+            img = cv2.imread(path)
+            if img is None:
+                raise RuntimeError(f"Image Read Error {path}")
+            yield self._infer(path, img, imgsz)
+
+    def _video(self, path, imgsz, vid_stride):
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            raise RuntimeError(f"Failed to open {path}")
+        try:
+            while True:
+                for _ in range(vid_stride - 1):
+                    cap.grab()
+                ok, frame = cap.read()
+                if not ok:
+                    return
+                yield self._infer(path, frame, imgsz)
+        finally:
+            cap.release()
+
+    def _infer(self, path, img, imgsz):
+        height, width = img.shape[:2]
+        scale = imgsz / max(height, width)
+        cv2.resize(img, (round(width * scale), round(height * scale)))
+        return StubResult(path, (height, width))
+
+
+def build_args(config, tree, project):
+    import yolo_inference
+
+    # Positional arguments, in the order yolo_inference.parse_args expects.
+    positional = [
+        "cpu", "True", "0.5", "0.1", str(config["imgsz"]), str(config["batch"]),
+        "False", "300", str(config["vid_stride"]), "False", "False", "False",
+        "None", "False", "None", "bench", "False",
+        "False", "False", "False", "False", "False", "False", "True", "True", "True",
+    ]  # fmt: skip
+    options = [
+        "--source-root", str(tree),
+        "--project", str(project),
+        "--ext", config["ext"],
+        "--files-per-call", str(config["files_per_call"]),
+        "--convert-workers", str(config["convert_workers"]),
+        "--validation-workers", str(config["validation_workers"]),
+        "--staging-mode", config["staging_mode"],
+        "--decode-workers", str(config["decode_workers"]),
+        "--model", config["model"] or "stub",
+    ]  # fmt: skip
+    return yolo_inference.parse_args(positional + options)
+
+
+def rate(count, seconds):
+    return round(count / seconds, 1) if seconds > 0 else None
+
+
+def run_config(config, tree):
+    """Run one configuration in this process and return its measurements."""
+    import yolo_inference as yi
+
+    if not config["model"]:
+        yi.load_model = lambda model_path: StubModel()
+
+    result = dict(config)
+    with tempfile.TemporaryDirectory(prefix="bench-yolo-out-") as project:
+        args = build_args(config, tree, project)
+        slot = yi.WorkerSlot("cpu", "cpu-w0", "CPU w0", None)
+
+        start = time.perf_counter()
+        files = yi.discover_files(args)
+        result["discover_fps"] = rate(len(files), time.perf_counter() - start)
+        result["files"] = len(files)
+
+        start = time.perf_counter()
+        valid, skipped = yi.validate_files(files, False, args.validation_workers)
+        result["validate_fps"] = rate(len(files), time.perf_counter() - start)
+        result["invalid"] = skipped
+
+        first_batch = [file_path for file_path, _ in valid[: args.files_per_call]]
+        if first_batch and args.ext.lower() in yi.IMAGE_EXTS:
+            start = time.perf_counter()
+            if args.staging_mode == "memory":
+                staged = yi.stage_batch_in_memory(
+                    first_batch,
+                    slot.label,
+                    args.convert_workers,
+                    args.staging_memory_mb * 1024 * 1024,
+                    args.batch,
+                )
+            else:
+                staged = yi.stage_batch_to_disk(
+                    first_batch, Path(args.source_root), slot, args.convert_workers
+                )
+            result["stage_fps"] = rate(len(first_batch), time.perf_counter() - start)
+            result["staged_mb"] = round(staged.staged_bytes / 1e6, 1)
+            staged.cleanup()
+
+        costs = [
+            (file_path, yi.estimate_file_cost(frames, args.vid_stride))
+            for file_path, frames in valid
+        ]
+        batches = [batch for _, batch in yi.plan_batches(costs, args.files_per_call, 1)]
+        work_queue = queue.Queue()
+        yi.enqueue_batches(work_queue, batches, 1)
+        manifest_file = Path(project) / ".completed_files.txt"
+
+        start = time.perf_counter()
+        try:
+            yi.process_files_on_device(
+                slot,
+                work_queue,
+                len(batches),
+                manifest_file,
+                threading.Lock(),
+                args,
+                None,
+                None,
+            )
+        except Exception as e:
+            result["loop_error"] = str(e)
+        elapsed = time.perf_counter() - start
+        result["loop_fps"] = rate(len(valid), elapsed)
+        frames = sum(cost for _, cost in costs)
+        result["loop_frames_ps"] = rate(frames, elapsed)
+
+    # Linux reports ru_maxrss in KiB.
+    result["peak_rss_mb"] = round(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+    )
+    return result
+
+
+def configurations(args):
+    def split(value, cast=str):
+        return [cast(item) for item in value.split(",") if item]
+
+    keys = [
+        "ext", "files_per_call", "convert_workers", "validation_workers", "staging_mode",
+        "decode_workers",
+    ]  # fmt: skip
+    grid = itertools.product(
+        split(args.ext),
+        split(args.files_per_call, int),
+        split(args.convert_workers, int),
+        split(args.validation_workers, int),
+        split(args.staging_mode),
+        split(args.decode_workers, int),
+    )
+    for values in grid:
+        config = dict(zip(keys, values))
+        is_image = config["ext"] in (".tif", ".tiff", ".png")
+        if not is_image and config["staging_mode"] == "memory":
+            continue  # Videos are never staged in memory.
+        if is_image and config["decode_workers"]:
+            continue  # Decoder processes only read videos.
+        config.update(
+            imgsz=args.imgsz, batch=args.batch, vid_stride=args.vid_stride, model=args.model
+        )
+        yield config
+
+
+COLUMNS = [
+    ("ext", "ext", 5),
+    ("files_per_call", "fpc", 5),
+    ("convert_workers", "cw", 3),
+    ("validation_workers", "vw", 3),
+    ("staging_mode", "staging", 7),
+    ("decode_workers", "dw", 3),
+    ("discover_fps", "discover/s", 11),
+    ("validate_fps", "validate/s", 11),
+    ("stage_fps", "stage/s", 9),
+    ("loop_fps", "loop/s", 8),
+    ("loop_frames_ps", "frames/s", 9),
+    ("peak_rss_mb", "rss MB", 8),
+]
+
+
+def print_row(values):
+    print(" ".join(f"{str(value):>{width}}" for value, (_, _, width) in zip(values, COLUMNS)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tree", help="Reuse or create the synthetic tree here")
+    parser.add_argument("--images", type=int, default=300, help="Files per image kind")
+    parser.add_argument("--videos", type=int, default=20)
+    parser.add_argument("--video-frames", type=int, default=60)
+    parser.add_argument("--size", type=int, default=1024, help="Image/frame side in px")
+    parser.add_argument("--ext", default=".tif,.png,.avi")
+    parser.add_argument("--files-per-call", default="100,1000")
+    parser.add_argument("--convert-workers", default="1,8")
+    parser.add_argument("--validation-workers", default="0")
+    parser.add_argument("--staging-mode", default="disk")
+    parser.add_argument("--decode-workers", default="0")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--vid-stride", type=int, default=1)
+    parser.add_argument("--model", default=None, help="Local YOLO weights; stub if unset")
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show worker output")
+    parser.add_argument("--run-config", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_config:
+        # Child mode: one configuration, result as the last line of stdout.
+        print(json.dumps(run_config(json.loads(args.run_config), args.tree)))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="bench-yolo-tree-") as tmp:
+        tree = Path(args.tree or tmp)
+        if not any(tree.glob("d*")):
+            print(f"Generating synthetic tree in {tree}...")
+            generate_tree(tree, args.images, args.videos, args.size, args.video_frames)
+
+        print_row([title for _, title, _ in COLUMNS])
+        results = []
+        for config in configurations(args):
+            child = subprocess.run(
+                [
+                    sys.executable,
+                    __file__,
+                    "--tree",
+                    str(tree),
+                    "--run-config",
+                    json.dumps(config),
+                ],
+                stdout=subprocess.PIPE,
+                stderr=None if args.verbose else subprocess.DEVNULL,
+                text=True,
+            )
+            lines = child.stdout.strip().splitlines()
+            if child.returncode != 0 or not lines:
+                print(f"{config}: failed with exit code {child.returncode}")
+                continue
+            result = json.loads(lines[-1])
+            results.append(result)
+            print_row([result.get(key, "-") for key, _, _ in COLUMNS])
+            if "loop_error" in result:
+                print(f"  loop error: {result['loop_error']}")
+
+        if args.json:
+            Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Compact completion index for yolo_inference.py.
+
+.completed_files.txt stays the source of truth: an append-only journal that
+workers extend one batch of finished paths at a time. What changes is how
+membership is answered. Loading the journal into a set of full path strings
+costs well over 100 bytes per entry, so instead:
+
+- .completed_files.idx is an open-addressing hash table of 8-byte path
+  digests, memory-mapped read-only. Its header records how many journal bytes
+  it covers.
+- Journal lines appended after that offset (the tail) are hashed into a small
+  in-memory set when the index is opened or refreshed.
+- compact() folds the tail into a new table and atomically replaces the file.
+  Readers reload the table on their next refresh() once it has been
+  replaced, so their tails only hold what was appended since.
+- A table that is corrupt or truncated is ignored with a warning, and the
+  whole journal is read into the tail instead; the next compact() rewrites it.
+
+Membership is O(1) either way, and process memory no longer grows with the
+journal. Digests are 64-bit, so a false "already complete" needs a collision
+with a probability around 1e-6 even at ten million entries.
+"""
+import mmap
+import os
+import struct
+import sys
+from array import array
+from hashlib import blake2b
+from pathlib import Path
+
+INDEX_SUFFIX = ".idx"
+
+_MAGIC = b"YCIDX001"
+# magic, capacity (slots), count (digests stored), journal bytes covered
+_HEADER = struct.Struct("<8sQQQ")
+
+# Compact once the tail holds this many entries, or a quarter of the indexed
+# ones, whichever is larger.
+COMPACT_MIN_TAIL = 100_000
+COMPACT_TAIL_RATIO = 0.25
+
+_MIN_CAPACITY = 1024
+
+
+def path_digest(file_path):
+    """Non-zero 64-bit digest of a path string; zero marks an empty slot."""
+    digest = blake2b(str(file_path).encode("utf-8", "surrogateescape"), digest_size=8)
+    return int.from_bytes(digest.digest(), "little") or 1
+
+
+def _table_capacity(count):
+    capacity = _MIN_CAPACITY
+    while capacity < count * 2:
+        capacity *= 2
+    return capacity
+
+
+def _insert(slots, mask, digest):
+    slot = digest & mask
+    while slots[slot]:
+        if slots[slot] == digest:
+            return False
+        slot = (slot + 1) & mask
+    slots[slot] = digest
+    return True
+
+
+class CompletionIndex:
+    """
+    Read-only view of the completion manifest with O(1) membership checks.
+
+    Open one per process from the journal path; nothing needs to be pickled
+    across a spawn. Writers keep appending to the journal with
+    mark_files_complete(); call refresh() to pick those lines up.
+
+    refresh() also reloads the table once another process has replaced it,
+    which keeps the tail short while a long run is compacted under it.
+
+    With mapped=False the table is read into memory instead of mapped, for
+    tables another host may replace: over NFS, pages of a mapped file that
+    another client replaced can fault with SIGBUS or ESTALE. A replacement
+    by a process on the same host is safe to map, since the client keeps the
+    old file alive for as long as it is open.
+    """
+
+    def __init__(self, journal_file, mapped=True):
+        self.journal_file = Path(journal_file)
+        self.index_file = self.journal_file.with_name(
+            self.journal_file.name + INDEX_SUFFIX
+        )
+        self._mapped = mapped
+        self._mmap = None
+        self._slots = None
+        self._mask = 0
+        self._indexed = 0
+        self._covered = 0
+        self._offset = 0
+        self._tail = set()
+        # Identity of the table file last opened, to notice it being replaced.
+        self._table_id = None
+        self._open_table()
+        self.refresh()
+
+    def _table_file_id(self, stat):
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _open_table(self):
+        self._close_table()
+        self._table_id = None
+        try:
+            with open(self.index_file, "rb") as f:
+                self._table_id = self._table_file_id(os.fstat(f.fileno()))
+                if self._mapped:
+                    table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                else:
+                    table = f.read()
+        except (FileNotFoundError, ValueError):
+            # Missing, or empty and therefore not mappable: start from scratch.
+            return
+        if not table:
+            return
+
+        valid = len(table) >= _HEADER.size
+        if valid:
+            magic, capacity, count, covered = _HEADER.unpack_from(table)
+            valid = (
+                magic == _MAGIC
+                and len(table) == _HEADER.size + capacity * 8
+                and not capacity & (capacity - 1)
+            )
+        if not valid:
+            if self._mapped:
+                table.close()
+            print(
+                f"WARNING: {self.index_file} is not a valid completion index; "
+                "rebuilding it from the journal",
+                file=sys.stderr,
+                flush=True,
+            )
+            # Nothing in the tail came from the table, so re-reading the whole
+            # journal into it loses nothing.
+            self._offset = 0
+            return
+
+        if self._mapped:
+            self._mmap = table
+        self._slots = memoryview(table)[_HEADER.size :].cast("Q")
+        self._mask = capacity - 1
+        self._indexed = count
+        self._covered = covered
+        self._offset = covered
+
+    def _close_table(self):
+        if self._slots is not None:
+            self._slots.release()
+            self._slots = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._mask = 0
+        self._indexed = 0
+        self._covered = 0
+
+    def refresh(self):
+        """Hash any journal lines appended since the last read into the tail."""
+        self._reload_if_replaced()
+        try:
+            with open(self.journal_file, "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+
+        # A writer may be mid-append; only consume up to the last full line.
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            line = line.strip()
+            if line:
+                digest = path_digest(line.decode("utf-8", "surrogateescape"))
+                if not self._in_table(digest):
+                    self._tail.add(digest)
+        self._offset += end
+
+    def _reload_if_replaced(self):
+        try:
+            table_id = self._table_file_id(os.stat(self.index_file))
+        except FileNotFoundError:
+            return
+        if table_id != self._table_id:
+            # The new table covers what the tail held up to its offset, and
+            # refresh() reads the rest of the journal back in.
+            self._tail = set()
+            self._offset = 0
+            self._open_table()
+
+    def _in_table(self, digest):
+        if self._slots is None:
+            return False
+        slots, mask = self._slots, self._mask
+        slot = digest & mask
+        while True:
+            value = slots[slot]
+            if value == digest:
+                return True
+            if not value:
+                return False
+            slot = (slot + 1) & mask
+
+    def __contains__(self, file_path):
+        digest = path_digest(file_path)
+        return digest in self._tail or self._in_table(digest)
+
+    def __len__(self):
+        return self._indexed + len(self._tail)
+
+    def needs_compaction(self):
+        return len(self._tail) >= max(
+            COMPACT_MIN_TAIL, int(self._indexed * COMPACT_TAIL_RATIO)
+        )
+
+    def compact(self):
+        """
+        Rewrite the table to include the tail. Only one process may compact at
+        a time; yolo_inference.py does it from the parent while its workers
+        keep reading the old table until their next refresh().
+        """
+        self.refresh()
+        count = self._indexed + len(self._tail)
+        capacity = _table_capacity(count)
+        slots = array("Q", bytes(capacity * 8))
+        mask = capacity - 1
+
+        if self._slots is not None:
+            for digest in self._slots:
+                if digest:
+                    _insert(slots, mask, digest)
+        for digest in self._tail:
+            _insert(slots, mask, digest)
+
+        tmp_file = self.index_file.with_name(self.index_file.name + ".tmp")
+        with open(tmp_file, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, capacity, count, self._offset))
+            slots.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.index_file)
+
+        self._tail = set()
+        self._open_table()
+
+    def close(self):
+        self._close_table()
+        self._tail = set()
+
+
+# Journals of every node writing to one project: .completed_files.txt and
+# .completed_files.<node>.txt (see coordination).
+JOURNAL_GLOB = ".completed_files*.txt"
+
+
+class SharedCompletionIndex:
+    """
+    A CompletionIndex over this node's journal plus read-only ones over every
+    other journal in the same directory, answering membership for all of
+    them. Journals that appear later are picked up by refresh(). Only this
+    node's own index is ever compacted, since each node compacts its own.
+    Other nodes replace their tables when they compact, so those are read
+    into memory rather than mapped.
+    """
+
+    def __init__(self, journal_file):
+        self.journal_file = Path(journal_file)
+        self.own = CompletionIndex(self.journal_file)
+        self._others = {}
+        self._scan()
+
+    def _scan(self):
+        for journal in self.journal_file.parent.glob(JOURNAL_GLOB):
+            if journal != self.journal_file and journal not in self._others:
+                self._others[journal] = CompletionIndex(journal, mapped=False)
+
+    def refresh(self):
+        self.own.refresh()
+        known = set(self._others)
+        self._scan()
+        for journal in known:
+            self._others[journal].refresh()
+
+    def __contains__(self, file_path):
+        return file_path in self.own or any(
+            file_path in index for index in self._others.values()
+        )
+
+    def __len__(self):
+        """Entries across journals; a file completed by two nodes counts twice."""
+        return len(self.own) + sum(len(index) for index in self._others.values())
+
+    def needs_compaction(self):
+        return self.own.needs_compaction()
+
+    def compact(self):
+        self.own.compact()
+
+    def close(self):
+        self.own.close()
+        for index in self._others.values():
+            index.close()
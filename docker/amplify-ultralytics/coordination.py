@@ -0,0 +1,219 @@
+"""
+Splitting one dataset between several yolo_inference.py containers, on one
+host or many, that share a project directory (typically over NFS).
+
+Two mechanisms, usable together:
+
+- Static sharding (--num-shards/--shard-index): each node only discovers the
+  files whose relative path hashes to its shard. No coordination is needed,
+  and a node that is re-run picks up exactly its own shard again.
+- Claims (--coordinate): every node discovers the whole dataset, and a
+  worker claims each file before processing it by creating
+  <project>/.coordination/claims/<digest> with O_CREAT | O_EXCL. The owning
+  worker touches its claims every ttl/4 seconds, so a claim not touched for
+  ttl seconds belongs to a node that died and may be taken over. Taking over
+  first renames the stale claim aside, which only one node can do, and then
+  creates a fresh one. A node that renamed aside a claim that turns out to be
+  fresh, because another node took it over in between, puts it back. Claims
+  are removed once their files are in the manifest or have failed. A
+  replacement for a worker the stall watchdog killed takes that worker's
+  claims over straight away. This works on NFS, where O_EXCL create and
+  rename are atomic on the server, but it compares server mtimes with local
+  time, so ttl must be well above the clock skew between hosts.
+
+In either mode each node appends to its own manifest journal
+(.completed_files.<node>.txt), because concurrent appends to one file from
+several NFS clients can interleave. The completion checks read every
+journal in the project (completion_index.SharedCompletionIndex).
+
+Each node also registers under .coordination/nodes while it runs, so the
+last node to finish knows it should merge the detection parts.
+"""
+import os
+import threading
+import time
+from hashlib import blake2b
+from pathlib import Path
+
+from completion_index import path_digest
+
+COORDINATION_DIRNAME = ".coordination"
+CLAIMS_DIRNAME = "claims"
+NODES_DIRNAME = "nodes"
+
+
+def shard_of(relative_path, num_shards):
+    """Shard of a file, from its path relative to the source root."""
+    digest = blake2b(
+        str(relative_path).encode("utf-8", "surrogateescape"), digest_size=8
+    )
+    return int.from_bytes(digest.digest(), "little") % num_shards
+
+
+class _Heartbeat:
+    """Calls `beat` every `interval` seconds on a daemon thread until stop()."""
+
+    def __init__(self, beat, interval, name):
+        self._beat = beat
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            self._beat()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def _touch(path):
+    """Refresh a marker's mtime; False if it has gone."""
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _is_stale(path, ttl):
+    """Whether a marker is older than ttl; None if it has gone."""
+    try:
+        return time.time() - path.stat().st_mtime >= ttl
+    except FileNotFoundError:
+        return None
+
+
+class ClaimBoard:
+    """
+    One worker's claims. claim() and release() are called from the worker's
+    GPU thread while a heartbeat thread keeps the held claims fresh.
+    """
+
+    def __init__(self, project_path, owner, ttl):
+        self.dir = Path(project_path) / COORDINATION_DIRNAME / CLAIMS_DIRNAME
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.owner = owner
+        self.ttl = ttl
+        self._held = {}
+        self._lock = threading.Lock()
+        self._heartbeat = _Heartbeat(self._refresh, ttl / 4, f"claims-{owner}")
+
+    def _claim_path(self, file_path):
+        return self.dir / f"{path_digest(file_path):016x}"
+
+    def _try_claim(self, claim):
+        # Two attempts: the second follows a release or takeover.
+        for _ in range(2):
+            try:
+                fd = os.open(claim, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                takeover = self._may_take_over(claim)
+                if takeover is None:
+                    continue
+                if not takeover:
+                    return False
+                aside = claim.with_name(f"{claim.name}.stale-{self.owner}-{os.getpid()}")
+                try:
+                    os.rename(claim, aside)
+                except FileNotFoundError:
+                    # Another node took it over first.
+                    return False
+                if not self._may_take_over(aside):
+                    # Another node took the stale claim over between our
+                    # check and the rename, so what we moved is its fresh
+                    # claim. Put it back unless a third claim already exists.
+                    try:
+                        os.link(aside, claim)
+                    except FileExistsError:
+                        pass
+                    aside.unlink(missing_ok=True)
+                    return False
+                aside.unlink(missing_ok=True)
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(f"{self.owner} {os.getpid()}\n")
+            return True
+        return False
+
+    def _may_take_over(self, claim):
+        """
+        Whether an existing claim is stale or left by a predecessor; None if
+        it has gone.
+        """
+        stale = _is_stale(claim, self.ttl)
+        if stale is None:
+            return None
+        return stale or self._left_by_predecessor(claim)
+
+    def _left_by_predecessor(self, claim):
+        """
+        Whether a claim was left by an earlier process of this same worker
+        slot, one the stall watchdog killed. Its replacement takes such
+        claims over without waiting out the ttl.
+        """
+        try:
+            owner, pid = claim.read_text().split()
+        except (OSError, ValueError):
+            return False
+        return owner == self.owner and int(pid) != os.getpid()
+
+    def claim(self, files):
+        """Claim what it can of `files`; returns the files won, in order."""
+        won = []
+        for file_path in files:
+            claim = self._claim_path(file_path)
+            if self._try_claim(claim):
+                won.append(file_path)
+                with self._lock:
+                    self._held[str(file_path)] = claim
+        return won
+
+    def release(self, files):
+        with self._lock:
+            claims = [self._held.pop(str(f), None) for f in files]
+        for claim in claims:
+            if claim is not None:
+                claim.unlink(missing_ok=True)
+
+    def _refresh(self):
+        with self._lock:
+            claims = list(self._held.values())
+        for claim in claims:
+            _touch(claim)
+
+    def close(self):
+        self._heartbeat.stop()
+        with self._lock:
+            files = list(self._held)
+        self.release(files)
+
+
+class NodeRoster:
+    """
+    Registers this node as running for as long as it works on the project,
+    so that leave() can tell whether it is the last one.
+    """
+
+    def __init__(self, project_path, node, ttl):
+        self.dir = Path(project_path) / COORDINATION_DIRNAME / NODES_DIRNAME
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.marker = self.dir / node
+        self.ttl = ttl
+        self.marker.write_text(f"{os.getpid()}\n")
+        self._heartbeat = _Heartbeat(
+            lambda: _touch(self.marker), ttl / 4, f"node-{node}"
+        )
+
+    def leave(self):
+        """Deregister; returns the names of other nodes still running."""
+        self._heartbeat.stop()
+        self.marker.unlink(missing_ok=True)
+        running = []
+        for marker in self.dir.iterdir():
+            # A node that died without leaving stops counting after ttl.
+            if _is_stale(marker, self.ttl) is False:
+                running.append(marker.name)
+        return running
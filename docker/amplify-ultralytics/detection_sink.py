@@ -0,0 +1,286 @@
+"""
+Columnar detection output for yolo_inference.py.
+
+Ultralytics' save_txt writes one small text file per image or video frame,
+and rescans that directory after every predict call. With --save-detections,
+each worker instead appends the boxes from the Results it already iterates
+to its own Arrow IPC stream under <project>/detections/, one record batch per
+predict batch. A stream stays readable up to its last complete record batch,
+so a killed worker loses nothing it had already flushed.
+
+merge_detection_parts() then combines every part into a single
+<project>/detections.parquet. Parts from earlier, resumed runs are kept and
+merged too; when a file appears in several parts (it was re-run after a crash
+between the flush and the manifest append), only the newest part's rows for
+it are kept. Each flushed batch also carries one marker row per file it
+covers, with only the source set, so that a re-run which found nothing still
+replaces the file's older rows. Markers are dropped from the merged output.
+
+With a ResultCache attached, flush() also stores each committed file's rows
+in the cache, and add_cached() brings cached rows back for files that were
+never predicted.
+
+With a frame_gate.FrameLedger, frame numbers come from the ledger rather than
+from counting results, and gated frames either get no rows or, with
+carry_gated, a copy of the previous inferred frame's rows.
+"""
+import os
+import socket
+import time
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+PARTS_DIRNAME = "detections"
+MERGED_FILENAME = "detections.parquet"
+PART_SUFFIX = ".arrows"
+
+# Row group size of the merged Parquet file.
+MERGED_ROW_GROUP_ROWS = 256 * 1024
+
+SCHEMA = pa.schema(
+    [
+        ("source", pa.string()),
+        ("frame", pa.int32()),
+        ("class_id", pa.int32()),
+        ("class_name", pa.string()),
+        ("confidence", pa.float32()),
+        ("x1", pa.float32()),
+        ("y1", pa.float32()),
+        ("x2", pa.float32()),
+        ("y2", pa.float32()),
+        ("image_width", pa.int32()),
+        ("image_height", pa.int32()),
+    ]
+)
+
+
+def _empty_columns():
+    return {name: [] for name in SCHEMA.names}
+
+
+def _is_marker(table):
+    """Marker rows record that a source was predicted; they have no class."""
+    return pc.is_null(table["class_id"])
+
+
+class DetectionSink:
+    """
+    Per-worker appender of detection rows.
+
+    Rows from one predict call are held until commit(), so a call that fails
+    half-way (and is retried) leaves nothing behind after rollback().
+    flush() writes everything committed so far as one record batch; call it
+    before marking the batch's files complete in the manifest.
+    """
+
+    def __init__(
+        self,
+        project_path,
+        worker_name,
+        video,
+        vid_stride,
+        cache=None,
+        ledger=None,
+        carry_gated=False,
+    ):
+        parts_dir = Path(project_path) / PARTS_DIRNAME
+        parts_dir.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%dT%H%M%S")
+        self.path = parts_dir / f"{worker_name}-{stamp}-{os.getpid()}{PART_SUFFIX}"
+        self.video = video
+        self.vid_stride = max(1, vid_stride)
+        self.rows_written = 0
+        self.cache = cache
+        self.ledger = ledger
+        self.carry_gated = carry_gated
+        self._writer = None
+        self._committed = _empty_columns()
+        # Files predicted in committed calls, with or without boxes.
+        self._committed_sources = set()
+        # Files whose committed rows came from the cache.
+        self._cached_sources = set()
+        self._call = None
+        self._call_sources = set()
+        self._source_to_file = {}
+        self._frames_seen = {}
+        # Boxes of each video's last inferred frame, for carry_gated.
+        self._last_boxes = {}
+
+    def begin(self, source_to_file):
+        """Start collecting rows for one predict call."""
+        self._call = _empty_columns()
+        self._call_sources = set()
+        self._source_to_file = source_to_file
+        self._frames_seen = {}
+        self._last_boxes = {}
+        if self.ledger is not None:
+            self.ledger.clear()
+
+    def _frame_number(self, kept):
+        # Ultralytics grabs vid_stride frames before each one it keeps, so
+        # the n-th kept frame (from 1) is source frame n * stride - 1.
+        return kept * self.vid_stride - 1 if self.video else 0
+
+    def add(self, result):
+        """Record the boxes of one Results object from the current call."""
+        source = str(self._source_to_file.get(result.path, result.path))
+        if self.ledger is not None:
+            gated, kept = self.ledger.next_inferred(result.path)
+            for gated_kept in gated:
+                self._add_gated(source, gated_kept)
+        else:
+            kept = self._frames_seen.get(result.path, 0) + 1
+            self._frames_seen[result.path] = kept
+        self._call_sources.add(source)
+
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            self._last_boxes[source] = None
+            return
+
+        xyxy = boxes.xyxy.cpu().numpy()
+        class_ids = boxes.cls.cpu().numpy().astype(int).tolist()
+        count = len(class_ids)
+        height, width = result.orig_shape[:2]
+        names = result.names
+
+        found = {
+            "class_id": class_ids,
+            "class_name": [names.get(c, str(c)) for c in class_ids],
+            "confidence": boxes.conf.cpu().numpy().tolist(),
+            "x1": xyxy[:, 0].tolist(),
+            "y1": xyxy[:, 1].tolist(),
+            "x2": xyxy[:, 2].tolist(),
+            "y2": xyxy[:, 3].tolist(),
+            "image_width": [width] * count,
+            "image_height": [height] * count,
+        }
+        self._last_boxes[source] = found
+        self._extend(source, self._frame_number(kept), found)
+
+    def _add_gated(self, source, kept):
+        """Rows for a frame the gate kept from inference."""
+        found = self._last_boxes.get(source)
+        if self.carry_gated and found:
+            self._extend(source, self._frame_number(kept), found)
+
+    def _extend(self, source, frame, found):
+        count = len(found["class_id"])
+        columns = self._call
+        columns["source"].extend([source] * count)
+        columns["frame"].extend([frame] * count)
+        for name, values in found.items():
+            columns[name].extend(values)
+
+    def commit(self):
+        if self.ledger is not None:
+            # Gated frames after a video's last inferred frame.
+            for path, gated in self.ledger.drain().items():
+                source = str(self._source_to_file.get(path, path))
+                for gated_kept in gated:
+                    self._add_gated(source, gated_kept)
+        for name, values in self._call.items():
+            self._committed[name].extend(values)
+        self._committed_sources |= self._call_sources
+        self._call = None
+
+    def rollback(self):
+        self._call = None
+        if self.ledger is not None:
+            self.ledger.clear()
+
+    def add_cached(self, file_path, table):
+        """Commit rows cached for identical content under `file_path`'s name."""
+        source = pa.array([str(file_path)] * table.num_rows, pa.string())
+        table = table.set_column(SCHEMA.get_field_index("source"), "source", source)
+        for name in SCHEMA.names:
+            self._committed[name].extend(table[name].to_pylist())
+        self._cached_sources.add(str(file_path))
+
+    def flush(self):
+        sources, self._committed_sources = self._committed_sources, set()
+        cached, self._cached_sources = self._cached_sources, set()
+        columns, self._committed = self._committed, _empty_columns()
+        marked = sorted(sources | cached)
+        if not marked:
+            return
+        rows = len(columns["source"])
+        # Markers go in the same record batch as the rows, so a torn tail
+        # never leaves one without the other.
+        for name, values in columns.items():
+            values.extend(marked if name == "source" else [None] * len(marked))
+        batch = pa.RecordBatch.from_pydict(columns, schema=SCHEMA)
+        if self._writer is None:
+            self._writer = pa.ipc.new_stream(str(self.path), SCHEMA)
+        self._writer.write_batch(batch)
+        self.rows_written += rows
+        if self.cache is not None and sources:
+            self.cache.store(pa.Table.from_batches([batch.slice(0, rows)]), sources)
+
+    def close(self):
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def read_part(path):
+    """
+    Read every complete record batch of a part, tolerating a torn tail.
+    The table includes the part's marker rows.
+    """
+    batches = []
+    try:
+        with pa.ipc.open_stream(str(path)) as reader:
+            for batch in reader:
+                batches.append(batch)
+    except (pa.ArrowInvalid, OSError):
+        pass
+    return pa.Table.from_batches(batches, schema=SCHEMA)
+
+
+def merge_detection_parts(project_path):
+    """
+    Merge every part under <project>/detections/ into detections.parquet.
+
+    Returns:
+        tuple: (parts merged, rows written), or None if there were no parts.
+    """
+    project_path = Path(project_path)
+    parts = sorted(
+        (project_path / PARTS_DIRNAME).glob(f"*{PART_SUFFIX}"),
+        key=lambda part: part.stat().st_mtime,
+        reverse=True,
+    )
+    if not parts:
+        return None
+
+    merged = project_path / MERGED_FILENAME
+    # Per process: nodes of a multi-node run may merge at the same time.
+    tmp_file = merged.with_name(f"{merged.name}.{socket.gethostname()}-{os.getpid()}.tmp")
+    rows = 0
+    seen_sources = pa.array([], pa.string())
+
+    with pq.ParquetWriter(str(tmp_file), SCHEMA) as writer:
+        # Newest first, so a re-processed file keeps only its latest rows.
+        for part in parts:
+            table = read_part(part)
+            if table.num_rows == 0:
+                continue
+            # Sources of markers and rows alike: parts written before
+            # markers existed only name the files that had boxes.
+            part_sources = pc.unique(table["source"])
+            table = table.filter(pc.invert(_is_marker(table)))
+            if len(seen_sources):
+                table = table.filter(
+                    pc.invert(pc.is_in(table["source"], value_set=seen_sources))
+                )
+            seen_sources = pc.unique(pa.concat_arrays([seen_sources, part_sources]))
+            writer.write_table(table, row_group_size=MERGED_ROW_GROUP_ROWS)
+            rows += table.num_rows
+
+    os.replace(tmp_file, merged)
+    return len(parts), rows
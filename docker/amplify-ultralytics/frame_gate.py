@@ -0,0 +1,83 @@
+"""
+Static-scene gating of video frames for yolo_inference.py --gate-threshold.
+
+Long deployments record mostly empty water, and every kept frame costs a
+forward pass. The decoder processes (video_decode) compare each kept frame
+with the last frame they passed on to inference: both are shrunk to a
+GATE_WIDTH-pixel-wide grayscale thumbnail, and a frame whose mean absolute
+difference is below the threshold (in 0-255 grey levels) is gated, meaning it
+is never sent to the GPU. The first frame of every video is always passed
+through. Comparing against the last passed frame, not the previous one, means
+a slow drift still passes a frame once it adds up.
+
+Gated frames still count as kept frames for numbering. The loader records
+every kept frame, gated or not, in a FrameLedger in the order it reads them.
+The detection sink replays that order, so it knows each result's frame
+number and which gated frames came before it. It then either leaves gated
+frames without rows or repeats the last inferred frame's detections for
+them (--gate-fill carry).
+"""
+from collections import defaultdict, deque
+
+import cv2
+
+GATE_WIDTH = 64
+
+
+def gate_thumbnail(frame):
+    height, width = frame.shape[:2]
+    size = (GATE_WIDTH, max(1, round(height * GATE_WIDTH / width)))
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+
+def frame_changed(thumbnail, reference, threshold):
+    """Whether a frame differs enough from the last one passed to inference."""
+    if reference is None or reference.shape != thumbnail.shape:
+        return True
+    return cv2.absdiff(thumbnail, reference).mean() >= threshold
+
+
+class FrameLedger:
+    """
+    Kept frames of the current predict call, per video, in read order. Each
+    entry is (kept, gated) where kept counts kept frames from 1.
+    """
+
+    def __init__(self):
+        self.gated = 0
+        self._entries = defaultdict(deque)
+
+    def record(self, path, kept, gated):
+        self._entries[path].append((kept, gated))
+        if gated:
+            self.gated += 1
+
+    def next_inferred(self, path):
+        """
+        Pop the entries up to the next inferred frame of `path`.
+
+        Returns:
+            tuple: (gated kept numbers before it, its kept number)
+        """
+        entries = self._entries[path]
+        gated = []
+        while entries:
+            kept, was_gated = entries.popleft()
+            if not was_gated:
+                return gated, kept
+            gated.append(kept)
+        raise LookupError(f"no inferred frame recorded for {path}")
+
+    def drain(self):
+        """Pop every remaining entry; all are gated frames after a video's last result."""
+        remaining = {
+            path: [kept for kept, _ in entries]
+            for path, entries in self._entries.items()
+            if entries
+        }
+        self._entries.clear()
+        return remaining
+
+    def clear(self):
+        self._entries.clear()
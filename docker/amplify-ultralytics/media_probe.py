@@ -0,0 +1,168 @@
+"""
+Header-only image probe for yolo_inference.py.
+
+Validation and staging only need an image's dimensions and channel count, and
+fully decoding a 12 MB TIFF to learn that is most of their cost. probe_image()
+reads just the PNG, JPEG or TIFF header instead.
+
+Channel counts follow what cv2.imread(..., IMREAD_UNCHANGED) would return,
+since that is what decides whether an image needs a 3-channel copy: palette
+images expand to 3 (or 4 with transparency), and grey+alpha PNGs to 4.
+
+A probe only proves the header is sane; truncated pixel data still surfaces
+at predict time. Anything the probe cannot parse (other formats, BigTIFF,
+unusual layouts) returns None, and callers fall back to decoding.
+"""
+import struct
+from collections import namedtuple
+
+ImageInfo = namedtuple("ImageInfo", "width height channels bit_depth")
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# PNG colour type -> channels as decoded by OpenCV with IMREAD_UNCHANGED
+_PNG_CHANNELS = {0: 1, 2: 3, 3: 3, 4: 4, 6: 4}
+
+# JPEG start-of-frame markers (baseline, progressive, lossless, arithmetic)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Markers with no length field
+_JPEG_STANDALONE = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8}
+
+_TIFF_WIDTH = 256
+_TIFF_HEIGHT = 257
+_TIFF_BITS_PER_SAMPLE = 258
+_TIFF_PHOTOMETRIC = 262
+_TIFF_SAMPLES_PER_PIXEL = 277
+_TIFF_PALETTE = 3
+# TIFF field type -> (struct code, size)
+_TIFF_TYPES = {3: ("H", 2), 4: ("I", 4)}
+
+
+def _probe_png(f):
+    f.seek(0)
+    header = f.read(33)
+    if len(header) < 33 or header[12:16] != b"IHDR":
+        return None
+    width, height, bit_depth, color_type = struct.unpack(">IIBB", header[16:26])
+    channels = _PNG_CHANNELS.get(color_type)
+    if channels is None:
+        return None
+
+    if color_type in (0, 2, 3):
+        # A tRNS chunk ahead of the image data turns transparency into alpha.
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                break
+            length, kind = struct.unpack(">I4s", chunk)
+            if kind == b"tRNS":
+                # OpenCV has no grey+alpha layout, so this is BGRA either way.
+                channels = 4
+                break
+            if kind in (b"IDAT", b"IEND"):
+                break
+            f.seek(length + 4, 1)
+
+    return ImageInfo(width, height, channels, bit_depth)
+
+
+def _probe_jpeg(f):
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        if not byte:
+            return None
+        if byte != b"\xff":
+            continue
+        marker = f.read(1)
+        while marker == b"\xff":
+            marker = f.read(1)
+        if not marker:
+            return None
+        code = marker[0]
+        if code in _JPEG_STANDALONE or code == 0x00:
+            continue
+        if code in (0xD9, 0xDA):
+            # End of image, or start of scan without a frame header first.
+            return None
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        if code in _JPEG_SOF:
+            frame = f.read(6)
+            if len(frame) < 6:
+                return None
+            bit_depth, height, width, components = struct.unpack(">BHHB", frame)
+            return ImageInfo(width, height, components, bit_depth)
+        f.seek(length - 2, 1)
+
+
+def _probe_tiff(f, byte_order):
+    f.seek(4)
+    (ifd_offset,) = struct.unpack(byte_order + "I", f.read(4))
+    f.seek(ifd_offset)
+    count_bytes = f.read(2)
+    if len(count_bytes) < 2:
+        return None
+    (entry_count,) = struct.unpack(byte_order + "H", count_bytes)
+    entries = f.read(entry_count * 12)
+    if len(entries) < entry_count * 12:
+        return None
+
+    tags = {}
+    for i in range(entry_count):
+        tag, field_type, count, value = struct.unpack_from(
+            byte_order + "HHI4s", entries, i * 12
+        )
+        if field_type not in _TIFF_TYPES:
+            continue
+        code, size = _TIFF_TYPES[field_type]
+        if count * size <= 4:
+            (first,) = struct.unpack_from(byte_order + code, value)
+        else:
+            # Value lives elsewhere in the file; only the first one is needed.
+            (offset,) = struct.unpack(byte_order + "I", value)
+            tags[tag] = (code, offset)
+            continue
+        tags[tag] = first
+
+    for tag, entry in list(tags.items()):
+        if isinstance(entry, tuple):
+            code, offset = entry
+            f.seek(offset)
+            data = f.read(struct.calcsize(code))
+            if len(data) < struct.calcsize(code):
+                return None
+            (tags[tag],) = struct.unpack(byte_order + code, data)
+
+    width = tags.get(_TIFF_WIDTH)
+    height = tags.get(_TIFF_HEIGHT)
+    if width is None or height is None:
+        return None
+    channels = tags.get(_TIFF_SAMPLES_PER_PIXEL, 1)
+    if tags.get(_TIFF_PHOTOMETRIC) == _TIFF_PALETTE:
+        channels = 3
+    return ImageInfo(width, height, channels, tags.get(_TIFF_BITS_PER_SAMPLE, 1))
+
+
+def probe_image(path):
+    """
+    Read an image's dimensions, channel count and bit depth from its header.
+
+    Returns:
+        ImageInfo, or None if the header is not one the probe understands.
+    """
+    try:
+        with open(path, "rb") as f:
+            magic = f.read(8)
+            if magic == _PNG_SIGNATURE:
+                return _probe_png(f)
+            if magic[:2] == b"\xff\xd8":
+                return _probe_jpeg(f)
+            if magic[:4] == b"II*\x00":
+                return _probe_tiff(f, "<")
+            if magic[:4] == b"MM\x00*":
+                return _probe_tiff(f, ">")
+    except (OSError, struct.error):
+        return None
+    return None
@@ -0,0 +1,181 @@
+"""
+Structured progress for yolo_inference.py.
+
+Workers send small dict events over a multiprocessing queue instead of
+printing a line per batch. The parent's ProgressMonitor folds them into one
+run-wide view and prints it every few seconds as a single stdout line:
+
+    PROGRESS {"files_done": 1200, "files_total": 5000, "eta_s": 310.5, ...}
+
+Everything else the script prints goes to stderr, so consumers (the Prefect
+task) can pick these lines out without parsing free-form text.
+"""
+import json
+import queue
+import sys
+import threading
+import time
+from collections import deque
+
+PROGRESS_PREFIX = "PROGRESS "
+
+# Throughput (and so the ETA) is measured over this trailing window, so it
+# follows the current rate rather than the whole run's average.
+RATE_WINDOW_S = 120
+
+
+class ProgressReporter:
+    """Worker side: sends events for one worker. A None queue sends nothing."""
+
+    def __init__(self, progress_queue, worker):
+        self.queue = progress_queue
+        self.worker = worker
+
+    def send(self, kind, **fields):
+        if self.queue is None:
+            return
+        self.queue.put({"kind": kind, "worker": self.worker, **fields})
+
+
+class ProgressMonitor:
+    """
+    Parent side: aggregates worker events on a background thread and prints
+    a PROGRESS line at most every `interval` seconds while anything changes,
+    plus a final one from stop().
+
+    The total grows as batches are queued (expect) and is final once
+    finalize_total() is called: straight away in batch mode, only after
+    discovery finishes in streaming mode. The ETA is left out until then.
+
+    `on_event`, if given, is also called with every event, on the monitor's
+    thread.
+    """
+
+    def __init__(self, progress_queue, interval, on_event=None):
+        self.queue = progress_queue
+        self.interval = interval
+        self.on_event = on_event
+        self.files_total = 0
+        self.frames_total = 0
+        self.total_final = False
+        self.files_done = 0
+        self.files_skipped = 0
+        self.frames_done = 0
+        self.errors = 0
+        self.batches_done = 0
+        self.workers_ready = set()
+        self.workers_finished = set()
+        self._lock = threading.Lock()
+        # (time, settled files, frames) samples; the oldest is the baseline
+        # the current rate is measured from.
+        self._history = deque()
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="progress", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def expect(self, files, frames):
+        with self._lock:
+            self.files_total += files
+            self.frames_total += frames
+
+    def finalize_total(self):
+        with self._lock:
+            self.total_final = True
+
+    def stop(self):
+        """Drain the remaining events and print the final line."""
+        self.queue.put(None)
+        self._thread.join()
+        self._emit()
+
+    def _run(self):
+        last_emit = 0.0
+        dirty = False
+        while True:
+            try:
+                event = self.queue.get(timeout=1)
+            except queue.Empty:
+                event = False
+            if event is None:
+                return
+            if event:
+                self._apply(event)
+                if self.on_event is not None:
+                    self.on_event(event)
+                dirty = True
+            now = time.monotonic()
+            if dirty and now - last_emit >= self.interval:
+                self._emit()
+                last_emit = now
+                dirty = False
+
+    def _apply(self, event):
+        kind = event["kind"]
+        now = time.monotonic()
+        with self._lock:
+            if kind == "ready":
+                # Model loading is not throughput; start measuring from the
+                # first worker that is ready to predict.
+                if not self._history:
+                    self._history.append((now, self._settled(), self.frames_done))
+                self.workers_ready.add(event["worker"])
+            elif kind == "finished":
+                self.workers_finished.add(event["worker"])
+            elif kind in ("batch", "skipped"):
+                if kind == "batch":
+                    self.batches_done += 1
+                    self.files_done += event.get("files", 0)
+                    self.frames_done += event.get("frames", 0)
+                    self.errors += event.get("errors", 0)
+                else:
+                    self.files_skipped += event["files"]
+                self._history.append((now, self._settled(), self.frames_done))
+                # Keep one sample from before the window as its baseline.
+                while len(self._history) > 1 and now - self._history[1][0] > RATE_WINDOW_S:
+                    self._history.popleft()
+
+    def _settled(self):
+        """Files no longer pending: done, skipped as complete, or failed."""
+        return self.files_done + self.files_skipped + self.errors
+
+    def snapshot(self):
+        with self._lock:
+            now = time.monotonic()
+            settled = self._settled()
+            files_rate = frames_rate = None
+            if self._history:
+                then, settled_then, frames_then = self._history[0]
+                if now > then:
+                    files_rate = (settled - settled_then) / (now - then)
+                    frames_rate = (self.frames_done - frames_then) / (now - then)
+
+            eta = None
+            percent = None
+            if self.files_total:
+                percent = round(min(100.0, settled / self.files_total * 100), 1)
+            if self.total_final and files_rate:
+                eta = round(max(0, self.files_total - settled) / files_rate, 1)
+
+            return {
+                "elapsed_s": round(now - self._started, 1),
+                "files_done": self.files_done,
+                "files_skipped": self.files_skipped,
+                "errors": self.errors,
+                "files_total": self.files_total,
+                "total_final": self.total_final,
+                "percent": percent,
+                "frames_done": self.frames_done,
+                "frames_total": self.frames_total,
+                "batches_done": self.batches_done,
+                "files_per_s": round(files_rate, 2) if files_rate is not None else None,
+                "frames_per_s": round(frames_rate, 2) if frames_rate is not None else None,
+                "eta_s": eta,
+                "workers_ready": len(self.workers_ready),
+                "workers_finished": len(self.workers_finished),
+            }
+
+    def _emit(self):
+        print(PROGRESS_PREFIX + json.dumps(self.snapshot()), file=sys.stdout, flush=True)
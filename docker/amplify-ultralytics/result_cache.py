@@ -0,0 +1,284 @@
+"""
+Content-addressed cache of detection results for yolo_inference.py.
+
+.completed_files.txt is keyed by absolute path, so a data directory that is
+copied, renamed or re-run elsewhere is inferred from scratch. This cache is
+keyed by what actually determines the output instead:
+
+- the file's content, hashed with blake2b. Files up to FULL_HASH_BYTES are
+  hashed whole; larger ones (videos) by their size plus SAMPLE_BLOCKS blocks
+  spread evenly from the first byte to the last. That reads ~1 MB regardless
+  of file size. Two different files collide only if they have the same size
+  and agree on every sampled block, which re-encoded or trimmed media does
+  not.
+- the weights file, hashed whole once per worker.
+- the predict() settings that change which boxes come out (KEY_KWARGS).
+
+Each entry is one file's detection rows as an Arrow IPC stream, in
+detection_sink.SCHEMA. The cache lives in a single SQLite database that every
+worker opens with WAL journaling, so several processes, and several runs, can
+share it. Total size is capped; the least recently used entries are evicted
+first. Each entry is charged its key and rows plus ENTRY_OVERHEAD_BYTES, so
+the many empty results count against the cap too, and the total is kept in
+the database as a running sum rather than recomputed on every store.
+"""
+import json
+import sqlite3
+import threading
+import time
+from hashlib import blake2b
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from detection_sink import SCHEMA
+
+CACHE_FILENAME = "yolo_result_cache.sqlite"
+
+FULL_HASH_BYTES = 8 * 1024 * 1024
+SAMPLE_BLOCKS = 16
+SAMPLE_BLOCK_BYTES = 64 * 1024
+
+# Charged per entry on top of its key and rows: SQLite's cell, page and
+# last_used index overhead, roughly.
+ENTRY_OVERHEAD_BYTES = 128
+
+# predict() arguments that change the detections. Output-only settings
+# (project, name, save_*, show_*) and throughput knobs (batch) do not.
+KEY_KWARGS = (
+    "conf",
+    "iou",
+    "imgsz",
+    "agnostic_nms",
+    "max_det",
+    "vid_stride",
+    "classes",
+    "half",
+    "augment",
+    # Frame gating (--gate-threshold, --gate-fill) drops or repeats rows.
+    "gate_threshold",
+    "gate_fill",
+    # Tiled inference (--tile-size, --tile-overlap, --tile-merge-iou).
+    "tile_size",
+    "tile_overlap",
+    "tile_merge_iou",
+)
+
+
+def content_digest(file_path):
+    """Hash a file's content, sampling blocks of files over FULL_HASH_BYTES."""
+    size = Path(file_path).stat().st_size
+    digest = blake2b(size.to_bytes(8, "little"), digest_size=16)
+    with open(file_path, "rb") as f:
+        if size <= FULL_HASH_BYTES:
+            digest.update(f.read())
+        else:
+            span = size - SAMPLE_BLOCK_BYTES
+            for i in range(SAMPLE_BLOCKS):
+                f.seek(span * i // (SAMPLE_BLOCKS - 1))
+                digest.update(f.read(SAMPLE_BLOCK_BYTES))
+    return digest.hexdigest()
+
+
+def weights_digest(weights_path):
+    digest = blake2b(digest_size=16)
+    with open(weights_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _serialize(table):
+    # Most files have no detections; an empty blob spares each the schema.
+    if table.num_rows == 0:
+        return b""
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, SCHEMA) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _entry_bytes(key, blob):
+    return ENTRY_OVERHEAD_BYTES + len(key) + len(blob)
+
+
+def _deserialize(blob):
+    if not blob:
+        return SCHEMA.empty_table()
+    with pa.ipc.open_stream(pa.py_buffer(blob)) as reader:
+        return reader.read_all()
+
+
+class ResultCache:
+    """
+    Per-worker handle on the shared cache.
+
+    lookup() runs on the stager thread and remembers the keys of the files it
+    missed; store() runs on the GPU thread once those files' detections are
+    flushed, so keys are only hashed once. Both share one connection behind
+    a lock, like ValidationIndex.
+    """
+
+    def __init__(self, cache_dir, max_bytes, weights_path, predict_kwargs):
+        cache_dir = Path(cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        settings = {name: predict_kwargs.get(name) for name in KEY_KWARGS}
+        self._salt = (
+            weights_digest(weights_path) + json.dumps(settings, sort_keys=True)
+        ).encode()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(cache_dir / CACHE_FILENAME), timeout=60, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY,"
+            " rows BLOB NOT NULL,"
+            " nbytes INTEGER NOT NULL,"
+            " last_used REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)"
+        )
+        # One row: the sum of every entry's nbytes.
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS usage ("
+            " id INTEGER PRIMARY KEY CHECK (id = 0),"
+            " nbytes INTEGER NOT NULL"
+            ")"
+        )
+        self._conn.commit()
+        self._conn.execute("BEGIN IMMEDIATE")
+        if self._conn.execute("SELECT 1 FROM usage").fetchone() is None:
+            # A new cache, or one from before the running total, whose
+            # empty results were stored as costing nothing.
+            self._conn.execute(
+                "UPDATE results SET nbytes = ? + length(key) + length(rows)",
+                (ENTRY_OVERHEAD_BYTES,),
+            )
+            self._conn.execute(
+                "INSERT INTO usage (id, nbytes) "
+                "SELECT 0, COALESCE(SUM(nbytes), 0) FROM results"
+            )
+        self._conn.commit()
+
+    def key(self, file_path):
+        digest = blake2b(self._salt, digest_size=16)
+        digest.update(content_digest(file_path).encode())
+        return digest.hexdigest()
+
+    def lookup(self, files):
+        """
+        Return {file: cached detection table} for the files that hit. Files
+        that cannot be read are treated as misses and left to predict().
+        """
+        keys = {}
+        for file_path in files:
+            try:
+                keys[file_path] = self.key(file_path)
+            except OSError:
+                continue
+        if not keys:
+            return {}
+
+        with self._lock:
+            found = {}
+            for file_path, key in keys.items():
+                row = self._conn.execute(
+                    "SELECT rows FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    self._pending[str(file_path)] = key
+                else:
+                    found[file_path] = row[0]
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE results SET last_used = ? WHERE key = ?",
+                    [(now, keys[file_path]) for file_path in found],
+                )
+                self._conn.commit()
+        return {file_path: _deserialize(blob) for file_path, blob in found.items()}
+
+    def discard(self, files):
+        """
+        Forget the keys lookup() held for `files` that were never stored, such
+        as files whose predict failed. Call once each file's batch is done.
+        """
+        with self._lock:
+            for file_path in files:
+                self._pending.pop(str(file_path), None)
+
+    def store(self, table, sources):
+        """
+        Cache each of `sources`' rows from `table`, a flushed batch of
+        detections. A source with no rows is cached as an empty result.
+        """
+        with self._lock:
+            keyed = [
+                (source, self._pending.pop(source))
+                for source in sources
+                if source in self._pending
+            ]
+        if not keyed:
+            return
+
+        now = time.time()
+        entries = []
+        for source, key in keyed:
+            rows = table.filter(pc.equal(table["source"], source))
+            blob = _serialize(rows)
+            entries.append((key, blob, _entry_bytes(key, blob), now))
+
+        with self._lock:
+            # Taken before reading the replaced entries' sizes, so that no
+            # other worker's store lands in between.
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                added = 0
+                for key, _, nbytes, _ in entries:
+                    row = self._conn.execute(
+                        "SELECT nbytes FROM results WHERE key = ?", (key,)
+                    ).fetchone()
+                    added += nbytes - (row[0] if row else 0)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO results (key, rows, nbytes, last_used) "
+                    "VALUES (?, ?, ?, ?)",
+                    entries,
+                )
+                self._evict(self._add_usage(added))
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def _add_usage(self, nbytes):
+        """Add to the running total; returns the new total."""
+        self._conn.execute("UPDATE usage SET nbytes = nbytes + ?", (nbytes,))
+        (total,) = self._conn.execute("SELECT nbytes FROM usage").fetchone()
+        return total
+
+    def _evict(self, total):
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        doomed = []
+        freed = 0
+        for key, nbytes in self._conn.execute(
+            "SELECT key, nbytes FROM results ORDER BY last_used"
+        ):
+            doomed.append((key,))
+            freed += nbytes
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM results WHERE key = ?", doomed)
+        self._add_usage(-freed)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,151 @@
+"""
+Stage-level timing for yolo_inference.py.
+
+Each process (the parent as "main", every worker under its output name) keeps
+one StageMetrics: wall time and call counts per pipeline stage, plus running
+counters such as files, frames and bytes staged. write() snapshots them to
+two files under <project>/metrics/:
+
+- <name>.jsonl gets one JSON object appended per snapshot, so a run's
+  progress can be replayed afterwards. Lines carry a Unix "time" and the
+  writer's pid, so snapshots from resumed runs can be told apart.
+- <name>.prom is rewritten atomically in the Prometheus textfile format, for
+  node_exporter's textfile collector or anything else that scrapes it.
+
+Stages overlap by design (the stager thread stages batch N+1 during batch N's
+predict call), so their seconds add up to more than the elapsed time. Compare
+predict against staging_wait and queue_wait to see what the GPU waited on.
+"""
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+METRICS_DIRNAME = "metrics"
+
+_PROM_PREFIX = "yolo_inference"
+
+
+def _prom_labels(**labels):
+    inner = ",".join(
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in labels.items()
+    )
+    return "{" + inner + "}"
+
+
+class StageMetrics:
+    """
+    Per-process stage timers and counters. Safe to update from several
+    threads; write() from one.
+    """
+
+    def __init__(self, project_path, name):
+        self.name = name
+        metrics_dir = Path(project_path) / METRICS_DIRNAME
+        metrics_dir.mkdir(parents=True, exist_ok=True)
+        self.jsonl_path = metrics_dir / f"{name}.jsonl"
+        self.prom_path = metrics_dir / f"{name}.prom"
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._seconds = defaultdict(float)
+        self._calls = defaultdict(int)
+        self._counters = defaultdict(int)
+
+    @contextmanager
+    def time(self, stage):
+        """Time the enclosed block as one call of `stage`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def add_time(self, stage, seconds):
+        with self._lock:
+            self._seconds[stage] += seconds
+            self._calls[stage] += 1
+
+    def count(self, counter, value=1):
+        with self._lock:
+            self._counters[counter] += value
+
+    def value(self, counter):
+        with self._lock:
+            return self._counters.get(counter, 0)
+
+    def snapshot(self):
+        elapsed = time.perf_counter() - self._start
+        with self._lock:
+            stages = {
+                stage: {
+                    "seconds": round(self._seconds[stage], 6),
+                    "calls": self._calls[stage],
+                }
+                for stage in sorted(self._seconds)
+            }
+            counters = dict(sorted(self._counters.items()))
+        rates = {}
+        if elapsed > 0:
+            for counter in ("files", "frames", "bytes_staged"):
+                if counter in counters:
+                    rates[f"{counter}_per_s"] = round(counters[counter] / elapsed, 3)
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "stages": stages,
+            "counters": counters,
+            "rates": rates,
+        }
+
+    def write(self, event, **fields):
+        """Append a snapshot to the JSON-lines file and refresh the textfile."""
+        snapshot = self.snapshot()
+        record = {
+            "time": time.time(),
+            "name": self.name,
+            "pid": os.getpid(),
+            "event": event,
+            **fields,
+            **snapshot,
+        }
+        with open(self.jsonl_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        self._write_prom(snapshot)
+
+    def _write_prom(self, snapshot):
+        name = self.name
+        lines = [
+            f"# HELP {_PROM_PREFIX}_stage_seconds_total Wall time spent in each stage.",
+            f"# TYPE {_PROM_PREFIX}_stage_seconds_total counter",
+        ]
+        for stage, values in snapshot["stages"].items():
+            labels = _prom_labels(worker=name, stage=stage)
+            lines.append(f"{_PROM_PREFIX}_stage_seconds_total{labels} {values['seconds']}")
+        lines += [
+            f"# HELP {_PROM_PREFIX}_stage_calls_total Times each stage ran.",
+            f"# TYPE {_PROM_PREFIX}_stage_calls_total counter",
+        ]
+        for stage, values in snapshot["stages"].items():
+            labels = _prom_labels(worker=name, stage=stage)
+            lines.append(f"{_PROM_PREFIX}_stage_calls_total{labels} {values['calls']}")
+        for counter, value in snapshot["counters"].items():
+            metric = f"{_PROM_PREFIX}_{counter}_total"
+            lines += [
+                f"# TYPE {metric} counter",
+                f"{metric}{_prom_labels(worker=name)} {value}",
+            ]
+        lines += [
+            f"# TYPE {_PROM_PREFIX}_elapsed_seconds gauge",
+            f"{_PROM_PREFIX}_elapsed_seconds{_prom_labels(worker=name)} {snapshot['elapsed_s']}",
+            f"# TYPE {_PROM_PREFIX}_start_time_seconds gauge",
+            f"{_PROM_PREFIX}_start_time_seconds{_prom_labels(worker=name)} {self.started}",
+        ]
+
+        # Scrapers must never see a half-written file.
+        tmp_file = self.prom_path.with_name(self.prom_path.name + ".tmp")
+        tmp_file.write_text("\n".join(lines) + "\n")
+        os.replace(tmp_file, self.prom_path)
@@ -0,0 +1,20 @@
+"""
+Runs yolo_inference.main() with the model swapped for StubModel. Spawned
+workers import this file again as __mp_main__, so they get the stub too.
+
+Usage:
+    python3 tests/run_stub.py <yolo_inference.py arguments>
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import yolo_inference  # noqa: E402
+from stub_model import StubModel  # noqa: E402
+
+yolo_inference.load_model = lambda model_path: StubModel.from_env()
+
+if __name__ == "__main__":
+    sys.exit(yolo_inference.main())
@@ -0,0 +1,101 @@
+"""
+A stand-in for the YOLO model, for running yolo_inference.py in tests
+without ultralytics or a GPU. It reads each image it is given and yields
+one empty result per image.
+
+run_stub.py configures it from the environment, so that spawned workers
+build the same stub:
+
+- STUB_FAIL: comma-separated file names whose predict call raises.
+- STUB_HANG: a file name whose predict call hangs, once. The first process
+  to reach it creates the STUB_HANG_MARKER file and sleeps forever.
+"""
+import os
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+
+class StubResult:
+    def __init__(self, path, orig_shape):
+        self.path = path
+        self.orig_shape = orig_shape
+        self.boxes = None
+        self.names = {}
+
+
+class StubModel:
+    def __init__(self, fail=(), hang=None, hang_marker=None):
+        self.fail = set(fail)
+        self.hang = hang
+        self.hang_marker = hang_marker
+        # The file names of every predict call, in order.
+        self.calls = []
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            fail=filter(None, os.environ.get("STUB_FAIL", "").split(",")),
+            hang=os.environ.get("STUB_HANG"),
+            hang_marker=os.environ.get("STUB_HANG_MARKER"),
+        )
+
+    def predict(self, source, stream=True, **kwargs):
+        source = str(source)
+        if source.endswith(".txt"):
+            paths = Path(source).read_text().splitlines()
+        else:
+            paths = [source]
+        names = [Path(path).name for path in paths]
+        self.calls.append(names)
+        return self._results(paths, names)
+
+    def _results(self, paths, names):
+        failing = self.fail.intersection(names)
+        if failing:
+            raise RuntimeError(f"stub failure on {sorted(failing)}")
+        for path, name in zip(paths, names):
+            if name == self.hang and not os.path.exists(self.hang_marker):
+                Path(self.hang_marker).write_text(str(os.getpid()))
+                while True:
+                    time.sleep(60)
+            img = cv2.imread(path)
+            if img is None:
+                raise RuntimeError(f"Image Read Error {path}")
+            yield StubResult(path, img.shape[:2])
+
+
+def write_images(root, count, size=32):
+    """Write `count` small RGB PNGs under root; returns their paths in order."""
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        path = root / f"img{i:03d}.png"
+        cv2.imwrite(str(path), rng.integers(0, 255, (size, size, 3), np.uint8))
+        paths.append(path)
+    return paths
+
+
+def build_argv(source_root, project, *options):
+    """
+    yolo_inference.py arguments for a run over PNGs with the stub model. The
+    device is GPU 0 only in name: the stub ignores it, and a "cpu" slot would
+    import torch to size its thread pool.
+    """
+    positional = [
+        "0", "True", "0.5", "0.1", "64", "4", "False", "300", "1", "False",
+        "False", "False", "None", "False", "None", "test", "False", "False",
+        "False", "False", "False", "False", "False", "True", "True", "True",
+    ]  # fmt: skip
+    return positional + [
+        "--source-root", str(source_root),
+        "--project", str(project),
+        "--ext", ".png",
+        "--model", "stub",
+        "--skip-validation",
+        *options,
+    ]  # fmt: skip
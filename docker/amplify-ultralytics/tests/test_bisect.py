@@ -0,0 +1,77 @@
+import queue
+import threading
+from pathlib import Path
+
+import pytest
+
+import yolo_inference as yi
+from stub_model import StubModel, build_argv, write_images
+
+
+def run_worker(tmp_path, monkeypatch, count, files_per_call, fail):
+    """Run one worker in-process over `count` images; returns (model, completed names)."""
+    write_images(tmp_path / "src", count)
+    project = tmp_path / "project"
+    project.mkdir()
+    args = yi.parse_args(
+        build_argv(tmp_path / "src", project, "--files-per-call", str(files_per_call))
+    )
+    model = StubModel(fail=fail)
+    monkeypatch.setattr(yi, "load_model", lambda model_path: model)
+
+    files = yi.discover_files(args)
+    batches = [files[i : i + files_per_call] for i in range(0, count, files_per_call)]
+    work_queue = queue.Queue()
+    yi.enqueue_batches(work_queue, batches, 1)
+    manifest_file = project / ".completed_files.txt"
+    slot = yi.WorkerSlot("0", "gpu0", "GPU 0", None)
+
+    with pytest.raises(RuntimeError, match=f"had {len(fail)} per-file errors"):
+        yi.process_files_on_device(
+            slot,
+            work_queue,
+            len(batches),
+            manifest_file,
+            threading.Lock(),
+            args,
+            None,
+            None,
+        )
+    completed = [Path(line).name for line in manifest_file.read_text().splitlines()]
+    return model, completed
+
+
+def test_bisection_isolates_failing_files(tmp_path, monkeypatch):
+    model, completed = run_worker(
+        tmp_path, monkeypatch, 8, 8, {"img002.png", "img005.png"}
+    )
+
+    # The whole batch, then halves down to each failing file.
+    assert model.calls == [
+        [f"img{i:03d}.png" for i in range(8)],
+        ["img000.png", "img001.png", "img002.png", "img003.png"],
+        ["img000.png", "img001.png"],
+        ["img002.png", "img003.png"],
+        ["img002.png"],
+        ["img003.png"],
+        ["img004.png", "img005.png", "img006.png", "img007.png"],
+        ["img004.png", "img005.png"],
+        ["img004.png"],
+        ["img005.png"],
+        ["img006.png", "img007.png"],
+    ]
+    assert completed == [
+        "img000.png",
+        "img001.png",
+        "img003.png",
+        "img004.png",
+        "img006.png",
+        "img007.png",
+    ]
+
+
+def test_failed_single_file_batch_is_not_retried(tmp_path, monkeypatch):
+    model, completed = run_worker(tmp_path, monkeypatch, 2, 1, {"img000.png"})
+
+    assert model.calls == [["img000.png"], ["img001.png"]]
+    assert completed == ["img001.png"]
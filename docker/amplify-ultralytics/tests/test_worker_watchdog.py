@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from stub_model import build_argv, write_images
+
+RUN_STUB = Path(__file__).resolve().parent / "run_stub.py"
+
+
+def test_replacement_for_worker_stalled_on_last_batch_exits(tmp_path):
+    # One worker, so its lookahead past the last batch is its stop sentinel:
+    # the replacement must be handed a stop of its own or it waits forever.
+    write_images(tmp_path / "src", 8)
+    project = tmp_path / "project"
+    marker = tmp_path / "hung"
+    env = dict(os.environ, STUB_HANG="img007.png", STUB_HANG_MARKER=str(marker))
+
+    run = subprocess.run(
+        [
+            sys.executable,
+            str(RUN_STUB),
+            *build_argv(
+                tmp_path / "src",
+                project,
+                "--files-per-call", "4",
+                "--stall-timeout", "3",
+            ),
+        ],  # fmt: skip
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+
+    assert run.returncode == 0, run.stderr
+    assert marker.exists()
+    assert "Restarting GPU 0" in run.stderr
+    completed = (project / ".completed_files.txt").read_text().splitlines()
+    assert sorted(Path(line).name for line in completed) == [
+        f"img{i:03d}.png" for i in range(8)
+    ]
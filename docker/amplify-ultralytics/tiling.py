@@ -0,0 +1,111 @@
+"""
+Tiled inference for yolo_inference.py --tile-size.
+
+A mosaic many times larger than imgsz is either shrunk until small objects
+vanish, or needs an imgsz so large that a batch no longer fits on the GPU.
+In tiled mode each image is instead cut into tile_size squares overlapping
+by a fraction `overlap` of a tile. The last tile of each row and column is
+aligned to the image edge rather than running past it, and an image no
+larger than a tile is a single tile. The loader (yolo_sources) streams tiles
+`batch` at a time and a batch may span images, so the GPU stays full however
+the tiles divide between images.
+
+Each tile's boxes are shifted back into image coordinates, and when an
+image's last tile comes out of predict() all of its boxes go through one
+torchvision NMS pass at merge_iou, on the device predict() left them on.
+That pass removes the copies of objects that appear in two overlapping
+tiles. NMS is per class unless agnostic_nms is set, and max_det is applied
+again to the merged boxes.
+"""
+from collections import deque
+
+
+def tile_origins(length, tile_size, step):
+    """Start offsets along one axis; the last tile ends at the image edge."""
+    if length <= tile_size:
+        return [0]
+    origins = list(range(0, length - tile_size, step))
+    origins.append(length - tile_size)
+    return origins
+
+
+class Tiling:
+    """Tile geometry and merge settings of a run."""
+
+    def __init__(self, tile_size, overlap, merge_iou, agnostic, max_det):
+        self.tile_size = tile_size
+        self.step = max(1, round(tile_size * (1 - overlap)))
+        self.merge_iou = merge_iou
+        self.agnostic = agnostic
+        self.max_det = max_det
+
+    def origins(self, height, width):
+        """(x0, y0) of every tile of a height x width image, row by row."""
+        return [
+            (x0, y0)
+            for y0 in tile_origins(height, self.tile_size, self.step)
+            for x0 in tile_origins(width, self.tile_size, self.step)
+        ]
+
+    def merger(self):
+        return TileMerger(self)
+
+
+class MergedResult:
+    """The part of an Ultralytics Results that DetectionSink reads."""
+
+    def __init__(self, path, boxes, orig_shape, names):
+        self.path = path
+        self.boxes = boxes
+        self.orig_shape = orig_shape
+        self.names = names
+
+
+class TileMerger:
+    """
+    Reassembles the tile Results of one predict call into one result per
+    image. The loader records every tile it hands out, in order, and
+    predict() returns results in that same order.
+    """
+
+    def __init__(self, tiling):
+        self.tiling = tiling
+        self.tiles = 0
+        self._tiles = deque()
+
+    def record(self, path, x0, y0, last, orig_shape):
+        self._tiles.append((path, x0, y0, last, orig_shape))
+
+    def merge(self, results):
+        """Yield a MergedResult per image once all of its tiles are through."""
+        parts = []
+        for result in results:
+            path, x0, y0, last, orig_shape = self._tiles.popleft()
+            self.tiles += 1
+            if result.boxes is not None and len(result.boxes):
+                # float32: half-precision boxes lose whole pixels at mosaic
+                # offsets. clone(): float() is a view of float32 boxes, and
+                # the shifts below must not touch the tile's Results.
+                data = result.boxes.data[:, :6].float().clone()
+                data[:, [0, 2]] += x0
+                data[:, [1, 3]] += y0
+                parts.append(data)
+            if last:
+                yield self._merged(path, parts, orig_shape, result.names)
+                parts = []
+
+    def _merged(self, path, parts, orig_shape, names):
+        import torch
+        from torchvision.ops import batched_nms, nms
+        from ultralytics.engine.results import Boxes
+
+        data = torch.cat(parts) if parts else torch.zeros((0, 6))
+        if len(data) > 1:
+            xyxy, scores = data[:, :4], data[:, 4]
+            if self.tiling.agnostic:
+                keep = nms(xyxy, scores, self.tiling.merge_iou)
+            else:
+                keep = batched_nms(xyxy, scores, data[:, 5], self.tiling.merge_iou)
+            data = data[keep[: self.tiling.max_det]]
+        boxes = Boxes(data, orig_shape[:2])
+        return MergedResult(path, boxes, orig_shape[:2], names)
@@ -0,0 +1,76 @@
+"""
+On-disk cache of media validation results for yolo_inference.py.
+
+Validating a file means a full cv2.imread or a VideoCapture open, which on a
+100k-file archive costs tens of minutes before the first GPU batch. The index
+remembers each outcome keyed by path, size and mtime, so a rerun only probes
+files that are new or have changed since they were last validated.
+"""
+import sqlite3
+import threading
+
+INDEX_FILENAME = ".validation_index.sqlite"
+
+
+class ValidationIndex:
+    """
+    SQLite-backed map of path -> (size, mtime_ns, is_valid, reason, frame_count).
+
+    Lookups come from the validation thread pool, so the single connection is
+    shared across threads behind a lock. Only the parent process opens the
+    index; GPU workers never touch it.
+    """
+
+    def __init__(self, index_file):
+        self.index_file = index_file
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(index_file), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS validation ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " valid INTEGER NOT NULL,"
+            " reason TEXT,"
+            " frame_count INTEGER"
+            ") WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    def lookup(self, path, size, mtime_ns):
+        """
+        Return the cached (is_valid, reason, frame_count) for `path`, or None if
+        the file was never validated or has changed size or mtime since.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, valid, reason, frame_count "
+                "FROM validation WHERE path = ?",
+                (path,),
+            ).fetchone()
+        if row is None or row[0] != size or row[1] != mtime_ns:
+            return None
+        return bool(row[2]), row[3], row[4]
+
+    def record(self, rows):
+        """
+        Store a batch of (path, size, mtime_ns, is_valid, reason, frame_count)
+        outcomes in one transaction.
+        """
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO validation "
+                "(path, size, mtime_ns, valid, reason, frame_count) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (path, size, mtime_ns, int(is_valid), reason, frame_count)
+                    for path, size, mtime_ns, is_valid, reason, frame_count in rows
+                ],
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,379 @@
+"""
+Parallel, frame-skipping video decode for yolo_inference.py --decode-workers.
+
+Ultralytics reads a batch's videos one after another on the predict thread,
+and calls grab() for every frame it skips. With OpenCV's FFmpeg backend grab()
+still decodes the frame (it only skips the colour conversion), so at
+vid_stride 5 or 10 most of the decode work is thrown away and the GPU waits
+on a single core.
+
+A DecoderPool instead runs a few decoder processes next to each GPU worker.
+Each takes one video at a time and produces only the frames that
+vid_stride keeps, which are frames stride-1, 2*stride-1, ... the same ones
+Ultralytics keeps:
+
+- MJPEG AVI files are demuxed here: the chunk headers of the movi list are
+  walked and only the JPEG payloads of kept frames are read and decoded with
+  cv2.imdecode. Skipped frames are neither read nor decoded. libjpeg and
+  FFmpeg's MJPEG decoder can round chroma differently at sharp edges, so
+  pixels may differ by a few levels from Ultralytics' own loader.
+- Anything else, or an MJPEG file this parser does not handle, is read with
+  cv2.VideoCapture, using grab() for skipped frames and retrieve() for kept
+  ones.
+
+Decoded frames are written into a per-decoder ring of shared-memory slots and
+only the slot number travels over the queue. The predict thread copies each
+frame out and frees its slot, so a decoder can run at most RING_SLOTS frames
+ahead of the GPU. Videos are handed out in order and consumed in order, so a
+batch's detections come out exactly as they would from Ultralytics.
+
+With a gate threshold, decoders also drop kept frames that barely differ
+from the last one they passed on (see frame_gate) and send only a marker for
+them.
+"""
+import queue
+import struct
+from collections import deque
+from multiprocessing import get_context, parent_process
+from multiprocessing.shared_memory import SharedMemory
+
+import cv2
+import numpy as np
+
+from frame_gate import frame_changed, gate_thumbnail
+
+# Frames each decoder may have decoded but not yet consumed.
+RING_SLOTS = 8
+
+# Seconds between liveness checks while waiting on a decoder.
+POLL_INTERVAL_S = 1.0
+
+_MJPEG_FOURCCS = {"MJPG", "mjpg", "MJPA", "AVRn", "JPEG", "jpeg"}
+
+
+def _fourcc(cap):
+    code = int(cap.get(cv2.CAP_PROP_FOURCC))
+    return code.to_bytes(4, "little").decode("latin-1")
+
+
+def _avi_video_chunks(f):
+    """
+    Yield (offset, size) of each chunk of the first video stream of an AVI
+    file, in file order, including OpenDML AVIX extensions. Raises ValueError
+    on anything that is not a RIFF AVI.
+    """
+    state = {"streams": 0, "video": None}
+
+    def walk(end):
+        while f.tell() + 8 <= end:
+            header = f.read(8)
+            if len(header) < 8:
+                return
+            chunk_id, size = struct.unpack("<4sI", header)
+            start = f.tell()
+            if chunk_id == b"LIST":
+                if f.read(4) in (b"hdrl", b"strl", b"movi", b"rec "):
+                    yield from walk(start + size)
+            elif chunk_id == b"strh":
+                if f.read(4) == b"vids" and state["video"] is None:
+                    state["video"] = b"%02d" % state["streams"]
+                state["streams"] += 1
+            elif (
+                state["video"] is not None
+                and chunk_id[:2] == state["video"]
+                and chunk_id[2:] in (b"dc", b"db")
+            ):
+                yield start, size
+            f.seek(start + size + (size & 1))
+
+    f.seek(0)
+    while True:
+        header = f.read(12)
+        if len(header) < 12:
+            return
+        riff, size, form = struct.unpack("<4sI4s", header)
+        if riff != b"RIFF" or form not in (b"AVI ", b"AVIX"):
+            raise ValueError("not a RIFF AVI file")
+        end = f.tell() + size - 4
+        yield from walk(end)
+        f.seek(end + (size & 1))
+
+
+def _capture_frames(path, stride, total, start=0):
+    """Kept frames start..total-1, via VideoCapture grab()/retrieve()."""
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            return
+        for _ in range(start * stride):
+            if not cap.grab():
+                return
+        for _ in range(start, total):
+            for _ in range(stride):
+                if not cap.grab():
+                    return
+            ok, frame = cap.retrieve()
+            if not ok:
+                return
+            yield frame
+    finally:
+        cap.release()
+
+
+def _mjpeg_frames(path, stride, total):
+    """
+    Kept frames of an MJPEG AVI, decoding only their own chunks. Falls back
+    to _capture_frames from the first frame it cannot handle this way.
+    """
+    kept = 0
+    try:
+        with open(path, "rb") as f:
+            for index, (offset, size) in enumerate(_avi_video_chunks(f)):
+                if kept >= total:
+                    return
+                if (index + 1) % stride:
+                    continue
+                # An empty chunk is a dropped frame; leave the accounting of
+                # those to FFmpeg.
+                if size == 0:
+                    break
+                f.seek(offset)
+                frame = cv2.imdecode(
+                    np.frombuffer(f.read(size), np.uint8), cv2.IMREAD_COLOR
+                )
+                if frame is None:
+                    break
+                yield frame
+                kept += 1
+            else:
+                return
+    except (OSError, ValueError, struct.error):
+        pass
+    yield from _capture_frames(path, stride, total, start=kept)
+
+
+def _decoder_main(tasks, results, free_slots, generation):
+    """
+    Decoder process: decode one video per task into this decoder's ring.
+
+    Messages to the consumer, each tagged with the task's generation:
+    ("open", ring_name, fps, total) before the first frame, ("frame", slot,
+    shape) per kept frame or ("gated",) per kept frame the gate dropped, and
+    ("end", error) last. A task whose generation is
+    no longer current was abandoned by its consumer and stops early.
+    Exits once its GPU worker is gone, e.g. killed by the stall watchdog.
+    """
+    ring = None
+    parent = parent_process()
+    try:
+        while True:
+            try:
+                task = tasks.get(timeout=POLL_INTERVAL_S)
+            except queue.Empty:
+                if not parent.is_alive():
+                    return
+                continue
+            if task is None:
+                return
+            gen, path, stride, gate_threshold = task
+            try:
+                ring = _decode_video(
+                    gen,
+                    path,
+                    stride,
+                    gate_threshold,
+                    results,
+                    free_slots,
+                    generation,
+                    ring,
+                )
+            except Exception as e:
+                results.put(("end", gen, f"{type(e).__name__}: {e}"))
+    finally:
+        if ring is not None:
+            ring.close()
+            ring.unlink()
+
+
+def _decode_video(
+    gen, path, stride, gate_threshold, results, free_slots, generation, ring
+):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        results.put(("end", gen, f"Failed to open video {path}"))
+        return ring
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    # Ultralytics stops after int(frame count / stride) kept frames.
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) / stride)
+    mjpeg = _fourcc(cap) in _MJPEG_FOURCCS and path.lower().endswith(".avi")
+    cap.release()
+
+    frames = (_mjpeg_frames if mjpeg else _capture_frames)(path, stride, total)
+    slot = 0
+    slot_bytes = 0
+    reference = None
+    for frame in frames:
+        if generation.value != gen:
+            break
+        if gate_threshold > 0:
+            thumbnail = gate_thumbnail(frame)
+            if not frame_changed(thumbnail, reference, gate_threshold):
+                results.put(("gated", gen))
+                continue
+            reference = thumbnail
+        if slot_bytes == 0:
+            # The previous video's frames have all been consumed by now, so
+            # the ring can be replaced if this video's frames do not fit.
+            slot_bytes = frame.nbytes
+            if ring is None or ring.size < slot_bytes * RING_SLOTS:
+                if ring is not None:
+                    ring.close()
+                    ring.unlink()
+                ring = SharedMemory(create=True, size=slot_bytes * RING_SLOTS)
+            results.put(("open", gen, ring.name, fps, total))
+        elif frame.nbytes != slot_bytes:
+            raise ValueError(f"frame size changed mid-video in {path}")
+
+        if not _wait_for_slot(free_slots, generation, gen):
+            break
+        target = np.ndarray(
+            frame.shape, np.uint8, buffer=ring.buf, offset=slot * slot_bytes
+        )
+        target[...] = frame
+        results.put(("frame", gen, slot, frame.shape))
+        slot = (slot + 1) % RING_SLOTS
+
+    results.put(("end", gen, None))
+    return ring
+
+
+def _wait_for_slot(free_slots, generation, gen):
+    """Block until a ring slot is free; False if the task was abandoned."""
+    while not free_slots.acquire(timeout=POLL_INTERVAL_S):
+        if generation.value != gen or not parent_process().is_alive():
+            return False
+    return True
+
+
+class _Decoder:
+    def __init__(self, ctx, generation):
+        self.tasks = ctx.Queue()
+        self.results = ctx.Queue()
+        self.free_slots = ctx.Semaphore(RING_SLOTS)
+        # This side's mapping of the decoder's current ring.
+        self.ring = None
+        self.process = ctx.Process(
+            target=_decoder_main,
+            args=(self.tasks, self.results, self.free_slots, generation),
+            daemon=True,
+        )
+        self.process.start()
+
+
+class DecoderPool:
+    """
+    Decoder processes owned by one GPU worker. frames() is called from its
+    predict thread only, one batch at a time.
+    """
+
+    def __init__(self, workers):
+        self._ctx = get_context("spawn")
+        # Bumped per frames() call; decoders drop work from older calls.
+        self._generation = self._ctx.Value("i", 0)
+        self._decoders = [
+            _Decoder(self._ctx, self._generation) for _ in range(max(1, workers))
+        ]
+
+    def _replace_dead(self):
+        for i, decoder in enumerate(self._decoders):
+            if not decoder.process.is_alive():
+                if decoder.ring is not None:
+                    decoder.ring.close()
+                self._decoders[i] = _Decoder(self._ctx, self._generation)
+
+    def _receive(self, decoder, gen):
+        """Next message of generation `gen` from `decoder`."""
+        while True:
+            try:
+                kind, msg_gen, *payload = decoder.results.get(timeout=POLL_INTERVAL_S)
+            except queue.Empty:
+                if not decoder.process.is_alive():
+                    raise RuntimeError("video decoder process exited")
+                continue
+            if msg_gen == gen:
+                return kind, payload
+            if kind == "frame":
+                # A frame an abandoned call never consumed.
+                decoder.free_slots.release()
+
+    @staticmethod
+    def _attach_ring(decoder, name):
+        if decoder.ring is None or decoder.ring.name != name:
+            if decoder.ring is not None:
+                decoder.ring.close()
+            decoder.ring = SharedMemory(name=name)
+        return decoder.ring
+
+    def frames(self, paths, stride, gate_threshold=0):
+        """
+        Yield (index, path, frame, kept, total, fps) for the kept frames of
+        `paths`, in order; frame is None for a frame the gate dropped. Up to
+        one video per decoder is decoded ahead.
+        Raises FileNotFoundError for a video that cannot be opened, as
+        Ultralytics' loader does.
+        """
+        with self._generation.get_lock():
+            self._generation.value += 1
+            gen = self._generation.value
+        self._replace_dead()
+
+        pending = deque(enumerate(paths))
+        active = deque()
+        idle = list(self._decoders)
+        while pending or active:
+            while pending and idle:
+                decoder = idle.pop()
+                index, path = pending.popleft()
+                decoder.tasks.put((gen, path, stride, gate_threshold))
+                active.append((decoder, index, path))
+
+            decoder, index, path = active[0]
+            ring, fps, total, kept = None, 0, 0, 0
+            while True:
+                kind, payload = self._receive(decoder, gen)
+                if kind == "open":
+                    name, fps, total = payload
+                    ring = self._attach_ring(decoder, name)
+                elif kind == "frame":
+                    slot, shape = payload
+                    size = int(np.prod(shape))
+                    frame = np.ndarray(
+                        shape, np.uint8, buffer=ring.buf, offset=slot * size
+                    ).copy()
+                    decoder.free_slots.release()
+                    kept += 1
+                    yield index, path, frame, kept, total, fps
+                elif kind == "gated":
+                    kept += 1
+                    yield index, path, None, kept, total, fps
+                else:
+                    (error,) = payload
+                    break
+
+            active.popleft()
+            idle.append(decoder)
+            if error is not None:
+                raise FileNotFoundError(error)
+
+    def close(self):
+        with self._generation.get_lock():
+            self._generation.value += 1
+        for decoder in self._decoders:
+            decoder.tasks.put(None)
+        for decoder in self._decoders:
+            decoder.process.join(timeout=10)
+            if decoder.process.is_alive():
+                decoder.process.terminate()
+            if decoder.ring is not None:
+                decoder.ring.close()
+                decoder.ring = None
@@ -0,0 +1,62 @@
+"""
+Control files for yolo_inference.py --watch.
+
+A watching container is driven through its project directory, which the
+Prefect tasks can reach without a Docker exec:
+
+- <project>/.watch/drain: stop picking up new files, finish every batch
+  already queued, then exit.
+- <project>/.watch/stop: stop picking up new files, drop batches no worker
+  has claimed yet (the next start picks their files up again, since they are
+  not in the manifest), finish the batches in hand, then exit. SIGTERM, as
+  sent by `docker stop`, does the same.
+- <project>/.watch/status.json is rewritten atomically after every poll with
+  the daemon's state and counters, so a caller can tell that it is up.
+"""
+import json
+import os
+import time
+from pathlib import Path
+
+WATCH_DIRNAME = ".watch"
+DRAIN_FILENAME = "drain"
+STOP_FILENAME = "stop"
+STATUS_FILENAME = "status.json"
+
+RUNNING = "running"
+DRAINING = "draining"
+STOPPING = "stopping"
+STOPPED = "stopped"
+
+
+class WatchControl:
+    def __init__(self, project_path):
+        self.dir = Path(project_path) / WATCH_DIRNAME
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.status_path = self.dir / STATUS_FILENAME
+        self.started = time.time()
+
+    def clear_requests(self):
+        """Forget drain/stop requests left behind by a previous daemon."""
+        for filename in (DRAIN_FILENAME, STOP_FILENAME):
+            (self.dir / filename).unlink(missing_ok=True)
+
+    def requested_state(self):
+        """STOPPING, DRAINING or RUNNING, by the control files present."""
+        if (self.dir / STOP_FILENAME).exists():
+            return STOPPING
+        if (self.dir / DRAIN_FILENAME).exists():
+            return DRAINING
+        return RUNNING
+
+    def write_status(self, state, **fields):
+        status = {
+            "state": state,
+            "pid": os.getpid(),
+            "started": self.started,
+            "updated": time.time(),
+            **fields,
+        }
+        tmp_file = self.status_path.with_name(self.status_path.name + ".tmp")
+        tmp_file.write_text(json.dumps(status) + "\n")
+        os.replace(tmp_file, self.status_path)
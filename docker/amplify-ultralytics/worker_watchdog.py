@@ -0,0 +1,164 @@
+"""
+Stall detection for yolo_inference.py workers (--stall-timeout).
+
+A worker that hangs inside CUDA, or waits forever on a stuck video decode,
+never exits, so the parent would wait on it forever and its batches would
+never be finished. Instead:
+
+- Each worker stamps its slot of a shared array from its GPU thread: once per
+  Results object predict() yields and once per batch it claims. While it
+  waits on the empty work queue it writes 0, since idling is not stalling.
+  Only that thread stamps, so a worker whose other threads are healthy but
+  whose predict loop is stuck still goes stale.
+- Workers report every batch they take off the queue ("claimed" events),
+  every batch they finish ("batch" events) and taking their stop sentinel
+  ("drained") over the progress queue. The parent's BatchTracker thus knows
+  which batches each worker holds, and which already hold their stop.
+- The parent's Watchdog checks the stamps. A worker stale for longer than the
+  timeout is terminated (then killed if it does not exit). A replacement is
+  started on the same slot, and the dead worker's batches, minus files that
+  reached the manifest, are handed to it directly as its first batches.
+  They do not go back on the shared queue, where they could end up behind
+  the stop sentinels. A worker takes the next item before predicting the
+  current batch, so one that stalls on its last batch has already taken its
+  sentinel; its replacement then gets a stop of its own after the batches,
+  or it would wait on the empty queue forever. A slot that stalls more than
+  `max_restarts` times is given up on, and its remaining files are left for
+  the next run, as are batches still on the shared queue once every worker
+  has exited.
+"""
+import threading
+import time
+from collections import defaultdict
+
+# Seconds a stalled worker gets to exit after SIGTERM before SIGKILL.
+TERMINATE_GRACE_S = 10
+
+# Worker side: this process's stamp array and slot, set by install().
+_stamps = None
+_slot = None
+
+
+def install(heartbeat):
+    """Start stamping `heartbeat`, an (array, slot index) pair, from this process."""
+    global _stamps, _slot
+    if heartbeat is not None:
+        _stamps, _slot = heartbeat
+        beat()
+
+
+def beat():
+    if _stamps is not None:
+        _stamps[_slot] = time.time()
+
+
+def idle():
+    if _stamps is not None:
+        _stamps[_slot] = 0.0
+
+
+class BatchTracker:
+    """
+    Parent side: the files of every batch queued and not yet finished, and
+    which worker holds which. on_event() runs on the progress thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._files = {}
+        self._held = defaultdict(set)
+        self._drained = set()
+
+    def queued(self, index, files):
+        with self._lock:
+            self._files[index] = [str(file_path) for file_path in files]
+
+    def on_event(self, event):
+        kind = event["kind"]
+        if kind == "drained":
+            with self._lock:
+                self._drained.add(event["worker"])
+            return
+        if kind not in ("claimed", "batch"):
+            return
+        index = event["batch"]
+        with self._lock:
+            if kind == "claimed" and event["files"]:
+                self._held[event["worker"]].add(index)
+            else:
+                # Finished, or every file was already complete elsewhere.
+                self._held[event["worker"]].discard(index)
+                self._files.pop(index, None)
+
+    def take_held(self, worker):
+        """
+        Forget and return what `worker` holds: its (index, files) batches,
+        and whether it has taken its stop sentinel.
+        """
+        with self._lock:
+            held = sorted(self._held.pop(worker, ()))
+            drained = worker in self._drained
+            self._drained.discard(worker)
+            return [(index, self._files.pop(index, [])) for index in held], drained
+
+
+class Watchdog:
+    def __init__(self, stall_timeout, max_restarts, tracker, completion, eprint):
+        self.stall_timeout = stall_timeout
+        self.max_restarts = max_restarts
+        self.tracker = tracker
+        self.completion = completion
+        self.eprint = eprint
+        self.restarts = defaultdict(int)
+        self.abandoned = 0
+
+    def check(self, workers):
+        """Replace every worker whose stamp is older than the timeout."""
+        now = time.time()
+        for index, process in enumerate(workers):
+            stamp = workers.stamps[index]
+            if stamp and now - stamp > self.stall_timeout and process.is_alive():
+                self._recover(workers, index)
+
+    def _recover(self, workers, index):
+        slot = workers.slots[index]
+        process = workers.processes[index]
+        self.eprint(
+            f"ERROR: {slot.label} made no progress for {self.stall_timeout:.0f}s; "
+            "terminating it"
+        )
+        process.terminate()
+        process.join(TERMINATE_GRACE_S)
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+        # Files the worker finished before it hung are in the manifest.
+        self.completion.refresh()
+        batches = []
+        held, drained = self.tracker.take_held(slot.name)
+        for batch_index, files in held:
+            remaining = [f for f in files if f not in self.completion]
+            if remaining:
+                batches.append((batch_index, remaining))
+        remaining = sum(len(files) for _, files in batches)
+
+        self.restarts[index] += 1
+        if self.restarts[index] > self.max_restarts:
+            self.eprint(
+                f"ERROR: {slot.label} stalled {self.restarts[index]} times; giving up "
+                f"on it and leaving {remaining} files for the next run"
+            )
+            self.abandoned += remaining
+            workers.stamps[index] = 0.0
+            return
+
+        for batch_index, files in batches:
+            self.tracker.queued(batch_index, files)
+        self.eprint(
+            f"Restarting {slot.label} with the {remaining} unfinished files "
+            f"of {len(batches)} batches it held"
+        )
+        if drained:
+            batches.append(None)
+        workers.restart(index, batches)
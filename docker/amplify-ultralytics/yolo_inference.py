@@ -1,8 +1,17 @@
 #!/usr/bin/env python3
 import argparse
+import heapq
+import os
+import queue
+import re
 import shutil
+import signal
 import sys
+import threading
+import time
+from collections import deque, namedtuple
 from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from math import ceil
 from multiprocessing import get_context
 from os import cpu_count
@@ -11,24 +20,50 @@ from tempfile import gettempdir, mkdtemp
 
 import cv2
 
-STAGING_PREFIX = "yolo-gpu"
+import worker_watchdog
+from completion_index import SharedCompletionIndex
+from media_probe import probe_image
+from progress_events import ProgressMonitor, ProgressReporter
+from stage_metrics import StageMetrics
+from validation_index import INDEX_FILENAME, ValidationIndex
+from yolo_sources import (
+    FramePool,
+    build_decoded_video_source,
+    build_memory_source,
+    build_tiled_source,
+    read_bgr,
+)
+
+STAGING_PREFIX = "yolo-"
+
+# One model replica: the device it runs on, its output/staging name, the label
+# its log lines carry and, for CPU workers, the cores it is pinned to.
+WorkerSlot = namedtuple("WorkerSlot", "device name label cores")
+
+# Workers pull batches from a shared queue, so a GPU that finishes early keeps
+# taking work instead of idling. That only helps if there are enough batches to
+# go around; small runs have their batches shrunk until each worker can expect
+# at least this many.
+MIN_BATCHES_PER_WORKER = 4
 
 IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".tif", ".webp"}
 
+# Paths the discovery walker may run ahead of validation in streaming mode.
+DISCOVERY_QUEUE_SIZE = 10000
 
-def eprint(*args, **kwargs):
-    print(*args, file=sys.stderr, flush=True, **kwargs)
+# Batches streaming discovery may queue ahead of the workers, per worker.
+STREAM_QUEUE_BATCHES_PER_WORKER = 4
+
+# Fresh validation outcomes are written to the index in batches of this size,
+# so an interrupted validation pass still keeps most of its work.
+VALIDATION_INDEX_FLUSH = 1000
+
+# Seconds between the parent's checks of worker heartbeats.
+WATCHDOG_INTERVAL_S = 1.0
 
 
-def chunk(lst, n):
-    """Split list into n almost equal chunks preserving order."""
-    if n <= 0:
-        return [lst]
-    length = len(lst)
-    if length == 0:
-        return [[] for _ in range(n)]
-    size = ceil(length / n)
-    return [lst[i * size : (i + 1) * size] for i in range(n)]
+def eprint(*args, **kwargs):
+    print(*args, file=sys.stderr, flush=True, **kwargs)
 
 
 def batched(items, size):
@@ -37,6 +72,89 @@ def batched(items, size):
         yield items[start : start + size]
 
 
+def estimate_file_cost(frame_count, vid_stride):
+    """
+    Predicted inference cost of one file, in frames YOLO will actually run on.
+
+    Images (and videos whose frame count is unknown because validation was
+    skipped) count as a single frame.
+    """
+    if not frame_count:
+        return 1
+    return max(1, ceil(frame_count / max(1, vid_stride)))
+
+
+def plan_batches(files_with_costs, files_per_call, num_workers):
+    """
+    Cut the pending files into the batches that workers pull from the queue.
+
+    Files keep their path order inside a batch. A batch closes when it reaches
+    files_per_call files or its share of the total cost, so one batch of long
+    clips cannot outweigh the rest of the run, and there are always at least
+    MIN_BATCHES_PER_WORKER batches per worker to rebalance with. Batches are
+    returned heaviest first: workers pulling from a shared queue then amount to
+    longest-processing-time-first scheduling.
+
+    Returns:
+        list of (cost, files) tuples.
+    """
+    if not files_with_costs:
+        return []
+
+    total_cost = sum(cost for _, cost in files_with_costs)
+    target_batches = max(
+        ceil(len(files_with_costs) / files_per_call),
+        max(1, num_workers) * MIN_BATCHES_PER_WORKER,
+    )
+    cost_budget = total_cost / target_batches
+
+    batches = []
+    current = []
+    current_cost = 0
+    for file_path, cost in files_with_costs:
+        if current and (
+            len(current) >= files_per_call or current_cost + cost > cost_budget
+        ):
+            batches.append((current_cost, current))
+            current, current_cost = [], 0
+        current.append(file_path)
+        current_cost += cost
+    batches.append((current_cost, current))
+
+    batches.sort(key=lambda planned: planned[0], reverse=True)
+    return batches
+
+
+def predict_worker_loads(batch_costs, num_workers):
+    """
+    Simulate workers pulling batches in queue order, each batch going to the
+    least-loaded worker. Returns (cost, batch_count) per worker.
+    """
+    heap = [(0, idx, 0) for idx in range(num_workers)]
+    for cost in batch_costs:
+        load, idx, count = heapq.heappop(heap)
+        heapq.heappush(heap, (load + cost, idx, count + 1))
+    return [(load, count) for load, _, count in sorted(heap, key=lambda w: w[1])]
+
+
+def batch_label(index, total_batches):
+    """"3/40" once the batch count is known, just "3" while still streaming."""
+    return f"{index}/{total_batches}" if total_batches else f"{index}"
+
+
+def enqueue_batches(work_queue, batches, num_workers, tracker=None):
+    """
+    Put every batch on the shared work queue, followed by one stop sentinel per
+    worker. Paths travel as strings to keep the pickled queue items small.
+    """
+    for index, batch in enumerate(batches, start=1):
+        if tracker is not None:
+            tracker.queued(index, batch)
+        work_queue.put((index, [str(file_path) for file_path in batch]))
+    for _ in range(num_workers):
+        work_queue.put(None)
+
+
 def parse_int_list(s):
     if s is None or s == "" or s.lower() == "none":
         return None
@@ -51,16 +169,40 @@ def parse_bool(s: str) -> bool:
     raise ValueError(f"Expected 'True' or 'False', got '{s}'")
 
 
-def load_completed_files(manifest_file):
-    """Load the set of completed file paths from the manifest."""
-    if not manifest_file.exists():
-        return set()
-    try:
-        with open(manifest_file, "r") as f:
-            return set(line.strip() for line in f if line.strip())
-    except Exception as e:
-        eprint(f"WARNING: Could not read manifest {manifest_file}: {e}")
-        return set()
+def node_file(filename, node):
+    """
+    `filename` for one node of a multi-node run: name.<node>.ext, so that
+    nodes sharing a project directory over NFS never write the same file.
+    """
+    if node is None:
+        return filename
+    stem, _, ext = filename.rpartition(".")
+    return f"{stem}.{node}.{ext}"
+
+
+def open_completion_index(manifest_file):
+    """
+    Open the completion index for the manifest, compacting it first if the
+    journal has outgrown it. Only the parent calls this, before any worker
+    starts appending.
+    """
+    completion = SharedCompletionIndex(manifest_file)
+    if completion.needs_compaction():
+        eprint(f"Compacting completion index ({len(completion)} entries)...")
+        completion.compact()
+    return completion
+
+
+def compact_completion_index(completion):
+    """
+    Fold the journal lines appended since the last compaction into the table
+    once they have outgrown it. Workers pick the new table up on their next
+    refresh(), which keeps their tails short over a long run. Parent only.
+    """
+    completion.refresh()
+    if completion.needs_compaction():
+        eprint(f"Compacting completion index ({len(completion)} entries)...")
+        completion.compact()
 
 
 def mark_files_complete(manifest_file, file_paths, lock):
@@ -84,22 +226,44 @@ def relative_to_root(file_path, src_root):
         return Path(file_path.name)
 
 
+def to_bgr8(img):
+    """
+    Convert an IMREAD_UNCHANGED decode to what IMREAD_COLOR would have given:
+    8-bit, 3-channel BGR.
+    """
+    if img.dtype != "uint8":
+        scale = 1 / 256 if img.dtype == "uint16" else 1
+        img = cv2.convertScaleAbs(img, alpha=scale)
+    if img.ndim == 2 or img.shape[2] == 1:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    if img.shape[2] == 4:
+        return cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    return img
+
+
 def prepare_yolo_source(file_path, src_root, converted_root):
     """
     Ultralytics may load some TIFFs as one-channel tensors. Stage non-3-channel
     image files as temporary 3-channel images before passing them to YOLO.
+
+    The channel count comes from a header probe, so 3-channel images are not
+    decoded at all and the rest are decoded once. Formats the probe does not
+    understand are decoded once unchanged and converted in memory.
     """
     if file_path.suffix.lower() not in IMAGE_EXTS:
         return str(file_path)
 
-    img = cv2.imread(str(file_path), cv2.IMREAD_UNCHANGED)
-    if img is None:
-        return str(file_path)
-
-    if img.ndim == 3 and img.shape[2] == 3:
-        return str(file_path)
+    info = probe_image(file_path)
+    if info is not None:
+        if info.channels == 3:
+            return str(file_path)
+        converted = cv2.imread(str(file_path), cv2.IMREAD_COLOR)
+    else:
+        img = cv2.imread(str(file_path), cv2.IMREAD_UNCHANGED)
+        if img is None or (img.ndim == 3 and img.shape[2] == 3):
+            return str(file_path)
+        converted = to_bgr8(img)
 
-    converted = cv2.imread(str(file_path), cv2.IMREAD_COLOR)
     if converted is None:
         return str(file_path)
 
@@ -132,6 +296,13 @@ def validate_media_file(file_path):
 
     try:
         if file_ext in IMAGE_EXTS:
+            # A readable header is enough here; the pixels are decoded once,
+            # later, by staging or by YOLO itself.
+            info = probe_image(file_path)
+            if info is not None:
+                if info.width <= 0 or info.height <= 0:
+                    return False, "image header has zero size", None
+                return True, None, None
             img = cv2.imread(str(file_path))
             if img is None:
                 return False, "cannot read image with OpenCV", None
@@ -168,12 +339,12 @@ def resolve_validation_workers(validation_workers, file_count):
     return min(file_count, max(1, min(cpu_count() or 1, 32)))
 
 
-def build_predict_kwargs(gpu_id, args, classes_list, embed_list):
-    """Build the keyword arguments shared by every predict call on this GPU."""
+def build_predict_kwargs(slot, args, classes_list, embed_list):
+    """Build the keyword arguments shared by every predict call of one worker."""
     predict_kwargs = {
-        "device": gpu_id,
+        "device": slot.device,
         "project": args.project,
-        "name": f"gpu{gpu_id}",
+        "name": slot.name,
         "exist_ok": True,
         "agnostic_nms": args.agnostic_nms,
         "iou": args.iou,
@@ -207,7 +378,7 @@ def build_predict_kwargs(gpu_id, args, classes_list, embed_list):
     return predict_kwargs
 
 
-def stage_batch(files, src_root, converted_root, workers, gpu_id):
+def stage_batch(files, src_root, converted_root, workers, label):
     """
     Stage a batch of files for YOLO, converting non-3-channel images as needed.
 
@@ -235,7 +406,7 @@ def stage_batch(files, src_root, converted_root, workers, gpu_id):
 
     for file_path, source, error in staged:
         if error is not None:
-            eprint(f"GPU {gpu_id}: ERROR staging {file_path.name}: {error}")
+            eprint(f"{label}: ERROR staging {file_path.name}: {error}")
             staging_errors.append(file_path)
             continue
         sources.append(source)
@@ -245,26 +416,53 @@ def stage_batch(files, src_root, converted_root, workers, gpu_id):
 
     if converted:
         eprint(
-            f"GPU {gpu_id}: Converted {converted}/{len(files)} images "
+            f"{label}: Converted {converted}/{len(files)} images "
             "to temporary 3-channel copies"
         )
 
     return sources, source_to_file, staging_errors
 
 
-def run_predict(model, source, predict_kwargs):
+def run_predict(model, source, predict_kwargs, sink=None):
     """
     Run one predict call, consuming the streaming generator.
 
     Streaming keeps Results (which hold a full-size orig_img each) from
-    accumulating in memory across a large batch.
+    accumulating in memory across a large batch. When a detection sink is
+    given, each Results object's boxes are recorded as it goes past. A tiled
+    source's results are merged back into one per image first.
     """
+    results = model.predict(source=source, stream=True, **predict_kwargs)
+    merger = getattr(source, "merger", None)
+    if merger is not None:
+        results = merger.merge(results)
     seen = 0
-    for _ in model.predict(source=source, stream=True, **predict_kwargs):
+    for result in results:
+        worker_watchdog.beat()
+        if sink is not None:
+            sink.add(result)
         seen += 1
     return seen
 
 
+def run_predict_into_sink(model, source, predict_kwargs, sink, source_to_file):
+    """
+    run_predict() as one sink transaction: the call's rows are committed if
+    it succeeds and discarded if it raises, so a retried call cannot leave
+    duplicate rows behind.
+    """
+    if sink is None:
+        return run_predict(model, source, predict_kwargs)
+    sink.begin(source_to_file)
+    try:
+        seen = run_predict(model, source, predict_kwargs, sink)
+    except BaseException:
+        sink.rollback()
+        raise
+    sink.commit()
+    return seen
+
+
 class StagedBatch:
     """
     A batch staged on disk and ready to hand to predict().
@@ -283,59 +481,199 @@ class StagedBatch:
         self.sources = sources
         self.source_to_file = source_to_file
         self.staging_errors = staging_errors
+        # Bytes of converted copies written to disk. Originals that need no
+        # conversion are listed under their own paths and add nothing.
+        self.staged_bytes = 0
+        # {file: cached detections} for files left out of staging.
+        self.cache_hits = {}
+        self._sub_listings = 0
+
+    def predict_source(self, sources):
+        """The predict() source for `sources`, all or part of this batch."""
+        if len(sources) == 1:
+            return sources[0]
+        if sources == self.sources:
+            return str(self.listing)
+        # A retry over part of the batch gets its own listing next to the
+        # full one, so cleanup() still removes it.
+        self._sub_listings += 1
+        listing = self.tmpdir / f"sources-{self._sub_listings}.txt"
+        listing.write_text("".join(f"{source}\n" for source in sources))
+        return str(listing)
 
     def cleanup(self):
         shutil.rmtree(self.tmpdir, ignore_errors=True)
 
 
-def sweep_stale_staging_dirs(gpu_id):
-    """Remove staging directories orphaned by a previously killed container."""
+class MemoryStagedBatch:
+    """
+    A batch of images decoded into a bounded in-memory pool.
+
+    Every image is decoded once, straight to 3-channel BGR, and handed to
+    predict() through an in-memory loader, so nothing is written to or read
+    back from /tmp. Images beyond the pool's byte budget are decoded on demand
+    as the loader reaches them. Same ownership rule as StagedBatch: the
+    consumer calls cleanup().
+    """
+
+    def __init__(self, files, pool, batch_size, tiling=None):
+        self.files = files
+        self.sources = [str(file_path) for file_path in files]
+        self.source_to_file = dict(zip(self.sources, files))
+        self.staging_errors = []
+        self.pool = pool
+        self.batch_size = batch_size
+        self.tiling = tiling
+        # Bytes decoded ahead of time; the rest is decoded by the loader.
+        self.staged_bytes = pool.nbytes
+        self.cache_hits = {}
+
+    def predict_source(self, sources):
+        """The predict() source for `sources`, all or part of this batch."""
+        if self.tiling is not None:
+            return build_tiled_source(sources, self.pool, self.batch_size, self.tiling)
+        return build_memory_source(sources, self.pool, self.batch_size)
+
+    def cleanup(self):
+        self.pool.clear()
+
+
+class DecodedVideoBatch:
+    """
+    A batch of videos read by the worker's DecoderPool. Nothing is staged
+    ahead: the pool decodes kept frames in its own processes while predict()
+    consumes them, so cleanup() has nothing to release.
+    """
+
+    def __init__(
+        self, files, decoders, batch_size, vid_stride, gate_threshold=0, ledger=None
+    ):
+        self.files = files
+        self.sources = [str(file_path) for file_path in files]
+        self.source_to_file = dict(zip(self.sources, files))
+        self.staging_errors = []
+        self.decoders = decoders
+        self.batch_size = batch_size
+        self.vid_stride = vid_stride
+        self.gate_threshold = gate_threshold
+        self.ledger = ledger
+        self.staged_bytes = 0
+        self.cache_hits = {}
+
+    def predict_source(self, sources):
+        """The predict() source for `sources`, all or part of this batch."""
+        return build_decoded_video_source(
+            sources,
+            self.decoders,
+            self.batch_size,
+            self.vid_stride,
+            self.gate_threshold,
+            self.ledger,
+        )
+
+    def cleanup(self):
+        pass
+
+
+def sweep_stale_staging_dirs(slots):
+    """
+    Remove staging directories orphaned by a previously killed container.
+
+    Called from the parent before any worker starts: a worker sweeping for
+    itself could delete a directory a sibling on the same device had just
+    staged.
+    """
     removed = 0
-    for stale in Path(gettempdir()).glob(f"{STAGING_PREFIX}{gpu_id}-*"):
-        shutil.rmtree(stale, ignore_errors=True)
-        removed += 1
+    for slot in slots:
+        for stale in Path(gettempdir()).glob(f"{STAGING_PREFIX}{slot.name}-*"):
+            shutil.rmtree(stale, ignore_errors=True)
+            removed += 1
     if removed:
-        eprint(f"GPU {gpu_id}: Removed {removed} stale staging directories")
+        eprint(f"Removed {removed} stale staging directories")
 
 
-def stage_batch_to_disk(files, src_root, gpu_id, convert_workers):
+def stage_batch_to_disk(files, src_root, slot, convert_workers):
     """
     Stage one batch into a fresh temporary directory.
 
     Runs on the prefetch thread. On any failure the partial directory is
     removed before propagating, so a failed batch cannot leak ~12 GB.
     """
-    tmpdir = Path(mkdtemp(prefix=f"{STAGING_PREFIX}{gpu_id}-"))
+    tmpdir = Path(mkdtemp(prefix=f"{STAGING_PREFIX}{slot.name}-"))
     try:
         converted_root = tmpdir / "converted"
         converted_root.mkdir()
 
         sources, source_to_file, staging_errors = stage_batch(
-            files, src_root, converted_root, convert_workers, gpu_id
+            files, src_root, converted_root, convert_workers, slot.label
         )
 
         listing = tmpdir / "sources.txt"
         listing.write_text("".join(f"{source}\n" for source in sources))
 
-        return StagedBatch(
+        staged = StagedBatch(
             files, tmpdir, listing, sources, source_to_file, staging_errors
         )
+        staged.staged_bytes = sum(
+            os.path.getsize(source)
+            for source in sources
+            if source != str(source_to_file[source])
+        )
+        return staged
     except BaseException:
         shutil.rmtree(tmpdir, ignore_errors=True)
         raise
 
 
-def run_staged_batch(model, staged, predict_kwargs, gpu_id, manifest_file, manifest_lock):
+def stage_batch_in_memory(
+    files, label, convert_workers, budget_bytes, batch_size, tiling=None
+):
+    """
+    Decode one batch of images into a FramePool on the prefetch thread.
+
+    Decoding stops once the pool reaches its budget; the rest of the batch is
+    decoded lazily by the loader. With one batch in flight and one in
+    prediction, image memory stays under roughly twice the budget.
+    """
+    pool = FramePool(budget_bytes)
+    workers = max(1, convert_workers)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(files), workers):
+            if pool.full():
+                break
+            window = [str(file_path) for file_path in files[start : start + workers]]
+            for source, frame in zip(window, executor.map(read_bgr, window)):
+                if frame is not None:
+                    pool.put(source, frame)
+
+    return MemoryStagedBatch(files, pool, batch_size, tiling)
+
+
+def run_staged_batch(
+    model,
+    staged,
+    predict_kwargs,
+    label,
+    manifest_file,
+    manifest_lock,
+    metrics,
+    sink=None,
+):
     """
     Run a single predict call over an already-staged batch.
 
     Ultralytics recomputes its "N labels saved" summary by globbing the whole
     output directory once per predict call, so batching files into one call is
-    what keeps that cost from scaling with the number of files. The batch is
-    handed over as a .txt listing rather than a Python list: a list source is
-    routed to LoadPilAndNumpy, which reads every image into memory and treats
-    the whole list as one GPU batch, while a .txt is expanded by
-    LoadImagesAndVideos with normal `batch` streaming and video support.
+    what keeps that cost from scaling with the number of files. A disk-staged
+    batch is handed over as a .txt listing rather than a Python list: a list
+    source is routed to LoadPilAndNumpy, which reads every image into memory
+    and treats the whole list as one GPU batch, while a .txt is expanded by
+    LoadImagesAndVideos with normal `batch` streaming and video support. A
+    memory-staged batch gets the same streaming through its own loader.
+
+    Detections collected by the sink are flushed before the batch's files are
+    marked complete, so the manifest never gets ahead of the detection output.
 
     Returns:
         tuple: (processed, errors)
@@ -346,58 +684,283 @@ def run_staged_batch(model, staged, predict_kwargs, gpu_id, manifest_file, manif
         return 0, errors
 
     try:
-        run_predict(model, str(staged.listing), predict_kwargs)
-        completed = [staged.source_to_file[source] for source in staged.sources]
+        predict_sources(model, staged, staged.sources, predict_kwargs, metrics, sink)
     except Exception as e:
-        eprint(
-            f"GPU {gpu_id}: Batch of {len(staged.sources)} files failed ({e}); "
-            "retrying file by file"
+        if len(staged.sources) > 1:
+            eprint(
+                f"{label}: Batch of {len(staged.sources)} files failed ({e}); "
+                "bisecting to isolate the failing files"
+            )
+        processed, bisect_errors = bisect_failed_batch(
+            model,
+            staged,
+            predict_kwargs,
+            label,
+            manifest_file,
+            manifest_lock,
+            metrics,
+            sink,
+            e,
         )
-        completed = []
-        for source in staged.sources:
-            file_path = staged.source_to_file[source]
-            try:
-                run_predict(model, source, predict_kwargs)
-                completed.append(file_path)
-            except Exception as file_error:
+        return processed, errors + bisect_errors
+
+    processed = complete_sources(
+        staged, staged.sources, manifest_file, manifest_lock, metrics, sink
+    )
+    return processed, errors
+
+
+def predict_sources(model, staged, sources, predict_kwargs, metrics, sink):
+    """One timed predict call over `sources` of a staged batch."""
+    source = staged.predict_source(sources)
+    with metrics.time("predict"):
+        frames = run_predict_into_sink(
+            model, source, predict_kwargs, sink, staged.source_to_file
+        )
+    metrics.count("frames", frames)
+    merger = getattr(source, "merger", None)
+    if merger is not None:
+        metrics.count("tiles", merger.tiles)
+    return frames
+
+
+def complete_sources(staged, sources, manifest_file, manifest_lock, metrics, sink):
+    """Flush the sink and mark the files behind `sources` complete."""
+    if sink is not None:
+        with metrics.time("detections_flush"):
+            sink.flush()
+    completed = [staged.source_to_file[source] for source in sources]
+    with metrics.time("manifest"):
+        mark_files_complete(manifest_file, completed, manifest_lock)
+    metrics.count("files", len(completed))
+    return len(completed)
+
+
+def complete_cache_hits(staged, manifest_file, manifest_lock, metrics, sink):
+    """
+    Write the cached detections of a batch's cache hits under their new paths
+    and mark those files complete, without staging or predicting them.
+    """
+    hits = staged.cache_hits
+    for file_path, table in hits.items():
+        sink.add_cached(file_path, table)
+    with metrics.time("detections_flush"):
+        sink.flush()
+    with metrics.time("manifest"):
+        mark_files_complete(manifest_file, list(hits), manifest_lock)
+    metrics.count("files", len(hits))
+    metrics.count("cache_hits", len(hits))
+    return len(hits)
+
+
+def bisect_failed_batch(
+    model,
+    staged,
+    predict_kwargs,
+    label,
+    manifest_file,
+    manifest_lock,
+    metrics,
+    sink,
+    error=None,
+):
+    """
+    Re-run a failed batch in halves until the failing files are isolated.
+
+    Retrying file by file costs one predict call, and its setup, per file:
+    a thousand calls to find one corrupt video. Splitting instead isolates k
+    bad files in roughly 2k*log2(n) calls. Each half that succeeds is marked
+    complete straight away, so a worker killed mid-bisection does not redo it.
+    `error` is the failed call's exception, reported when the batch was a
+    single file and so is isolated already.
+
+    Returns:
+        tuple: (processed, errors)
+    """
+    sources = staged.sources
+    if len(sources) == 1:
+        file_path = staged.source_to_file[sources[0]]
+        eprint(f"{label}: ERROR processing {file_path.name}: {error}")
+        return 0, 1
+    mid = len(sources) // 2
+    # Last in, first out: the left half is retried first, so files are still
+    # completed in listing order.
+    pending = [sources[mid:], sources[:mid]]
+    processed = 0
+    errors = 0
+
+    while pending:
+        part = pending.pop()
+        if not part:
+            continue
+        try:
+            predict_sources(model, staged, part, predict_kwargs, metrics, sink)
+        except Exception as e:
+            if len(part) == 1:
                 errors += 1
-                eprint(f"GPU {gpu_id}: ERROR processing {file_path.name}: {file_error}")
+                file_path = staged.source_to_file[part[0]]
+                eprint(f"{label}: ERROR processing {file_path.name}: {e}")
+            else:
+                mid = len(part) // 2
+                pending.extend([part[mid:], part[:mid]])
+            continue
+        processed += complete_sources(
+            staged, part, manifest_file, manifest_lock, metrics, sink
+        )
 
-    mark_files_complete(manifest_file, completed, manifest_lock)
-    return len(completed), errors
+    return processed, errors
 
 
-def process_files_on_gpu(
-    gpu_id,
-    files,
-    completed_files,
+def load_model(model_path):
+    """Load the YOLO model a worker predicts with. Benchmarks swap this out."""
+    from ultralytics import YOLO
+
+    return YOLO(model_path)
+
+
+def pin_to_cores(cores):
+    """Restrict this process, and the thread pools it starts, to `cores`."""
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    # Read by torch's OpenMP runtime when it is first imported.
+    os.environ["OMP_NUM_THREADS"] = str(len(cores))
+
+
+def process_files_on_device(
+    slot,
+    work_queue,
+    total_batches,
     manifest_file,
     manifest_lock,
     args,
     classes_list,
     embed_list,
+    progress_queue=None,
+    heartbeat=None,
+    initial_batches=None,
 ):
-    from ultralytics import YOLO
+    """
+    Worker loop: pull batches off the shared queue, stage, predict, record.
+
+    Per-batch progress goes to the parent as events on progress_queue rather
+    than as stderr lines; stderr is kept for start-up, errors and the summary.
+    A replacement for a stalled worker gets that worker's unfinished batches
+    as initial_batches and runs them before taking anything off the queue.
+    """
+    label = slot.label
+    progress = ProgressReporter(progress_queue, slot.name)
+    worker_watchdog.install(heartbeat)
+    initial_batches = deque(initial_batches or ())
+    if slot.cores:
+        pin_to_cores(slot.cores)
 
     try:
-        sweep_stale_staging_dirs(gpu_id)
+        if slot.cores:
+            import torch
 
-        eprint(f"GPU {gpu_id}: Loading model {args.model}...")
-        model = YOLO(args.model)
+            torch.set_num_threads(len(slot.cores))
+            eprint(f"{label}: Pinned to cores {','.join(map(str, slot.cores))}")
 
-        pending = [f for f in files if str(f) not in completed_files]
-        skipped = len(files) - len(pending)
-        eprint(
-            f"GPU {gpu_id}: Model loaded, processing {len(pending)} files "
-            f"({skipped} already complete)"
-        )
+        metrics = StageMetrics(args.project, slot.name)
+
+        eprint(f"{label}: Loading model {args.model}...")
+        with metrics.time("model_load"):
+            model = load_model(args.model)
+        eprint(f"{label}: Model loaded, pulling batches from the shared queue")
+        progress.send("ready")
 
-        predict_kwargs = build_predict_kwargs(gpu_id, args, classes_list, embed_list)
+        predict_kwargs = build_predict_kwargs(slot, args, classes_list, embed_list)
         src_root = Path(args.source_root)
-        files_per_call = max(1, args.files_per_call)
-        batches = list(batched(pending, files_per_call))
-        total_batches = len(batches)
+        completion = SharedCompletionIndex(manifest_file)
+        claims = None
+        if args.coordinate:
+            from coordination import ClaimBoard
+
+            claims = ClaimBoard(args.project, slot.name, args.claim_ttl)
+
+        # main() only leaves cache_dir set when detections are being saved.
+        cache = None
+        if args.cache_dir:
+            from result_cache import ResultCache
+
+            cache = ResultCache(
+                args.cache_dir,
+                int(args.cache_max_gb * 1024**3),
+                args.model,
+                {
+                    **predict_kwargs,
+                    "gate_threshold": args.gate_threshold,
+                    "gate_fill": args.gate_fill,
+                    "tile_size": args.tile_size,
+                    "tile_overlap": args.tile_overlap,
+                    "tile_merge_iou": args.tile_merge_iou,
+                },
+            )
+
+        # Videos never need converting, so only image runs stage in memory.
+        video_run = args.ext.lower() not in IMAGE_EXTS
+        stage_in_memory = args.staging_mode == "memory" and not video_run
+
+        # Frames are gated in the decoder processes; main() makes sure there
+        # are some.
+        ledger = None
+        if video_run and args.gate_threshold > 0:
+            from frame_gate import FrameLedger
+
+            ledger = FrameLedger()
+
+        sink = None
+        if args.save_detections:
+            if embed_list is not None:
+                eprint(f"{label}: --embed yields no boxes; not saving detections")
+            else:
+                from detection_sink import DetectionSink
+
+                sink = DetectionSink(
+                    args.project,
+                    predict_kwargs["name"],
+                    video_run,
+                    args.vid_stride,
+                    cache,
+                    ledger,
+                    args.gate_fill == "carry",
+                )
+
+        decoders = None
+        if video_run and args.decode_workers > 0:
+            from video_decode import DecoderPool
+
+            decoders = DecoderPool(args.decode_workers)
+            eprint(f"{label}: Decoding videos in {args.decode_workers} processes")
+            if ledger is not None:
+                eprint(
+                    f"{label}: Gating frames that change by less than "
+                    f"{args.gate_threshold} grey levels ({args.gate_fill} fill)"
+                )
+        if stage_in_memory:
+            staging_budget = args.staging_memory_mb * 1024 * 1024
+            eprint(
+                f"{label}: Staging images in memory "
+                f"({args.staging_memory_mb} MB per batch)"
+            )
+        # main() only allows tiling on image runs that stage in memory.
+        tiling = None
+        if args.tile_size > 0:
+            from tiling import Tiling
+
+            tiling = Tiling(
+                args.tile_size,
+                args.tile_overlap,
+                args.tile_merge_iou,
+                args.agnostic_nms,
+                args.max_det,
+            )
+            eprint(
+                f"{label}: Tiling images into {args.tile_size}px tiles "
+                f"({args.tile_overlap:.0%} overlap)"
+            )
 
+        claimed = 0
         processed = 0
         errors = 0
 
@@ -405,83 +968,217 @@ def process_files_on_gpu(
         # cv2 and CUDA both release the GIL, so the two genuinely overlap.
         # Depth is fixed at one: staging is faster than inference once it runs
         # concurrently, and each batch in flight costs ~12 MB per file on disk.
+        # It also bounds how much work a worker hoards from the shared queue.
         with ThreadPoolExecutor(
-            max_workers=1, thread_name_prefix=f"stage-gpu{gpu_id}"
+            max_workers=1, thread_name_prefix=f"stage-{slot.name}"
         ) as stager:
 
-            def submit(index):
-                if index >= total_batches:
-                    return None
-                return stager.submit(
-                    stage_batch_to_disk,
-                    batches[index],
-                    src_root,
-                    gpu_id,
-                    args.convert_workers,
-                )
+            def timed_stage(stage_fn, files, *stage_args):
+                """Runs on the stager thread. Cache hits are not staged at all."""
+                hits = {}
+                if cache is not None:
+                    with metrics.time("cache_lookup"):
+                        hits = cache.lookup(files)
+                    files = [f for f in files if f not in hits]
+                with metrics.time("stage"):
+                    staged = stage_fn(files, *stage_args)
+                staged.cache_hits = hits
+                metrics.count("bytes_staged", staged.staged_bytes)
+                return staged
+
+            def claim_next(wait=True):
+                """
+                Take the next batch off the queue and start staging it.
+                With wait=False, returns False instead of blocking on an
+                empty queue.
+                """
+                while True:
+                    if initial_batches:
+                        item = initial_batches.popleft()
+                    elif wait:
+                        # Waiting for work is not a stall.
+                        worker_watchdog.idle()
+                        with metrics.time("queue_wait"):
+                            item = work_queue.get()
+                        worker_watchdog.beat()
+                    else:
+                        try:
+                            item = work_queue.get_nowait()
+                        except queue.Empty:
+                            return False
+                    if item is None:
+                        # The parent hands this stop on to a replacement if
+                        # this worker stalls before it gets to exit.
+                        progress.send("drained")
+                        return None
+                    index, batch = item
+                    # Another run sharing this project may have finished some
+                    # of these files since the batch was queued.
+                    completion.refresh()
+                    pending = [f for f in batch if f not in completion]
+                    if claims is not None:
+                        # Files another node holds are that node's to finish.
+                        pending = claims.claim(pending)
+                        # A node may have finished and released some of them
+                        # between the check above and our claims.
+                        completion.refresh()
+                        done = [f for f in pending if f in completion]
+                        if done:
+                            claims.release(done)
+                            pending = [f for f in pending if f not in completion]
+                    if len(pending) < len(batch):
+                        progress.send("skipped", files=len(batch) - len(pending))
+                    progress.send("claimed", batch=index, files=len(pending))
+                    if pending:
+                        break
+                batch = [Path(file_path) for file_path in pending]
+                if decoders is not None:
+                    staging = stager.submit(
+                        timed_stage,
+                        DecodedVideoBatch,
+                        batch,
+                        decoders,
+                        args.batch,
+                        max(1, args.vid_stride),
+                        args.gate_threshold,
+                        ledger,
+                    )
+                elif stage_in_memory:
+                    staging = stager.submit(
+                        timed_stage,
+                        stage_batch_in_memory,
+                        batch,
+                        label,
+                        args.convert_workers,
+                        staging_budget,
+                        args.batch,
+                        tiling,
+                    )
+                else:
+                    staging = stager.submit(
+                        timed_stage,
+                        stage_batch_to_disk,
+                        batch,
+                        src_root,
+                        slot,
+                        args.convert_workers,
+                    )
+                return index, batch, staging
 
-            ahead = submit(0)
+            ahead = claim_next()
 
-            for index, batch in enumerate(batches, start=1):
-                eprint(
-                    f"GPU {gpu_id}: Batch {index}/{total_batches} ({len(batch)} files)..."
-                )
+            while ahead is not None:
+                if ahead is False:
+                    ahead = claim_next()
+                    continue
+                index, batch, staging = ahead
+                claimed += len(batch)
 
                 try:
-                    staged = ahead.result()
+                    # Time the GPU sits idle because staging has not caught up.
+                    with metrics.time("staging_wait"):
+                        staged = staging.result()
                 except Exception as e:
                     # A staging failure must not abort a multi-hour run.
-                    eprint(f"GPU {gpu_id}: ERROR staging batch {index}: {e}")
+                    eprint(
+                        f"{label}: ERROR staging batch "
+                        f"{batch_label(index, total_batches)}: {e}"
+                    )
                     errors += len(batch)
-                    ahead = submit(index)
+                    metrics.count("errors", len(batch))
+                    progress.send("batch", batch=index, errors=len(batch))
+                    if claims is not None:
+                        claims.release(batch)
+                    ahead = claim_next()
                     continue
 
-                # Kick off the next batch before touching the GPU; this call is
-                # what creates the overlap.
-                ahead = submit(index)
+                # Claim and stage the next batch before touching the GPU; this
+                # call is what creates the overlap. A watching daemon may have
+                # nothing queued yet and must not sit on this batch meanwhile.
+                ahead = claim_next(wait=not args.watch)
 
+                frames_before = metrics.value("frames")
+                gated_before = ledger.gated if ledger is not None else 0
                 try:
+                    cached = 0
+                    if staged.cache_hits:
+                        cached = complete_cache_hits(
+                            staged, manifest_file, manifest_lock, metrics, sink
+                        )
                     batch_processed, batch_errors = run_staged_batch(
                         model,
                         staged,
                         predict_kwargs,
-                        gpu_id,
+                        label,
                         manifest_file,
                         manifest_lock,
+                        metrics,
+                        sink,
                     )
+                    batch_processed += cached
                     processed += batch_processed
                     errors += batch_errors
+                    metrics.count("errors", batch_errors)
                 finally:
                     staged.cleanup()
-
-                eprint(
-                    f"GPU {gpu_id}: Batch {index}/{total_batches} done - "
-                    f"{processed}/{len(pending)} files complete, {errors} errors"
+                    if cache is not None:
+                        # Files that failed are never stored.
+                        cache.discard(batch)
+                    if claims is not None:
+                        claims.release(batch)
+                    if ledger is not None:
+                        # Entries left by a failed call, or with no sink to
+                        # consume them.
+                        ledger.clear()
+                        metrics.count("frames_gated", ledger.gated - gated_before)
+
+                metrics.count("batches")
+                metrics.write("batch", batch=index)
+                progress.send(
+                    "batch",
+                    batch=index,
+                    files=batch_processed,
+                    errors=batch_errors,
+                    frames=metrics.value("frames") - frames_before,
                 )
 
-        eprint(
-            f"GPU {gpu_id}: Finished - {processed} processed, "
-            f"{skipped} skipped, {errors} errors"
-        )
+        completion.close()
+        if claims is not None:
+            claims.close()
+        if decoders is not None:
+            decoders.close()
+        if sink is not None:
+            sink.close()
+            eprint(f"{label}: Wrote {sink.rows_written} detections to {sink.path}")
+        if cache is not None:
+            cache.close()
+            eprint(
+                f"{label}: {metrics.value('cache_hits')} files served from the result cache"
+            )
+        eprint(f"{label}: Finished - {processed} processed, {errors} errors")
+        metrics.write("finished", claimed=claimed, processed=processed, errors=errors)
+        progress.send("finished", processed=processed, errors=errors)
         if errors:
-            raise RuntimeError(f"GPU {gpu_id} had {errors} per-file errors")
-        if processed == 0 and pending:
+            raise RuntimeError(f"{label} had {errors} per-file errors")
+        if processed == 0 and claimed:
             raise RuntimeError(
-                f"GPU {gpu_id} processed 0 of {len(files)} assigned files"
+                f"{label} processed 0 of {claimed} claimed files"
             )
 
     except Exception as e:
-        eprint(f"GPU {gpu_id}: FATAL ERROR: {e}")
+        eprint(f"{label}: FATAL ERROR: {e}")
         raise
 
 
-def parse_args():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(
         description="Split dataset across GPUs and run YOLO predict in parallel."
     )
 
     parser.add_argument(
-        "device", type=str, help='GPU ids as comma-separated string, e.g. "0,1,2"'
+        "device",
+        type=str,
+        help='GPU ids and/or "cpu" as a comma-separated string, e.g. "0,1,2"',
     )
     parser.add_argument("agnostic_nms", type=parse_bool)
     parser.add_argument("iou", type=float)
@@ -545,24 +1242,341 @@ def parse_args():
         default=8,
         help="Threads used to stage 3-channel image copies before inference",
     )
+    parser.add_argument(
+        "--staging-mode",
+        choices=["disk", "memory"],
+        default="disk",
+        help=(
+            "How image batches are prepared for YOLO: 'disk' writes 3-channel copies "
+            "of non-3-channel images to a temporary directory and passes a .txt "
+            "listing; 'memory' decodes images into a bounded in-memory pool and "
+            "feeds them through a custom loader. Videos always use 'disk'"
+        ),
+    )
+    parser.add_argument(
+        "--staging-memory-mb",
+        type=int,
+        default=2048,
+        help="Decoded-image budget per batch in 'memory' staging mode",
+    )
+    parser.add_argument(
+        "--decode-workers",
+        type=int,
+        default=0,
+        help=(
+            "Decoder processes per worker for video runs. They decode only the frames "
+            "vid_stride keeps (MJPEG AVI chunks are decoded selectively; other codecs "
+            "skip with grab()) and pass them through shared memory. 0 leaves video "
+            "decoding to Ultralytics"
+        ),
+    )
+    parser.add_argument(
+        "--gate-threshold",
+        type=float,
+        default=0.0,
+        help=(
+            "Skip video frames whose downsampled grayscale differs from the last "
+            "inferred frame by less than this mean absolute difference (0-255 grey "
+            "levels); needs --decode-workers, and 0 disables gating"
+        ),
+    )
+    parser.add_argument(
+        "--gate-fill",
+        choices=["empty", "carry"],
+        default="empty",
+        help=(
+            "Detections for gated frames with --save-detections: 'empty' writes "
+            "none, 'carry' repeats the last inferred frame's detections"
+        ),
+    )
+    parser.add_argument(
+        "--tile-size",
+        type=int,
+        default=0,
+        help=(
+            "Cut images into overlapping square tiles of this many pixels and merge "
+            "their detections back into image coordinates; needs --save-detections. "
+            "Set imgsz to match. 0 runs whole images"
+        ),
+    )
+    parser.add_argument(
+        "--tile-overlap",
+        type=float,
+        default=0.2,
+        help="Fraction of a tile shared with each neighbouring tile",
+    )
+    parser.add_argument(
+        "--tile-merge-iou",
+        type=float,
+        default=0.5,
+        help="IoU above which boxes from overlapping tiles are merged by NMS",
+    )
+    parser.add_argument(
+        "--num-shards",
+        type=int,
+        default=1,
+        help=(
+            "Split the dataset into this many shards by a hash of each file's path "
+            "relative to the source root; this container only processes --shard-index"
+        ),
+    )
+    parser.add_argument("--shard-index", type=int, default=0)
+    parser.add_argument(
+        "--coordinate",
+        action="store_true",
+        help=(
+            "Share the work with other containers using the same --project through "
+            "claim files in <project>/.coordination, so a file is processed once"
+        ),
+    )
+    parser.add_argument(
+        "--claim-ttl",
+        type=float,
+        default=600,
+        help=(
+            "Seconds after which a claim or node registration that was not "
+            "refreshed is treated as left by a dead node"
+        ),
+    )
+    parser.add_argument(
+        "--node-name",
+        default=None,
+        help=(
+            "This container's name in a multi-node run; it prefixes worker names "
+            "and names its manifest journal, so keep it the same across runs. "
+            "Defaults to shard<index> when sharded; required with --coordinate"
+        ),
+    )
+    parser.add_argument(
+        "--workers-per-device",
+        type=int,
+        default=1,
+        help=(
+            "Model replicas per device. Each has its own staging thread and "
+            "gpu{id}-w{n} output name; on 'cpu', each is pinned to its share of cores"
+        ),
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=10,
+        help="Seconds between PROGRESS lines on stdout (run-wide throughput and ETA)",
+    )
+    parser.add_argument(
+        "--stall-timeout",
+        type=float,
+        default=1800,
+        help=(
+            "Seconds a busy worker may go without finishing a frame or image before "
+            "it is terminated and its unfinished files go to a replacement; 0 disables"
+        ),
+    )
+    parser.add_argument(
+        "--max-restarts",
+        type=int,
+        default=2,
+        help="Stalled-worker replacements per slot before its files are left for the next run",
+    )
+    parser.add_argument(
+        "--save-detections",
+        action="store_true",
+        help=(
+            "Append boxes, classes and confidences to per-worker Arrow files under "
+            "<project>/detections/ and merge them into <project>/detections.parquet"
+        ),
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help=(
+            "Directory of a result cache shared across runs. Files whose content, "
+            "weights and detection settings match a cached entry skip staging and "
+            "predict; their cached detections are written instead. Requires "
+            "--save-detections"
+        ),
+    )
+    parser.add_argument(
+        "--cache-max-gb",
+        type=float,
+        default=10,
+        help="Size cap of the result cache; least recently used entries are evicted",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help=(
+            "Run as a daemon: keep the model loaded, poll --source-root for new files "
+            "whose size has settled, and process them in batches of up to "
+            "--files-per-call until <project>/.watch/drain or stop appears"
+        ),
+    )
+    parser.add_argument(
+        "--watch-interval",
+        type=float,
+        default=5,
+        help="Seconds between --watch polls; a file is picked up once unchanged across two",
+    )
+    parser.add_argument(
+        "--stream-discovery",
+        action="store_true",
+        help=(
+            "Start GPU workers on the first validated batch instead of waiting for "
+            "the full directory walk and validation pass"
+        ),
+    )
 
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 
-def discover_files(args):
+def walk_media_files(src_root, ext):
+    """
+    Yield files under src_root ending in `ext`, depth first.
+
+    Entries are sorted within each directory, so the order is deterministic
+    without having to hold the whole tree in memory first. os.scandir reports
+    file types from the directory listing itself, which saves a stat per entry
+    on network filesystems. Symlinked directories are followed, except into a
+    directory the walk is already inside, which would loop forever.
+    """
+    try:
+        root = os.stat(src_root)
+    except OSError as e:
+        eprint(f"WARNING: Could not list {src_root}: {e}")
+        return
+    yield from _walk_media_dir(src_root, ext, {(root.st_dev, root.st_ino)})
+
+
+def _walk_media_dir(directory, ext, ancestors):
+    """walk_media_files() below `directory`; `ancestors` are (st_dev, st_ino)."""
+    try:
+        with os.scandir(directory) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+    except OSError as e:
+        eprint(f"WARNING: Could not list {directory}: {e}")
+        return
+
+    for entry in entries:
+        try:
+            if entry.is_dir():
+                stat = entry.stat()
+                key = (stat.st_dev, stat.st_ino)
+                if key in ancestors:
+                    eprint(f"WARNING: Skipping {entry.path}: symlink loop")
+                    continue
+                ancestors.add(key)
+                yield from _walk_media_dir(entry.path, ext, ancestors)
+                ancestors.discard(key)
+            elif entry.is_file() and entry.name.endswith(ext):
+                yield Path(entry.path)
+        except OSError as e:
+            eprint(f"WARNING: Could not inspect {entry.path}: {e}")
+
+
+def walk_shard_files(args):
+    """walk_media_files() restricted to this node's --shard-index."""
+    files = walk_media_files(args.source_root, args.ext)
+    if args.num_shards <= 1:
+        return files
+    from coordination import shard_of
+
     src_root = Path(args.source_root)
-    discovered_files = sorted([p for p in src_root.rglob(f"*{args.ext}") if p.is_file()])
+    return (
+        file_path
+        for file_path in files
+        if shard_of(relative_to_root(file_path, src_root), args.num_shards)
+        == args.shard_index
+    )
+
+
+def discover_files(args):
+    files = walk_shard_files(args)
     if args.max_files is not None:
-        discovered_files = discovered_files[: args.max_files]
-    return discovered_files
+        files = islice(files, args.max_files)
+    return list(files)
+
+
+def validate_one_file(file_path, validation_index=None):
+    """
+    Validate one file, reusing the cached outcome when its size and mtime match.
+
+    Returns:
+        tuple: (file_path, is_valid, reason, frame_count, index_row) where
+        index_row is the row to store in the validation index, or None when the
+        result came from the index or the file could not be stat'ed.
+    """
+    try:
+        stat = file_path.stat()
+    except Exception as e:
+        return file_path, False, f"unable to stat file: {e}", None, None
 
+    if validation_index is not None:
+        cached = validation_index.lookup(str(file_path), stat.st_size, stat.st_mtime_ns)
+        if cached is not None:
+            return (file_path, *cached, None)
 
-def validate_one_file(file_path):
     is_valid, reason, frame_count = validate_media_file(file_path)
-    return file_path, is_valid, reason, frame_count
+    index_row = (
+        str(file_path),
+        stat.st_size,
+        stat.st_mtime_ns,
+        is_valid,
+        reason,
+        frame_count,
+    )
+    return file_path, is_valid, reason, frame_count, index_row
+
+
+def iter_validated_files(files, workers, validation_index=None, stats=None):
+    """
+    Validate `files` on a thread pool, yielding (file_path, is_valid, reason,
+    frame_count) in input order.
+
+    Only a bounded window of files is in flight at once, so `files` can be a
+    lazy iterator that is still being produced. Fresh outcomes are flushed to
+    the validation index every VALIDATION_INDEX_FLUSH files; `stats`, if
+    given, counts how many results were served from the index.
+    """
+    window = max(1, workers) * 4
+    index_rows = []
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        files = iter(files)
+        exhausted = False
+
+        while True:
+            while not exhausted and len(in_flight) < window:
+                file_path = next(files, None)
+                if file_path is None:
+                    exhausted = True
+                    break
+                in_flight.append(
+                    executor.submit(validate_one_file, file_path, validation_index)
+                )
+            if not in_flight:
+                break
+
+            file_path, is_valid, reason, frame_count, index_row = (
+                in_flight.popleft().result()
+            )
+            if index_row is None:
+                if stats is not None:
+                    stats["cache_hits"] = stats.get("cache_hits", 0) + 1
+            elif validation_index is not None:
+                index_rows.append(index_row)
+                if len(index_rows) >= VALIDATION_INDEX_FLUSH:
+                    validation_index.record(index_rows)
+                    index_rows = []
+
+            yield file_path, is_valid, reason, frame_count
 
+    if validation_index is not None:
+        validation_index.record(index_rows)
 
-def validate_files(discovered_files, skip_validation, validation_workers):
+
+def validate_files(
+    discovered_files, skip_validation, validation_workers, validation_index=None
+):
     if skip_validation:
         eprint(f"Found {len(discovered_files)} files, skipping validation")
         return [(file_path, None) for file_path in discovered_files], 0
@@ -571,113 +1585,296 @@ def validate_files(discovered_files, skip_validation, validation_workers):
     eprint(f"Found {len(discovered_files)} files, validating with {workers} workers...")
     valid_files_with_metadata = []
     validation_skipped = 0
+    stats = {}
 
-    with ThreadPoolExecutor(max_workers=workers) as executor:
-        results = executor.map(validate_one_file, discovered_files)
+    results = iter_validated_files(discovered_files, workers, validation_index, stats)
+    for idx, (file_path, is_valid, reason, frame_count) in enumerate(results, start=1):
+        if idx % 10000 == 0:
+            eprint(f"Validated {idx}/{len(discovered_files)} files...")
 
-        for idx, (file_path, is_valid, reason, frame_count) in enumerate(results, start=1):
-            if idx % 10000 == 0:
-                eprint(f"Validated {idx}/{len(discovered_files)} files...")
+        if is_valid:
+            valid_files_with_metadata.append((file_path, frame_count))
+        else:
+            validation_skipped += 1
+            eprint(f"WARNING: Skipping {file_path}: {reason}")
 
-            if is_valid:
-                valid_files_with_metadata.append((file_path, frame_count))
-            else:
-                validation_skipped += 1
-                eprint(f"WARNING: Skipping {file_path}: {reason}")
+    if validation_index is not None:
+        cache_hits = stats.get("cache_hits", 0)
+        eprint(
+            f"Reused {cache_hits} cached validation results, "
+            f"probed {len(discovered_files) - cache_hits} new or changed files"
+        )
 
     return valid_files_with_metadata, validation_skipped
 
 
-def main():
-    args = parse_args()
+def start_discovery_thread(args):
+    """
+    Walk the source tree on a background thread, feeding a bounded queue.
 
-    gpu_ids = [d.strip() for d in args.device.split(",") if d.strip()]
-    if not gpu_ids:
-        eprint("No GPUs provided in --device (e.g. '0,1,2').")
-        return 2
+    The queue ends with a None sentinel. Its bound keeps the walker from racing
+    arbitrarily far ahead of validation on a fast local disk.
+    """
+    discovered = queue.Queue(maxsize=DISCOVERY_QUEUE_SIZE)
 
-    discovered_files = discover_files(args)
-    if not discovered_files:
-        eprint(f"No files found under {Path(args.source_root)} with extension {args.ext}")
-        return 3
+    def walk():
+        try:
+            files = walk_shard_files(args)
+            if args.max_files is not None:
+                files = islice(files, args.max_files)
+            for file_path in files:
+                discovered.put(file_path)
+        finally:
+            discovered.put(None)
 
-    valid_files_with_metadata, validation_skipped = validate_files(
-        discovered_files, args.skip_validation, args.validation_workers
-    )
-    if not valid_files_with_metadata:
-        eprint(
-            f"No valid media files found. All {len(discovered_files)} files were skipped."
-        )
-        return 3
+    threading.Thread(target=walk, name="discovery", daemon=True).start()
+    return discovered
 
-    if validation_skipped > 0:
-        eprint(
-            f"Validated: {len(valid_files_with_metadata)} valid files, "
-            f"{validation_skipped} skipped"
-        )
-    else:
-        eprint(f"Validated: All {len(valid_files_with_metadata)} files are valid")
 
-    project_path = Path(args.project)
-    project_path.mkdir(parents=True, exist_ok=True)
-    manifest_file = project_path / ".completed_files.txt"
+def stream_batches(
+    args, completion, validation_index, work_queue, workers, watchdog, progress, tracker
+):
+    """
+    Pipelined discovery: walk -> validate -> batch -> shared work queue.
 
-    eprint(f"Loading completion manifest from {manifest_file}...")
-    completed_files = load_completed_files(manifest_file)
+    Batches are consecutive runs of the deterministic walk order, cut at
+    files_per_call, so a rerun over the same tree produces the same batches.
+    GPU workers are already running and pick each batch up as soon as it is
+    queued. Each queued batch also grows the progress monitor's total.
 
-    files = [file_path for file_path, _ in valid_files_with_metadata]
-    already_complete = sum(1 for f in files if str(f) in completed_files)
+    The work queue is bounded, so discovery waits for the workers instead of
+    queueing the whole tree. While it waits it runs the stall watchdog, and
+    it stops once no worker is left to take a batch.
 
-    if already_complete == len(files):
-        eprint(f"All {len(files)} files already complete. Nothing to process.")
-        return 0
+    Returns:
+        dict of counters: discovered, complete, invalid, queued, batches.
+    """
+    discovered = start_discovery_thread(args)
+    stats = {"discovered": 0, "complete": 0, "invalid": 0, "queued": 0, "batches": 0}
+
+    def candidates():
+        while True:
+            file_path = discovered.get()
+            if file_path is None:
+                return
+            stats["discovered"] += 1
+            if stats["discovered"] % 10000 == 0:
+                eprint(
+                    f"Discovered {stats['discovered']} files, "
+                    f"{stats['batches']} batches queued..."
+                )
+            if str(file_path) in completion:
+                stats["complete"] += 1
+                continue
+            yield file_path
 
-    if already_complete > 0:
-        eprint(
-            f"Found {already_complete} already complete, "
-            f"will process {len(files) - already_complete} files"
-        )
+    if args.skip_validation:
+        validated = ((file_path, True, None, None) for file_path in candidates())
     else:
-        eprint(f"Processing all {len(files)} files")
+        workers = resolve_validation_workers(args.validation_workers, sys.maxsize)
+        validated = iter_validated_files(candidates(), workers, validation_index, stats)
 
-    num_workers = min(len(gpu_ids), len(files))
-    slices = chunk(files, num_workers)
-    classes_list = parse_int_list(args.classes)
-    embed_list = parse_int_list(args.embed)
+    files_per_call = max(1, args.files_per_call)
+    vid_stride = max(1, args.vid_stride)
+    batch = []
+    batch_cost = 0
 
-    ctx = get_context("spawn")
-    manifest_lock = ctx.Lock()
+    def put(item):
+        """Queue an item; False if every worker exited while the queue was full."""
+        while True:
+            try:
+                work_queue.put(item, timeout=WATCHDOG_INTERVAL_S)
+                return True
+            except queue.Full:
+                if not any(process.is_alive() for process in workers):
+                    return False
+                if watchdog is not None:
+                    watchdog.check(workers)
+
+    def queue_batch():
+        compact_completion_index(completion)
+        stats["batches"] += 1
+        tracker.queued(stats["batches"], batch)
+        if not put((stats["batches"], [str(f) for f in batch])):
+            return False
+        stats["queued"] += len(batch)
+        progress.expect(len(batch), batch_cost)
+        return True
 
-    eprint(f"Spawning {num_workers} GPU workers...")
-    workers = []
-    for idx in range(num_workers):
-        gpu_id = gpu_ids[idx]
-        file_subset = slices[idx]
-        if not file_subset:
-            continue
+    queued = True
+    try:
+        for file_path, is_valid, reason, frame_count in validated:
+            if not is_valid:
+                stats["invalid"] += 1
+                eprint(f"WARNING: Skipping {file_path}: {reason}")
+                continue
+            batch.append(file_path)
+            batch_cost += estimate_file_cost(frame_count, vid_stride)
+            if len(batch) >= files_per_call:
+                queued = queue_batch()
+                if not queued:
+                    break
+                batch = []
+                batch_cost = 0
+        if batch and queued:
+            queued = queue_batch()
+        if not queued:
+            eprint("ERROR: Every worker exited; stopping discovery")
+    finally:
+        for _ in workers:
+            if not put(None):
+                break
+
+    return stats
+
+
+def available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(cpu_count() or 1))
+
+
+def plan_worker_slots(device_ids, workers_per_device):
+    """
+    Expand --device and --workers-per-device into one slot per worker.
+
+    A GPU's replicas share the device and are named gpu{id}-w{n}; with one
+    worker per GPU the name stays gpu{id}, so existing output directories and
+    resumed runs keep working. A "cpu" device gets cpu-w{n} workers, each
+    pinned to its own contiguous share of the available cores.
+
+    Slots are interleaved across devices (every device's w0, then every w1,
+    ...) so that a run with fewer batches than slots still spreads over all
+    devices.
+    """
+    workers_per_device = max(1, workers_per_device)
+    cores = available_cores()
+    share = max(1, len(cores) // workers_per_device)
+
+    slots = []
+    for n in range(workers_per_device):
+        for device in device_ids:
+            if device.lower() == "cpu":
+                start = (n * share) % len(cores)
+                slots.append(
+                    WorkerSlot(
+                        "cpu", f"cpu-w{n}", f"CPU w{n}", cores[start : start + share]
+                    )
+                )
+            elif workers_per_device == 1:
+                slots.append(WorkerSlot(device, f"gpu{device}", f"GPU {device}", None))
+            else:
+                slots.append(
+                    WorkerSlot(device, f"gpu{device}-w{n}", f"GPU {device} w{n}", None)
+                )
+    return slots
+
+
+class WorkerGroup:
+    """
+    The worker processes of a run, one per slot, with the heartbeat array
+    they stamp. restart() replaces a slot's process, which is how the
+    watchdog recovers a stalled worker.
+    """
 
-        process = ctx.Process(
-            target=process_files_on_gpu,
+    def __init__(self, ctx, slots, worker_args):
+        self.ctx = ctx
+        self.slots = slots
+        self.worker_args = worker_args
+        self.stamps = ctx.Array("d", len(slots), lock=False)
+        self.processes = [self._start(index) for index in range(len(slots))]
+
+    def _start(self, index, initial_batches=None):
+        process = self.ctx.Process(
+            target=process_files_on_device,
             args=(
-                gpu_id,
-                file_subset,
-                completed_files,
-                manifest_file,
-                manifest_lock,
-                args,
-                classes_list,
-                embed_list,
+                self.slots[index],
+                *self.worker_args,
+                (self.stamps, index),
+                initial_batches,
             ),
         )
         process.start()
-        workers.append(process)
+        return process
+
+    def restart(self, index, initial_batches):
+        self.processes[index] = self._start(index, initial_batches)
+
+    def __iter__(self):
+        return iter(self.processes)
+
+    def __len__(self):
+        return len(self.processes)
+
 
+def spawn_workers(
+    ctx,
+    slots,
+    work_queue,
+    total_batches,
+    manifest_file,
+    manifest_lock,
+    args,
+    classes_list,
+    embed_list,
+    progress_queue,
+):
+    sweep_stale_staging_dirs(slots)
+    return WorkerGroup(
+        ctx,
+        slots,
+        (
+            work_queue,
+            total_batches,
+            manifest_file,
+            manifest_lock,
+            args,
+            classes_list,
+            embed_list,
+            progress_queue,
+        ),
+    )
+
+
+def make_watchdog(args, tracker, completion):
+    """The run's Watchdog, or None when --stall-timeout is 0."""
+    if args.stall_timeout <= 0:
+        return None
+    return worker_watchdog.Watchdog(
+        args.stall_timeout, args.max_restarts, tracker, completion, eprint
+    )
+
+
+def wait_for_workers(workers, work_queue, watchdog=None, completion=None):
     eprint(f"Waiting for {len(workers)} workers to complete...")
+    if watchdog is not None or completion is not None:
+        while any(process.is_alive() for process in workers):
+            if watchdog is not None:
+                watchdog.check(workers)
+            if completion is not None:
+                compact_completion_index(completion)
+            time.sleep(WATCHDOG_INTERVAL_S)
     exit_code = 0
     for process in workers:
         process.join()
         if process.exitcode != 0 and exit_code == 0:
             exit_code = process.exitcode
+    if watchdog is not None:
+        # Batches no worker was left to take, once slots were given up on.
+        while True:
+            try:
+                item = work_queue.get(timeout=0.1)
+            except queue.Empty:
+                break
+            if item is not None:
+                watchdog.abandoned += len(item[1])
+    if watchdog is not None and watchdog.abandoned:
+        eprint(f"{watchdog.abandoned} files were left unprocessed by stalled workers")
+        exit_code = exit_code or 1
+
+    # Batches left behind by a crashed worker must not keep the queue's feeder
+    # thread alive at interpreter exit.
+    work_queue.cancel_join_thread()
 
     if exit_code == 0:
         eprint("All workers completed successfully")
@@ -687,5 +1884,533 @@ def main():
     return exit_code
 
 
+def run_streaming(args, slots, project_path, manifest_file, completion, metrics):
+    """
+    Streaming mode: spawn every worker up front, then feed them batches as
+    the walk and validation produce them. Model loading, the directory walk and
+    the first predict calls all overlap.
+    """
+    classes_list = parse_int_list(args.classes)
+    embed_list = parse_int_list(args.embed)
+
+    ctx = get_context("spawn")
+    manifest_lock = ctx.Lock()
+    work_queue = ctx.Queue(maxsize=len(slots) * STREAM_QUEUE_BATCHES_PER_WORKER)
+    progress_queue = ctx.Queue()
+    tracker = worker_watchdog.BatchTracker()
+    progress = ProgressMonitor(
+        progress_queue, args.progress_interval, tracker.on_event
+    ).start()
+    watchdog = make_watchdog(args, tracker, completion)
+
+    eprint(
+        f"Spawning {len(slots)} workers, "
+        f"streaming discovery from {args.source_root}..."
+    )
+    workers = spawn_workers(
+        ctx,
+        slots,
+        work_queue,
+        None,
+        manifest_file,
+        manifest_lock,
+        args,
+        classes_list,
+        embed_list,
+        progress_queue,
+    )
+
+    validation_index = None
+    if not args.skip_validation:
+        validation_index = ValidationIndex(project_path / node_file(INDEX_FILENAME, args.node_name))
+    try:
+        # Walk, validation and queueing are interleaved here, so they are
+        # timed as one stage.
+        with metrics.time("streaming_discovery"):
+            stats = stream_batches(
+                args,
+                completion,
+                validation_index,
+                work_queue,
+                workers,
+                watchdog,
+                progress,
+                tracker,
+            )
+    finally:
+        if validation_index is not None:
+            validation_index.close()
+    progress.finalize_total()
+
+    eprint(
+        f"Discovery finished: {stats['discovered']} files found, "
+        f"{stats['complete']} already complete, {stats['invalid']} skipped as invalid, "
+        f"{stats['queued']} queued in {stats['batches']} batches"
+    )
+
+    metrics.count("files_discovered", stats["discovered"])
+    metrics.count("files_queued", stats["queued"])
+    with metrics.time("workers"):
+        exit_code = wait_for_workers(workers, work_queue, watchdog, completion)
+    progress.stop()
+    if exit_code != 0:
+        return exit_code
+    if stats["discovered"] == 0:
+        eprint(f"No files found under {Path(args.source_root)} with extension {args.ext}")
+        return 3
+    if stats["queued"] == 0 and stats["complete"] == 0:
+        eprint(f"No valid media files found. All {stats['invalid']} files were skipped.")
+        return 3
+    return 0
+
+
+def poll_stable_files(args, completion, settled, last_seen):
+    """
+    One watch poll: files not yet settled whose size and mtime match the
+    previous poll. A file still being copied in changes between polls and is
+    left for a later one.
+
+    `last_seen` maps path -> (size, mtime_ns) from the previous poll and is
+    replaced in place; `settled` holds paths queued or rejected but not yet
+    complete, and loses the ones the completion index now covers.
+    """
+    settled.difference_update([key for key in settled if key in completion])
+    seen = {}
+    stable = []
+    for file_path in walk_shard_files(args):
+        key = str(file_path)
+        if key in completion or key in settled:
+            continue
+        try:
+            stat = file_path.stat()
+        except OSError:
+            continue
+        seen[key] = (stat.st_size, stat.st_mtime_ns)
+        if stat.st_size > 0 and last_seen.get(key) == seen[key]:
+            stable.append(file_path)
+    last_seen.clear()
+    last_seen.update(seen)
+    return stable
+
+
+def run_watch(args, slots, project_path, manifest_file, completion, metrics):
+    """
+    Watch mode: spawn every worker once, so each loads its model once, then
+    queue new files as they settle under --source-root. Workers block on the
+    shared queue between arrivals with the model still resident.
+
+    Runs until a drain or stop request (see watch_control), or until a worker
+    dies. Files are queued at most once per daemon; ones that fail are left
+    for the next start, as in a batch run.
+    """
+    from watch_control import RUNNING, STOPPED, STOPPING, WatchControl
+
+    classes_list = parse_int_list(args.classes)
+    embed_list = parse_int_list(args.embed)
+
+    control = WatchControl(project_path)
+    control.clear_requests()
+    stop_requested = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_requested.set())
+
+    ctx = get_context("spawn")
+    manifest_lock = ctx.Lock()
+    work_queue = ctx.Queue()
+    progress_queue = ctx.Queue()
+    tracker = worker_watchdog.BatchTracker()
+    progress = ProgressMonitor(
+        progress_queue, args.progress_interval, tracker.on_event
+    ).start()
+    watchdog = make_watchdog(args, tracker, completion)
+
+    eprint(f"Spawning {len(slots)} workers, watching {args.source_root}...")
+    workers = spawn_workers(
+        ctx,
+        slots,
+        work_queue,
+        None,
+        manifest_file,
+        manifest_lock,
+        args,
+        classes_list,
+        embed_list,
+        progress_queue,
+    )
+
+    validation_index = None
+    if not args.skip_validation:
+        validation_index = ValidationIndex(project_path / node_file(INDEX_FILENAME, args.node_name))
+    validation_workers = resolve_validation_workers(args.validation_workers, sys.maxsize)
+    files_per_call = max(1, args.files_per_call)
+    vid_stride = max(1, args.vid_stride)
+    settled = set()
+    last_seen = {}
+    stats = {"polls": 0, "queued": 0, "invalid": 0, "batches": 0}
+    state = RUNNING
+
+    try:
+        while True:
+            state = STOPPING if stop_requested.is_set() else control.requested_state()
+            if state != RUNNING:
+                break
+            if not all(process.is_alive() for process in workers):
+                eprint("ERROR: A worker exited while watching; shutting down")
+                state = STOPPING
+                break
+            if watchdog is not None:
+                watchdog.check(workers)
+
+            with metrics.time("watch_poll"):
+                compact_completion_index(completion)
+                stable = poll_stable_files(args, completion, settled, last_seen)
+                settled.update(str(file_path) for file_path in stable)
+                if args.skip_validation:
+                    validated = ((file_path, True, None, None) for file_path in stable)
+                else:
+                    validated = iter_validated_files(
+                        stable, validation_workers, validation_index
+                    )
+                pending = []
+                for file_path, is_valid, reason, frame_count in validated:
+                    if is_valid:
+                        pending.append(
+                            (file_path, estimate_file_cost(frame_count, vid_stride))
+                        )
+                    else:
+                        stats["invalid"] += 1
+                        eprint(f"WARNING: Skipping {file_path}: {reason}")
+
+            for start in range(0, len(pending), files_per_call):
+                chunk = pending[start : start + files_per_call]
+                stats["batches"] += 1
+                tracker.queued(stats["batches"], [f for f, _ in chunk])
+                work_queue.put((stats["batches"], [str(f) for f, _ in chunk]))
+                progress.expect(len(chunk), sum(cost for _, cost in chunk))
+            if pending:
+                stats["queued"] += len(pending)
+                metrics.count("files_queued", len(pending))
+                eprint(f"Queued {len(pending)} new files")
+
+            stats["polls"] += 1
+            control.write_status(state, workers=len(workers), **stats)
+            stop_requested.wait(args.watch_interval)
+    finally:
+        if validation_index is not None:
+            validation_index.close()
+
+    if state == STOPPING:
+        # Unclaimed batches are dropped; their files are not in the manifest,
+        # so the next start queues them again.
+        dropped = 0
+        while True:
+            try:
+                item = work_queue.get(timeout=0.1)
+            except queue.Empty:
+                break
+            dropped += len(item[1])
+        eprint(f"Stop requested: dropped {dropped} queued files, finishing batches in hand")
+    else:
+        eprint("Drain requested: finishing every queued batch")
+    control.write_status(state, workers=len(workers), **stats)
+
+    progress.finalize_total()
+    for _ in workers:
+        work_queue.put(None)
+    with metrics.time("workers"):
+        exit_code = wait_for_workers(workers, work_queue, watchdog, completion)
+    progress.stop()
+    control.write_status(STOPPED, exit_code=exit_code, **stats)
+    return exit_code
+
+
+def main():
+    args = parse_args()
+
+    device_ids = [d.strip() for d in args.device.split(",") if d.strip()]
+    if not device_ids:
+        eprint("No devices provided in --device (e.g. '0,1,2' or 'cpu').")
+        return 2
+    slots = plan_worker_slots(device_ids, args.workers_per_device)
+
+    if args.num_shards < 1 or not 0 <= args.shard_index < args.num_shards:
+        eprint(f"--shard-index must be between 0 and {args.num_shards - 1}")
+        return 2
+    args.node_name = resolve_node_name(args)
+    if args.coordinate and args.node_name is None:
+        # A hostname would do, but a container's changes every run, and each
+        # new name leaves a journal that every later run has to load.
+        eprint("--coordinate needs --node-name, a name that stays the same across runs")
+        return 2
+    if args.node_name is not None:
+        if not re.fullmatch(r"[\w.-]+", args.node_name):
+            eprint(f"Invalid node name {args.node_name!r}; use letters, digits, '.', '-' and '_'")
+            return 2
+        # Nodes share the project directory, so their workers' output and
+        # metrics names must not collide.
+        slots = [
+            slot._replace(
+                name=f"{args.node_name}-{slot.name}",
+                label=f"{args.node_name} {slot.label}",
+            )
+            for slot in slots
+        ]
+        if args.num_shards > 1:
+            eprint(f"Node {args.node_name}: shard {args.shard_index} of {args.num_shards}")
+
+    if args.tile_size > 0:
+        reason = tiling_blocker(args)
+        if reason:
+            eprint(f"Cannot tile: {reason}")
+            return 2
+        if args.staging_mode != "memory":
+            eprint("Tiled inference stages images in memory; ignoring --staging-mode disk")
+            args.staging_mode = "memory"
+
+    if args.gate_threshold > 0 and args.decode_workers <= 0:
+        # Frames are gated inside the decoder processes.
+        eprint("WARNING: --gate-threshold needs --decode-workers; using 1")
+        args.decode_workers = 1
+
+    if args.cache_dir:
+        reason = result_cache_blocker(args)
+        if reason:
+            eprint(f"WARNING: Not using the result cache: {reason}")
+            args.cache_dir = None
+
+    project_path = Path(args.project)
+    project_path.mkdir(parents=True, exist_ok=True)
+    manifest_file = project_path / node_file(".completed_files.txt", args.node_name)
+
+    metrics = StageMetrics(
+        project_path, f"{args.node_name}-main" if args.node_name else "main"
+    )
+
+    roster = None
+    if args.node_name is not None:
+        from coordination import NodeRoster
+
+        roster = NodeRoster(project_path, args.node_name, args.claim_ttl)
+    still_running = []
+
+    eprint(f"Loading completion manifest from {manifest_file}...")
+    with metrics.time("manifest_load"):
+        completion = open_completion_index(manifest_file)
+    try:
+        exit_code = run_inference(
+            args, slots, project_path, manifest_file, completion, metrics
+        )
+    finally:
+        # Fold this run's appends in now so the next start-up stays fast.
+        completion.refresh()
+        if completion.needs_compaction():
+            completion.compact()
+        completion.close()
+        if roster is not None:
+            still_running = roster.leave()
+
+    if args.save_detections:
+        if still_running:
+            # The last node to finish merges everyone's parts.
+            eprint(
+                "Leaving the detection merge to the nodes still running: "
+                + ", ".join(still_running)
+            )
+        else:
+            with metrics.time("merge_detections"):
+                merge_detections(project_path)
+
+    metrics.write("finished", exit_code=exit_code)
+    eprint(f"Stage metrics written to {metrics.jsonl_path.parent}")
+    return exit_code
+
+
+# predict() outputs written per image or frame, outside --save-detections.
+PER_FILE_OUTPUTS = ("save", "save_txt", "save_crop", "save_frames", "visualize", "show")
+
+
+def resolve_node_name(args):
+    """This container's node name in a multi-node run, or None."""
+    if args.node_name:
+        return args.node_name
+    if args.num_shards > 1:
+        return f"shard{args.shard_index}"
+    return None
+
+
+def result_cache_blocker(args):
+    """
+    Why the result cache cannot be used with these arguments, or None.
+
+    A cache hit only brings back detection rows, so any other per-file output
+    would silently be missing for the files that hit.
+    """
+    if not args.save_detections:
+        return "it needs --save-detections"
+    if parse_int_list(args.embed) is not None:
+        return "embed yields no detections"
+    for flag in PER_FILE_OUTPUTS:
+        if getattr(args, flag):
+            return f"{flag} output cannot be reproduced from cached detections"
+    return None
+
+
+def tiling_blocker(args):
+    """
+    Why tiled inference cannot run with these arguments, or None.
+
+    Only the merged boxes are in image coordinates. Ultralytics' own outputs
+    would be written once per tile, so --save-detections is the only output.
+    """
+    if args.ext.lower() not in IMAGE_EXTS:
+        return "only images are tiled"
+    if not 0 <= args.tile_overlap < 1:
+        return "--tile-overlap must be at least 0 and below 1"
+    if not args.save_detections:
+        return "it needs --save-detections"
+    if parse_int_list(args.embed) is not None:
+        return "embed yields no detections"
+    for flag in PER_FILE_OUTPUTS:
+        if getattr(args, flag):
+            return f"{flag} output would be written per tile"
+    return None
+
+
+def merge_detections(project_path):
+    """Merge every worker's detection parts, including earlier runs', into one file."""
+    from detection_sink import MERGED_FILENAME, merge_detection_parts
+
+    eprint("Merging detection parts...")
+    merged = merge_detection_parts(project_path)
+    if merged is None:
+        eprint("No detection parts to merge")
+        return
+    parts, rows = merged
+    eprint(f"Merged {rows} detections from {parts} parts into {project_path / MERGED_FILENAME}")
+
+
+def run_inference(args, slots, project_path, manifest_file, completion, metrics):
+    if args.watch:
+        return run_watch(args, slots, project_path, manifest_file, completion, metrics)
+    if args.stream_discovery:
+        return run_streaming(
+            args, slots, project_path, manifest_file, completion, metrics
+        )
+
+    with metrics.time("discovery"):
+        discovered_files = discover_files(args)
+    metrics.count("files_discovered", len(discovered_files))
+    if not discovered_files:
+        eprint(f"No files found under {Path(args.source_root)} with extension {args.ext}")
+        return 3
+
+    # Completed files are skipped before validation so a resumed run does not
+    # pay an OpenCV probe for work it will never schedule.
+    candidate_files = [f for f in discovered_files if str(f) not in completion]
+    already_complete = len(discovered_files) - len(candidate_files)
+
+    if not candidate_files:
+        eprint(f"All {len(discovered_files)} files already complete. Nothing to process.")
+        return 0
+
+    if already_complete > 0:
+        eprint(
+            f"Found {already_complete} already complete, "
+            f"will process up to {len(candidate_files)} files"
+        )
+
+    validation_index = None
+    if not args.skip_validation:
+        validation_index = ValidationIndex(project_path / node_file(INDEX_FILENAME, args.node_name))
+    try:
+        with metrics.time("validation"):
+            valid_files_with_metadata, validation_skipped = validate_files(
+                candidate_files,
+                args.skip_validation,
+                args.validation_workers,
+                validation_index,
+            )
+    finally:
+        if validation_index is not None:
+            validation_index.close()
+
+    if not valid_files_with_metadata:
+        if already_complete > 0:
+            eprint(
+                f"All {already_complete} valid files already complete. "
+                "Nothing to process."
+            )
+            return 0
+        eprint(
+            f"No valid media files found. All {len(candidate_files)} files were skipped."
+        )
+        return 3
+
+    if validation_skipped > 0:
+        eprint(
+            f"Validated: {len(valid_files_with_metadata)} valid files, "
+            f"{validation_skipped} skipped"
+        )
+    else:
+        eprint(f"Validated: All {len(valid_files_with_metadata)} files are valid")
+
+    vid_stride = max(1, args.vid_stride)
+    pending = [
+        (file_path, estimate_file_cost(frame_count, vid_stride))
+        for file_path, frame_count in valid_files_with_metadata
+    ]
+
+    planned = plan_batches(pending, max(1, args.files_per_call), len(slots))
+    batches = [batch for _, batch in planned]
+    num_workers = min(len(slots), len(batches))
+
+    loads = predict_worker_loads([cost for cost, _ in planned], num_workers)
+    total_cost = sum(cost for cost, _ in planned)
+    eprint(
+        f"Predicted load: {total_cost} frames after vid_stride={vid_stride} "
+        f"across {len(batches)} batches (largest {planned[0][0]})"
+    )
+    for slot, (load, count) in zip(slots, loads):
+        share = load / total_cost * 100 if total_cost else 0
+        eprint(f"  {slot.label}: {load} frames in {count} batches ({share:.1f}%)")
+
+    classes_list = parse_int_list(args.classes)
+    embed_list = parse_int_list(args.embed)
+
+    ctx = get_context("spawn")
+    manifest_lock = ctx.Lock()
+    work_queue = ctx.Queue()
+    tracker = worker_watchdog.BatchTracker()
+    enqueue_batches(work_queue, batches, num_workers, tracker)
+    progress_queue = ctx.Queue()
+    progress = ProgressMonitor(progress_queue, args.progress_interval, tracker.on_event)
+    progress.expect(sum(len(batch) for batch in batches), total_cost)
+    progress.finalize_total()
+    progress.start()
+
+    eprint(
+        f"Spawning {num_workers} workers to share {len(batches)} batches..."
+    )
+    workers = spawn_workers(
+        ctx,
+        slots[:num_workers],
+        work_queue,
+        len(batches),
+        manifest_file,
+        manifest_lock,
+        args,
+        classes_list,
+        embed_list,
+        progress_queue,
+    )
+
+    metrics.count("files_queued", sum(len(batch) for batch in batches))
+    with metrics.time("workers"):
+        exit_code = wait_for_workers(
+            workers, work_queue, make_watchdog(args, tracker, completion), completion
+        )
+    progress.stop()
+    return exit_code
+
+
 if __name__ == "__main__":
     sys.exit(main())
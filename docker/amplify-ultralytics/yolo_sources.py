@@ -0,0 +1,244 @@
+"""
+In-memory sources for model.predict() in yolo_inference.py.
+
+Ultralytics treats an instance of one of its own loader classes as an
+in-memory source and iterates it as-is (check_source / load_inference_source
+in ultralytics.data.build). Subclassing LoadImagesAndVideos therefore lets us
+hand predict() frames we decoded ourselves while keeping normal `batch`
+streaming, which a plain list source would not: a list is routed to
+LoadPilAndNumpy and treated as one GPU batch.
+
+Videos can be served the same way from a video_decode.DecoderPool, which
+decodes only the frames vid_stride keeps, in processes of its own, and large
+images as overlapping tiles (see tiling).
+
+The loader classes are built on first use because importing ultralytics
+pulls in torch, which only the GPU worker processes should pay for.
+"""
+import cv2
+
+_loader_classes = {}
+
+
+def read_bgr(path):
+    """Decode any supported image as 8-bit, 3-channel BGR, or None."""
+    return cv2.imread(str(path), cv2.IMREAD_COLOR)
+
+
+class FramePool:
+    """
+    Decoded BGR images keyed by source path, capped at a byte budget.
+
+    The staging thread fills a pool before the batch is handed over, and the
+    loader drains it on the GPU thread afterwards, so the two never touch a
+    pool at the same time. Images that did not fit the budget are decoded on
+    demand by take().
+    """
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.nbytes = 0
+        self._frames = {}
+
+    def full(self):
+        return self.nbytes >= self.budget_bytes
+
+    def put(self, path, frame):
+        self._frames[path] = frame
+        self.nbytes += frame.nbytes
+
+    def take(self, path):
+        frame = self._frames.pop(path, None)
+        if frame is None:
+            return read_bgr(path)
+        self.nbytes -= frame.nbytes
+        return frame
+
+    def clear(self):
+        self._frames.clear()
+        self.nbytes = 0
+
+
+def _memory_image_loader_class():
+    if "images" in _loader_classes:
+        return _loader_classes["images"]
+
+    from ultralytics.data.loaders import LoadImagesAndVideos, SourceTypes
+    from ultralytics.utils import LOGGER
+
+    class InMemoryImages(LoadImagesAndVideos):
+        """
+        Images served from a FramePool, `batch` at a time.
+
+        LoadImagesAndVideos.__init__ is deliberately not called: it would
+        rescan every path on disk. The attributes the predictor reads (bs,
+        mode, source_type, ...) are set here instead.
+        """
+
+        def __init__(self, paths, pool, batch):
+            self.files = list(paths)
+            self.nf = len(self.files)
+            self.ni = self.nf
+            self.video_flag = [False] * self.nf
+            self.mode = "image"
+            self.vid_stride = 1
+            self.bs = batch
+            self.cv2_flag = cv2.IMREAD_COLOR
+            self.cap = None
+            self.count = 0
+            self.source_type = SourceTypes()
+            self.pool = pool
+
+        def __next__(self):
+            paths, imgs, info = [], [], []
+            while len(imgs) < self.bs and self.count < self.nf:
+                path = self.files[self.count]
+                self.count += 1
+                im0 = self.pool.take(path)
+                if im0 is None:
+                    LOGGER.warning(f"Image Read Error {path}")
+                    continue
+                paths.append(path)
+                imgs.append(im0)
+                info.append(f"image {self.count}/{self.nf} {path}: ")
+            if not imgs:
+                raise StopIteration
+            return paths, imgs, info
+
+    _loader_classes["images"] = InMemoryImages
+    return InMemoryImages
+
+
+def build_memory_source(paths, pool, batch):
+    """A predict() source over `paths`, served from `pool` where possible."""
+    return _memory_image_loader_class()(paths, pool, max(1, batch))
+
+
+def _tiled_image_loader_class():
+    if "tiles" in _loader_classes:
+        return _loader_classes["tiles"]
+
+    from ultralytics.utils import LOGGER
+
+    class TiledImages(_memory_image_loader_class()):
+        """
+        Tiles of images served from a FramePool, `batch` at a time; a batch
+        may span images. Every tile handed out is recorded with `merger`,
+        which maps the results back to whole images (see tiling).
+        """
+
+        def __init__(self, paths, pool, batch, tiling, merger):
+            super().__init__(paths, pool, batch)
+            self.merger = merger
+            self._tiles = self._iter_tiles(tiling)
+
+        def _iter_tiles(self, tiling):
+            size = tiling.tile_size
+            for index, path in enumerate(self.files):
+                self.count = index + 1
+                im0 = self.pool.take(path)
+                if im0 is None:
+                    LOGGER.warning(f"Image Read Error {path}")
+                    continue
+                origins = tiling.origins(*im0.shape[:2])
+                for n, (x0, y0) in enumerate(origins, 1):
+                    self.merger.record(path, x0, y0, n == len(origins), im0.shape)
+                    yield (
+                        path,
+                        im0[y0 : y0 + size, x0 : x0 + size],
+                        f"image {index + 1}/{self.nf} {path} tile {n}/{len(origins)}: ",
+                    )
+
+        def __next__(self):
+            paths, imgs, info = [], [], []
+            for path, tile, tile_info in self._tiles:
+                paths.append(path)
+                imgs.append(tile)
+                info.append(tile_info)
+                if len(imgs) >= self.bs:
+                    break
+            if not imgs:
+                raise StopIteration
+            return paths, imgs, info
+
+    _loader_classes["tiles"] = TiledImages
+    return TiledImages
+
+
+def build_tiled_source(paths, pool, batch, tiling):
+    """
+    A predict() source over tiles of the images `paths`. Its `merger`
+    turns the call's results back into one result per image.
+    """
+    return _tiled_image_loader_class()(
+        paths, pool, max(1, batch), tiling, tiling.merger()
+    )
+
+
+def _decoded_video_loader_class():
+    if "videos" in _loader_classes:
+        return _loader_classes["videos"]
+
+    from ultralytics.data.loaders import LoadImagesAndVideos, SourceTypes
+
+    class DecodedVideos(LoadImagesAndVideos):
+        """
+        Kept video frames produced by a video_decode.DecoderPool, `batch` at
+        a time. Like Ultralytics' loader, a batch may span videos. The info
+        strings keep its "(frame n/N)" form, which the predictor parses for
+        save_txt and save_frames names.
+
+        Frames the decoders' gate dropped are not returned; with a ledger,
+        every kept frame is recorded there in order, gated or not.
+        """
+
+        def __init__(self, paths, decoders, batch, vid_stride, gate_threshold, ledger):
+            self.files = list(paths)
+            self.nf = len(self.files)
+            self.ni = 0
+            self.video_flag = [True] * self.nf
+            self.mode = "video"
+            self.vid_stride = vid_stride
+            self.bs = batch
+            self.cv2_flag = cv2.IMREAD_COLOR
+            self.cap = None
+            self.count = 0
+            self.frame = 0
+            self.frames = 0
+            self.fps = 30
+            self.source_type = SourceTypes()
+            self.ledger = ledger
+            self._frames = decoders.frames(self.files, vid_stride, gate_threshold)
+
+        def __next__(self):
+            paths, imgs, info = [], [], []
+            for index, path, im0, kept, total, fps in self._frames:
+                self.count, self.frame, self.frames = index, kept, total
+                # The predictor's video writer needs an integer rate.
+                self.fps = int(fps) or 30
+                if self.ledger is not None:
+                    self.ledger.record(path, kept, im0 is None)
+                if im0 is None:
+                    continue
+                paths.append(path)
+                imgs.append(im0)
+                info.append(
+                    f"video {index + 1}/{self.nf} (frame {kept}/{total}) {path}: "
+                )
+                if len(imgs) >= self.bs:
+                    break
+            if not imgs:
+                raise StopIteration
+            return paths, imgs, info
+
+    _loader_classes["videos"] = DecodedVideos
+    return DecodedVideos
+
+
+def build_decoded_video_source(
+    paths, decoders, batch, vid_stride, gate_threshold=0, ledger=None
+):
+    """A predict() source over the videos `paths`, decoded by `decoders`."""
+    return _decoded_video_loader_class()(
+        paths, decoders, max(1, batch), max(1, vid_stride), gate_threshold, ledger
+    )
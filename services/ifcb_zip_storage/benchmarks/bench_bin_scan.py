@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark: locating bins per worker vs. resolving them in one scan.
+
+Generates a synthetic IFCB data directory (year/day directories of tiny
+.adc/.hdr/.roi triples) and times the two ways process_ifcb_zips.py can hand
+a bin to a worker:
+
+- lookup: the old path. The parent lists bin PIDs, and each worker builds
+  DataDirectory(data_dir) and resolves dd[pid], which searches the tree.
+- items:  scan_bins() resolves every bin's paths in one walk, and each worker
+  opens its fileset straight from its BinWorkItem with open_bin().
+
+Both open each bin's header so the fileset is really read, not just located.
+Lookups cost roughly the size of the tree each, so only a sample of bins is
+timed and the total is extrapolated; pass --sample 0 to time every bin.
+
+Needs pyifcb and amplify-storage-utils installed (see requirements.txt).
+
+Usage:
+    python3 benchmarks/bench_bin_scan.py [--bins 50000] [--bins-per-day 100]
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from ifcb.data.files import DataDirectory  # noqa: E402
+from process_ifcb_zips import open_bin, scan_bins  # noqa: E402
+
+HDR = "softwareVersion: Imaging FlowCytobot Acquire 3.0\nrunTime: 1200.0\n"
+ADC = "1,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0\n"
+START = datetime(2020, 1, 1)
+
+
+def generate_tree(root, bins, bins_per_day):
+    """Write `bins` filesets, `bins_per_day` per day directory, under root."""
+    step = timedelta(seconds=86400 // bins_per_day)
+    for i in range(bins):
+        day, slot = divmod(i, bins_per_day)
+        stamp = START + timedelta(days=day) + slot * step
+        directory = Path(root) / f"{stamp:%Y}" / f"D{stamp:%Y%m%d}"
+        directory.mkdir(parents=True, exist_ok=True)
+        base = directory / f"D{stamp:%Y%m%dT%H%M%S}_IFCB101"
+        base.with_suffix(".hdr").write_text(HDR)
+        base.with_suffix(".adc").write_text(ADC)
+        base.with_suffix(".roi").write_bytes(b"\0" * 64)
+
+
+def touch(fileset_bin):
+    with open(fileset_bin.fileset.hdr_path) as f:
+        f.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--bins", type=int, default=50000, help="Bins in the synthetic tree")
+    parser.add_argument("--bins-per-day", type=int, default=100, help="Bins per day directory")
+    parser.add_argument("--sample", type=int, default=20, help="Bins timed on the lookup path")
+    parser.add_argument("--root", default=None, help="Reuse or keep a tree here instead of a temporary one")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-bins-") as tmp:
+        root = Path(args.root or tmp)
+        if not any(root.glob("*/D*")):
+            print(f"Generating {args.bins} bins under {root}...")
+            start = time.perf_counter()
+            generate_tree(root, args.bins, args.bins_per_day)
+            print(f"  generated in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        items = list(scan_bins(str(root)))
+        scan_s = time.perf_counter() - start
+        start = time.perf_counter()
+        for item in items:
+            touch(open_bin(item))
+        open_s = time.perf_counter() - start
+        bins = len(items)
+
+        sample = items if args.sample <= 0 else random.Random(0).sample(items, min(args.sample, bins))
+        start = time.perf_counter()
+        for item in sample:
+            touch(DataDirectory(str(root))[item.pid])
+        lookup_per_bin = (time.perf_counter() - start) / len(sample)
+        lookup_s = scan_s + lookup_per_bin * bins
+
+        print(f"{'path':<8} {'scan s':>8} {'per bin ms':>11} {'total s':>10}")
+        print(f"{'lookup':<8} {scan_s:>8.1f} {lookup_per_bin * 1000:>11.2f} {lookup_s:>10.1f}")
+        print(f"{'items':<8} {scan_s:>8.1f} {open_s / bins * 1000:>11.2f} {scan_s + open_s:>10.1f}")
+        print(f"{bins} bins; lookup total extrapolated from {len(sample)} bins, "
+              f"{lookup_s / (scan_s + open_s):.0f}x slower")
+
+
+if __name__ == "__main__":
+    main()
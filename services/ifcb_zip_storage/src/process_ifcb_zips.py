@@ -3,17 +3,52 @@
 Process IFCB data directory and upload ZIPs to object storage with multiprocessing.
 
 This script:
-1. Reads IFCB data using pyifcb DataDirectory
-2. Converts each fileset to ZIP format using bin2zip_stream (in parallel)
-3. Uploads ZIP buffers to object store defined by YAML configuration (in parallel)
+1. Scans the IFCB data directory once with pyifcb DataDirectory, resolving
+   each bin's .adc/.hdr/.roi paths into a BinWorkItem
+2. Converts each fileset to ZIP format using bin2zip_stream in a process pool,
+   opening it straight from its work item's paths
+3. Uploads the ZIP buffers to the object store defined by YAML configuration
+   from a single asyncio uploader in the main process
+
+Zipping is CPU-bound and uploading is network-bound, so the two stages are
+sized separately: num_workers zip processes, and upload_concurrency PUTs in
+flight over one store connection. ZIP buffers wait for the uploader in a
+queue bounded by bytes rather than by count. Each bin reserves its source
+size before it is zipped, the reservation is corrected to the ZIP's real size,
+and it is released when the upload ends. Memory therefore stays near
+buffer_mb however far the zip stage runs ahead of the uploads.
+
+The directory scan is consumed lazily, and at most tasks_per_worker bins
+per zip process are submitted at a time. A new bin is submitted only as
+an earlier one finishes zipping. Neither the bin list nor the pending tasks
+grow with the size of the archive. If a zip process dies (for instance
+when it is OOM-killed) the pool is broken: no more bins are submitted, the
+bins already zipped are uploaded, and the run fails.
+
+With --state-file, runs are incremental. The state file, a SQLite database
+keyed by bin pid, records for every bin uploaded the size and mtime of each
+of its raw files. Bins whose files have not changed since then are skipped
+without being zipped. Each bin is looked up as the scan reaches it, so the
+state is never loaded into memory as a whole. The summary
+counts new bins and changed bins (re-uploaded over an earlier upload)
+separately. The object store API exposes no ETags, so the state records
+the uploaded ZIP's size in their place.
+
+The run ends with one line on stdout, SUMMARY followed by a JSON object of
+its counts, for the Prefect task to report.
 """
 import argparse
 import asyncio
+import json
 import logging
+import os
+import sqlite3
 import sys
 import time
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from ifcb.data.files import DataDirectory
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from ifcb.data.files import DataDirectory, Fileset, FilesetBin
 from ifcb.data.zip import bin2zip_stream
 from storage.config_builder import StoreFactory
 
@@ -24,126 +59,458 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# One bin to zip and upload, as resolved by the directory scan. Workers open
+# the fileset from these paths, so they never have to search data_dir.
+BinWorkItem = namedtuple('BinWorkItem', 'pid adc_path hdr_path roi_path')
 
-def process_single_bin(data_dir: str, bin_pid: str, storage_yaml: str) -> tuple:
+
+def scan_bins(data_dir: str):
     """
-    Worker function to process a single bin: zip and upload.
+    Walk the IFCB data directory once, yielding a BinWorkItem per bin.
 
     Args:
         data_dir: Path to IFCB data directory
-        bin_pid: Bin PID to process
-        storage_yaml: Path to storage YAML config
+    """
+    for fileset_bin in DataDirectory(data_dir):
+        fileset = fileset_bin.fileset
+        yield BinWorkItem(
+            str(fileset_bin.pid),
+            fileset.adc_path,
+            fileset.hdr_path,
+            fileset.roi_path
+        )
+
+
+def open_bin(item: BinWorkItem) -> FilesetBin:
+    """Open a work item's fileset directly from its resolved paths."""
+    return FilesetBin(Fileset(os.path.splitext(item.hdr_path)[0]))
+
+
+def source_stats(item: BinWorkItem):
+    """[size, mtime_ns] of each of a bin's raw files; None if any cannot be stat'ed."""
+    try:
+        return [
+            [st.st_size, st.st_mtime_ns]
+            for st in (os.stat(path) for path in (item.adc_path, item.hdr_path, item.roi_path))
+        ]
+    except OSError:
+        return None
+
+
+def next_with_stats(items):
+    """
+    Next (BinWorkItem, source_stats) from an iterator of work items, or None
+    once it is exhausted. Blocks on the directory scan, so it runs off the
+    event loop.
+    """
+    item = next(items, None)
+    if item is None:
+        return None
+    return (item, source_stats(item))
+
+
+def buffer_size(buffer) -> int:
+    """Bytes held by a ZIP buffer from bin2zip_stream."""
+    if hasattr(buffer, 'getbuffer'):
+        return buffer.getbuffer().nbytes
+    return len(buffer)
+
+
+def zip_single_bin(item: BinWorkItem) -> tuple:
+    """
+    Worker function to zip a single bin.
+
+    Args:
+        item: Bin to zip, as resolved by scan_bins()
 
     Returns:
-        tuple: (bin_pid, success: bool, error_message: str or None)
+        tuple: (bin_pid, ZIP buffer or None, error_message: str or None)
     """
     try:
-        # Recreate DataDirectory and get the fileset by PID
-        dd = DataDirectory(data_dir)
-        fileset_bin = dd[bin_pid]
+        return (item.pid, bin2zip_stream(open_bin(item)), None)
+    except Exception as e:
+        return (item.pid, None, str(e))
+
+
+class UploadState:
+    """
+    Incremental mode's record of uploaded bins: a SQLite table of pid ->
+    (source_stats() as JSON, ZIP size). Entries are committed as uploads
+    finish, so an interrupted run keeps what it uploaded.
 
-        # Generate ZIP stream
-        buffer = bin2zip_stream(fileset_bin)
+    A state file in the earlier JSON-lines format is converted on open;
+    lines that are torn or lack a pid are skipped.
+    """
 
-        # Object key is bin name with .zip extension
-        key = f"{bin_pid}.zip"
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.exists(path) and not self._is_sqlite(path):
+            self._convert_json_lines(path)
+        self._conn = self._connect(path)
+
+    @staticmethod
+    def _is_sqlite(path: str) -> bool:
+        with open(path, 'rb') as f:
+            header = f.read(16)
+        return not header or header == b'SQLite format 3\0'
+
+    @staticmethod
+    def _connect(path: str):
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS uploads ("
+            " pid TEXT PRIMARY KEY,"
+            " files TEXT NOT NULL,"
+            " zip_bytes INTEGER NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        conn.commit()
+        return conn
+
+    def _convert_json_lines(self, path: str):
+        tmp_path = f"{path}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn = self._connect(tmp_path)
+        converted = skipped = 0
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    row = (entry['pid'], json.dumps(entry['files']), entry['zip_bytes'])
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    skipped += 1
+                    continue
+                conn.execute(
+                    "INSERT OR REPLACE INTO uploads (pid, files, zip_bytes) VALUES (?, ?, ?)",
+                    row
+                )
+                converted += 1
+        conn.commit()
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+        os.replace(tmp_path, path)
+        logger.info(
+            f"Converted {converted} entries of {path} to SQLite"
+            + (f", skipping {skipped} malformed lines" if skipped else "")
+        )
+
+    def __len__(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM uploads").fetchone()
+        return count
+
+    def status(self, bin_pid: str, stats) -> str:
+        """'new', 'changed' or 'unchanged' since the bin's last upload."""
+        row = self._conn.execute(
+            "SELECT files FROM uploads WHERE pid = ?", (bin_pid,)
+        ).fetchone()
+        if row is None:
+            return 'new'
+        if stats is None or json.loads(row[0]) != stats:
+            return 'changed'
+        return 'unchanged'
+
+    def record(self, bin_pid: str, stats, zip_bytes: int):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO uploads (pid, files, zip_bytes) VALUES (?, ?, ?)",
+            (bin_pid, json.dumps(stats), zip_bytes)
+        )
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+class ByteBudget:
+    """
+    Bytes of ZIP data the pipeline may hold at once. A bin larger than the
+    whole budget is still let through once nothing else holds any.
+    """
 
-        # Upload to object store (async)
-        async def upload():
-            async with StoreFactory(storage_yaml).build() as store:
-                await store.put(key, buffer)
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._changed = asyncio.Condition()
 
-        asyncio.run(upload())
+    async def acquire(self, nbytes: int):
+        async with self._changed:
+            await self._changed.wait_for(
+                lambda: self.used == 0 or self.used + nbytes <= self.limit
+            )
+            self.used += nbytes
 
-        return (bin_pid, True, None)
+    async def release(self, nbytes: int):
+        async with self._changed:
+            self.used -= nbytes
+            self._changed.notify_all()
 
-    except Exception as e:
-        return (bin_pid, False, str(e))
 
+class ProgressLog:
+    """
+    Counts finished bins and logs progress every 10 bins. The total grows
+    as the scan finds bins; the ETA is left out until the scan is done.
+    """
+
+    def __init__(self):
+        self.total_bins = 0
+        self.scan_done = False
+        self.skipped = 0
+        self.uploaded = 0
+        self.changed = 0
+        self.failed = 0
+        self.start_time = time.time()
+        self.last_log_count = 0
+
+    def found(self):
+        self.total_bins += 1
+
+    def skip(self):
+        self.skipped += 1
+
+    def finish_scan(self):
+        self.scan_done = True
+        logger.info(f"Scan finished: found {self.total_bins} bins to process")
+        if self.skipped:
+            logger.info(f"Skipped {self.skipped} bins unchanged since their last upload")
+
+    def summary(self) -> dict:
+        return {
+            'bins': self.total_bins + self.skipped,
+            'skipped': self.skipped,
+            'uploaded': self.uploaded,
+            'new': self.uploaded - self.changed,
+            'changed': self.changed,
+            'failed': self.failed,
+            'elapsed_s': round(time.time() - self.start_time, 1)
+        }
+
+    def record(self, bin_pid: str, error: str = None, changed: bool = False):
+        if error is None:
+            self.uploaded += 1
+            if changed:
+                self.changed += 1
+        else:
+            self.failed += 1
+            logger.error(f"Failed to process {bin_pid}: {error}")
+
+        processed = self.uploaded + self.failed
+        if processed - self.last_log_count >= 10:
+            elapsed = time.time() - self.start_time
+            rate = processed / elapsed if elapsed > 0 else 0
+            remaining = self.total_bins - processed
+            eta_seconds = remaining / rate if rate > 0 else 0
+
+            # Format ETA
+            eta_mins = int(eta_seconds // 60)
+            eta_secs = int(eta_seconds % 60)
+            eta = f"{eta_mins}m {eta_secs}s" if self.scan_done else "scanning"
+
+            logger.info(
+                f"Processed: {processed}/{self.total_bins} "
+                f"({processed/self.total_bins*100:.1f}%) | "
+                f"Uploaded: {self.uploaded} | Failed: {self.failed} | "
+                f"Rate: {rate:.2f} bins/sec | "
+                f"ETA: {eta}"
+            )
+            self.last_log_count = processed
+
+
+async def run_pipeline(
+    work_items,
+    storage_yaml: str,
+    num_workers: int,
+    upload_concurrency: int,
+    buffer_bytes: int,
+    tasks_per_worker: int,
+    progress: ProgressLog,
+    state: UploadState = None
+):
+    """
+    Zip work_items in a process pool and upload the results as they come in.
 
-def process_ifcb_directory(data_dir: str, storage_yaml: str, num_workers: int):
+    Args:
+        work_items: Iterator of BinWorkItems to process, consumed lazily
+        storage_yaml: Path to YAML file defining storage configuration
+        num_workers: Number of zip processes
+        upload_concurrency: Number of uploads in flight
+        buffer_bytes: Bytes of ZIP data held in memory at most
+        tasks_per_worker: Bins submitted per zip process at most
+        progress: ProgressLog to record every bin in
+        state: UploadState of an incremental run, or None to upload every bin
+
+    Raises:
+        BrokenProcessPool: A zip process died; the bins zipped before it did
+            are still uploaded.
+    """
+    loop = asyncio.get_running_loop()
+    budget = ByteBudget(buffer_bytes)
+    window = asyncio.Semaphore(num_workers * tasks_per_worker)
+    zipped = asyncio.Queue()
+    pool_broken = None
+
+    async def zip_bin(executor, item, stats, reserved, changed):
+        nonlocal pool_broken
+        try:
+            bin_pid, buffer, error = await loop.run_in_executor(executor, zip_single_bin, item)
+        except BrokenProcessPool as e:
+            pool_broken = pool_broken or e
+            bin_pid, buffer, error = item.pid, None, f"zip process died: {e}"
+        except Exception as e:
+            # A result that could not be sent back from the zip process
+            bin_pid, buffer, error = item.pid, None, str(e)
+        finally:
+            window.release()
+        if error is not None:
+            await budget.release(reserved)
+            progress.record(bin_pid, f"zip failed: {error}")
+            return
+        size = buffer_size(buffer)
+        # Negative when the ZIP came out larger than its source files.
+        await budget.release(reserved - size)
+        await zipped.put((bin_pid, buffer, size, stats, changed))
+
+    async def upload(store):
+        while True:
+            entry = await zipped.get()
+            if entry is None:
+                return
+            bin_pid, buffer, size, stats, changed = entry
+            try:
+                # Object key is bin name with .zip extension
+                await store.put(f"{bin_pid}.zip", buffer)
+                if state is not None and stats is not None:
+                    state.record(bin_pid, stats, size)
+                progress.record(bin_pid, changed=changed)
+            except Exception as e:
+                progress.record(bin_pid, f"upload failed: {e}")
+            finally:
+                # Drop the buffer before waiting for the next one.
+                entry = buffer = None
+                await budget.release(size)
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        async with StoreFactory(storage_yaml).build() as store:
+            uploaders = [
+                asyncio.create_task(upload(store))
+                for _ in range(upload_concurrency)
+            ]
+            zips = set()
+            items = iter(work_items)
+            while True:
+                entry = await loop.run_in_executor(None, next_with_stats, items)
+                if entry is None:
+                    break
+                item, stats = entry
+                status = state.status(item.pid, stats) if state is not None else 'new'
+                if status == 'unchanged':
+                    progress.skip()
+                    continue
+                reserved = sum(size for size, _ in stats) if stats else 0
+                await window.acquire()
+                await budget.acquire(reserved)
+                if pool_broken is not None:
+                    # Every further submission would fail the same way.
+                    await budget.release(reserved)
+                    window.release()
+                    break
+                progress.found()
+                task = asyncio.create_task(
+                    zip_bin(executor, item, stats, reserved, status == 'changed')
+                )
+                zips.add(task)
+                task.add_done_callback(zips.discard)
+            progress.finish_scan()
+            await asyncio.gather(*zips)
+            for _ in uploaders:
+                await zipped.put(None)
+            await asyncio.gather(*uploaders)
+    if pool_broken is not None:
+        raise pool_broken
+
+
+def process_ifcb_directory(
+    data_dir: str,
+    storage_yaml: str,
+    num_workers: int,
+    upload_concurrency: int = 32,
+    buffer_mb: int = 1024,
+    tasks_per_worker: int = 4,
+    state_file: str = None
+):
     """
     Process IFCB data directory and upload ZIPs to object store with multiprocessing.
 
     Args:
         data_dir: Path to IFCB data directory
         storage_yaml: Path to YAML file defining storage configuration
-        num_workers: Number of parallel workers
+        num_workers: Number of parallel zip processes
+        upload_concurrency: Number of concurrent uploads
+        buffer_mb: Megabytes of ZIP data held in memory awaiting upload
+        tasks_per_worker: Bins submitted per zip process at a time
+        state_file: Path to the incremental state file, or None to upload every bin
     """
-    # Initialize IFCB data directory and collect all bin PIDs
+    # Bins are zipped as the scan finds them, so work starts straight away
     logger.info(f"Scanning IFCB data from: {data_dir}")
-    dd = DataDirectory(data_dir)
-
-    bin_pids = [str(fileset_bin.pid) for fileset_bin in dd]
-    total_bins = len(bin_pids)
-
-    if total_bins == 0:
-        logger.warning("No bins found to process")
-        return
-
-    logger.info(f"Found {total_bins} bins to process")
-    logger.info(f"Using {num_workers} parallel workers")
+    logger.info(
+        f"Using {num_workers} zip workers, {upload_concurrency} concurrent uploads "
+        f"and a {buffer_mb} MB buffer"
+    )
 
-    # Track progress
-    total_uploaded = 0
-    total_failed = 0
-    start_time = time.time()
-    last_log_count = 0
+    progress = ProgressLog()
+    state = None
+    if state_file:
+        state = UploadState(state_file)
+        logger.info(f"Incremental run: {len(state)} bins recorded in {state_file}")
 
+    pool_broken = False
     try:
-        # Create process pool and submit work
-        with ProcessPoolExecutor(max_workers=num_workers) as executor:
-            # Submit all bins to the executor
-            future_to_bin = {
-                executor.submit(process_single_bin, data_dir, bin_pid, storage_yaml): bin_pid
-                for bin_pid in bin_pids
-            }
-
-            # Process completed futures as they finish
-            for future in as_completed(future_to_bin):
-                bin_pid, success, error = future.result()
-
-                if success:
-                    total_uploaded += 1
-                else:
-                    total_failed += 1
-                    logger.error(f"Failed to process {bin_pid}: {error}")
-
-                # Log progress every 10 bins
-                total_processed = total_uploaded + total_failed
-                if total_processed - last_log_count >= 10:
-                    elapsed = time.time() - start_time
-                    rate = total_processed / elapsed if elapsed > 0 else 0
-                    remaining = total_bins - total_processed
-                    eta_seconds = remaining / rate if rate > 0 else 0
-
-                    # Format ETA
-                    eta_mins = int(eta_seconds // 60)
-                    eta_secs = int(eta_seconds % 60)
-
-                    logger.info(
-                        f"Processed: {total_processed}/{total_bins} "
-                        f"({total_processed/total_bins*100:.1f}%) | "
-                        f"Uploaded: {total_uploaded} | Failed: {total_failed} | "
-                        f"Rate: {rate:.2f} bins/sec | "
-                        f"ETA: {eta_mins}m {eta_secs}s"
-                    )
-                    last_log_count = total_processed
+        asyncio.run(run_pipeline(
+            scan_bins(data_dir),
+            storage_yaml,
+            max(1, num_workers),
+            max(1, upload_concurrency),
+            buffer_mb * 1024 * 1024,
+            max(1, tasks_per_worker),
+            progress,
+            state
+        ))
 
     except KeyboardInterrupt:
         logger.warning("Process interrupted by user (Ctrl+C)")
         sys.exit(1)
 
+    except BrokenProcessPool as e:
+        logger.error(f"A zip process died; stopped submitting bins: {e}")
+        pool_broken = True
+
+    finally:
+        if state is not None:
+            state.close()
+
+    print(f"SUMMARY {json.dumps(progress.summary())}", flush=True)
+    if pool_broken:
+        sys.exit(1)
+
+    total_bins = progress.total_bins
+    if total_bins == 0:
+        if progress.skipped:
+            logger.info(f"All {progress.skipped} bins are unchanged. Nothing to upload.")
+        else:
+            logger.warning("No bins found to process")
+        return
+
     # Final summary
-    elapsed = time.time() - start_time
+    elapsed = time.time() - progress.start_time
     logger.info(
         f"\nProcessing complete. Total: {total_bins}, "
-        f"Uploaded: {total_uploaded}, Failed: {total_failed}, "
+        f"Uploaded: {progress.uploaded} ({progress.changed} changed), "
+        f"Skipped: {progress.skipped}, Failed: {progress.failed}, "
         f"Time: {elapsed:.1f}s"
     )
 
     # Only fail if ALL bins failed
-    if total_failed > 0 and total_uploaded == 0:
+    if progress.failed > 0 and progress.uploaded == 0:
         logger.error("All bins failed to process!")
         sys.exit(1)
 
@@ -166,7 +533,30 @@ def main():
         '--num-workers',
         type=int,
         default=16,
-        help='Number of parallel workers (default: 16)'
+        help='Number of parallel zip processes (default: 16)'
+    )
+    parser.add_argument(
+        '--upload-concurrency',
+        type=int,
+        default=32,
+        help='Number of concurrent uploads to the object store (default: 32)'
+    )
+    parser.add_argument(
+        '--buffer-mb',
+        type=int,
+        default=1024,
+        help='Megabytes of ZIP data held in memory awaiting upload (default: 1024)'
+    )
+    parser.add_argument(
+        '--tasks-per-worker',
+        type=int,
+        default=4,
+        help='Bins submitted per zip process at a time (default: 4)'
+    )
+    parser.add_argument(
+        '--state-file',
+        default=None,
+        help='Incremental state file; bins unchanged since their last recorded upload are skipped'
     )
 
     args = parser.parse_args()
@@ -174,7 +564,11 @@ def main():
     process_ifcb_directory(
         args.data_dir,
         args.storage_config,
-        args.num_workers
+        args.num_workers,
+        args.upload_concurrency,
+        args.buffer_mb,
+        args.tasks_per_worker,
+        args.state_file
     )
 
 
@@ -11,11 +11,14 @@ def ifcb_zip_storage(params: IFCBZipStorageParams):
     Flow: Generate ZIP files from IFCB data and store in object storage.
 
     This flow processes IFCB data using pyifcb, creates ZIP files for each fileset,
-    and uploads them to an object store configured via YAML.
+    and uploads them to an object store configured via YAML. With a state_file,
+    only bins that are new or changed since the last run are uploaded.
+
+    Returns the run's counts of skipped, uploaded and changed bins.
     """
     image = 'ghcr.io/whoigit/amplify-prefect/ifcb-zip-storage:latest'
     pull_images([image])
-    run_ifcb_zip_storage(params, image)
+    return run_ifcb_zip_storage(params, image)
 
 
 # Deploy the flow
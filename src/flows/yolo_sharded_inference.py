@@ -0,0 +1,44 @@
+from prefect import flow
+
+from src.params.params_amplify import YOLOInferenceParams, YOLOShardingParams, YOLOVisualizationParams
+from src.tasks.run_yolo_inference import run_yolo_inference
+from src.tasks.run_yolo_shards import plan_shard_params, run_yolo_deployment
+
+
+@flow(log_prints=True)
+def yolo_infer_sharded(yolo_inference_params: YOLOInferenceParams, yolo_visualization_params: YOLOVisualizationParams, yolo_sharding_params: YOLOShardingParams):
+    """Flow: Split one YOLO run across several Docker hosts or yolo_infer deployments sharing data_dir and output_dir."""
+    hosts = yolo_sharding_params.docker_hosts
+    deployments = yolo_sharding_params.deployments
+    if bool(hosts) == bool(deployments):
+        raise ValueError("Give either docker_hosts or deployments")
+
+    image = 'ghcr.io/whoigit/amplify-prefect/amplify-ultralytics:latest'
+    targets = hosts or deployments
+    shard_params = plan_shard_params(yolo_inference_params, yolo_sharding_params, len(targets))
+    if hosts:
+        # containers.run() pulls the image on a host that does not have it yet.
+        futures = [
+            run_yolo_inference.submit(params, yolo_visualization_params, image, docker_host=host)
+            for host, params in zip(hosts, shard_params)
+        ]
+    else:
+        futures = [
+            run_yolo_deployment.submit(deployment, params, yolo_visualization_params)
+            for deployment, params in zip(deployments, shard_params)
+        ]
+
+    # Wait for every node before failing, so none is left running unobserved.
+    failed = []
+    for target, future in zip(targets, futures):
+        try:
+            future.result()
+        except Exception as e:
+            failed.append(f"{target}: {e}")
+    if failed:
+        raise RuntimeError("Failed nodes:\n" + "\n".join(failed))
+
+
+# Deploy the flow
+if __name__ == "__main__":
+    yolo_infer_sharded.serve(name="yolo-inference-sharded")
@@ -0,0 +1,34 @@
+from prefect import flow, serve
+
+from src.params.params_amplify import YOLOInferenceParams, YOLOVisualizationParams, YOLOWatchParams
+from src.tasks.run_yolo_watch import drain_yolo_watch, start_yolo_watch, stop_yolo_watch
+from src.tasks.pull_images import pull_images
+
+
+@flow(log_prints=True)
+def yolo_watch_start(yolo_inference_params: YOLOInferenceParams, yolo_visualization_params: YOLOVisualizationParams, yolo_watch_params: YOLOWatchParams):
+    """Flow: Start a YOLO daemon that keeps the model loaded and infers new files as they land in data_dir."""
+    image = 'ghcr.io/whoigit/amplify-prefect/amplify-ultralytics:latest'
+    pull_images([image])
+    start_yolo_watch(yolo_inference_params, yolo_visualization_params, yolo_watch_params, image)
+
+
+@flow(log_prints=True)
+def yolo_watch_drain(yolo_watch_params: YOLOWatchParams):
+    """Flow: Stop the YOLO daemon once every file it has queued is processed."""
+    drain_yolo_watch(yolo_watch_params)
+
+
+@flow(log_prints=True)
+def yolo_watch_stop(yolo_watch_params: YOLOWatchParams):
+    """Flow: Stop the YOLO daemon after the batches in hand; unclaimed files wait for the next start."""
+    stop_yolo_watch(yolo_watch_params)
+
+
+# Deploy the flows
+if __name__ == "__main__":
+    serve(
+        yolo_watch_start.to_deployment(name="yolo-watch-start"),
+        yolo_watch_drain.to_deployment(name="yolo-watch-drain"),
+        yolo_watch_stop.to_deployment(name="yolo-watch-stop"),
+    )
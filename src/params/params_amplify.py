@@ -1,6 +1,6 @@
 from enum import Enum
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
 
 class YoloModeEnum(str, Enum):
@@ -8,6 +8,16 @@ class YoloModeEnum(str, Enum):
     inference = 'inference'
 
 
+class YoloStagingModeEnum(str, Enum):
+    disk = 'disk'
+    memory = 'memory'
+
+
+class YoloGateFillEnum(str, Enum):
+    empty = 'empty'
+    carry = 'carry'
+
+
 # Parameters relevant to SegGPT inference
 class SegGPTRequest(BaseModel):
     input_dir: str = Field(..., description="Directory containing input images")
@@ -39,7 +49,7 @@ class YOLOInferenceParams(BaseModel):
     data_dir: str = Field(..., description="Directory containing input images/videos")
     output_dir: str = Field(..., description="Directory where results will be saved")
     model_weights_path: str = Field(..., description="Path to YOLO model weights (.pt file)")
-    device: str = Field(..., description="Compute device for inference (e.g., '0' for GPU 0, 'cpu')")
+    device: str = Field(..., description="Compute device(s) for inference, comma-separated (e.g., '0' for GPU 0, '0,1', 'cpu')")
     agnostic_nms: bool = Field(True, description="Class-agnostic Non-Maximum Suppression")
     iou: float = Field(0.5, description="IoU threshold for NMS to eliminate overlapping boxes")
     conf: float = Field(0.1, description="Minimum confidence threshold for detections")
@@ -62,6 +72,45 @@ class YOLOInferenceParams(BaseModel):
     validation_workers: int = Field(0, description="Parallel OpenCV validation workers; 0 uses an automatic worker count")
     files_per_call: int = Field(1000, description="Files handed to each YOLO predict call; larger values amortize Ultralytics' per-call output directory rescan")
     convert_workers: int = Field(8, description="Threads used to stage 3-channel image copies before inference")
+    staging_mode: YoloStagingModeEnum = Field(YoloStagingModeEnum.disk, description="Stage image batches as temporary 3-channel copies on disk, or decode them into a bounded in-memory pool")
+    staging_memory_mb: int = Field(2048, description="Decoded-image budget per batch when staging_mode is 'memory'")
+    stream_discovery: bool = Field(False, description="Start GPU workers on the first validated batch instead of after the full directory walk")
+    decode_workers: int = Field(0, description="Decoder processes per worker for video inputs; they decode only the frames vid_stride keeps. 0 leaves decoding to Ultralytics")
+    gate_threshold: float = Field(0, description="Skip video frames that differ from the last inferred frame by less than this mean grey-level difference on a small thumbnail; uses decode_workers (at least 1). 0 disables gating")
+    gate_fill: YoloGateFillEnum = Field(YoloGateFillEnum.empty, description="Detections saved for gated frames: none, or a copy of the last inferred frame's")
+    tile_size: int = Field(0, description="Cut images into overlapping square tiles of this many pixels and merge their detections into image coordinates; requires save_detections. 0 runs whole images")
+    tile_overlap: float = Field(0.2, description="Fraction of a tile shared with each neighbouring tile")
+    tile_merge_iou: float = Field(0.5, description="IoU above which boxes from overlapping tiles are merged by NMS")
+    workers_per_device: int = Field(1, description="Model replicas sharing each device; CPU workers are each pinned to their share of cores")
+    stall_timeout_s: float = Field(1800, description="Seconds a busy worker may go without finishing a frame or image before it is replaced and its unfinished files handed to the replacement; 0 disables")
+    max_restarts: int = Field(2, description="Stalled-worker replacements per worker before its files are left for the next run")
+    save_detections: bool = Field(False, description="Write boxes, classes and confidences to <project>/detections.parquet")
+    cache_dir: str | None = Field(None, description="Host directory of a result cache shared across runs; files with identical content, weights and settings reuse cached detections. Requires save_detections")
+    cache_max_gb: float = Field(10, description="Size cap of the result cache; least recently used entries are evicted")
+    num_shards: int = Field(1, description="Split the dataset into this many shards by a hash of each file's relative path; this run processes shard_index")
+    shard_index: int = Field(0, description="Shard processed by this run, from 0 to num_shards - 1")
+    coordinate: bool = Field(False, description="Share the work with other runs writing to the same output_dir through claim files, so each file is processed once")
+    claim_ttl_s: float = Field(600, description="Seconds after which a claim not refreshed by its node is taken over; keep well above clock skew between hosts")
+    node_name: str | None = Field(None, description="Name of this run among several sharing output_dir, kept the same across runs; defaults to shard<index>, and is required with coordinate unless sharded")
+
+    @model_validator(mode='after')
+    def require_node_name_to_coordinate(self):
+        if self.coordinate and self.num_shards <= 1 and not self.node_name:
+            raise ValueError("coordinate needs a node_name that stays the same across runs")
+        return self
+
+
+class YOLOWatchParams(BaseModel):
+    container_name: str = Field("yolo-watch", description="Name of the watching container; drain and stop find the daemon by it")
+    watch_interval: float = Field(5.0, description="Seconds between polls of data_dir; a file is picked up once its size is unchanged across two polls")
+    startup_timeout_s: int = Field(600, description="Seconds to wait for the daemon's first poll before giving up on start")
+    shutdown_timeout_s: int = Field(3600, description="Seconds to wait for the daemon to exit after a drain or stop request")
+
+
+class YOLOShardingParams(BaseModel):
+    docker_hosts: list[str] = Field([], description="Docker daemon URLs (e.g. 'ssh://gpu2', 'tcp://gpu3:2376') to run one container on each")
+    deployments: list[str] = Field([], description="yolo_infer deployments ('yolo-infer/<name>') to run one flow each through, e.g. served on each GPU host")
+    coordinate: bool = Field(False, description="Let every node see the whole dataset and claim files as it goes, instead of splitting it into fixed shards")
 
 
 class YOLOVisualizationParams(BaseModel):
@@ -20,7 +20,27 @@ class IFCBZipStorageParams(BaseModel):
 
     num_workers: int = Field(
         16,
-        description="Number of parallel workers for processing bins (capped at CPU count)"
+        description="Number of parallel processes zipping bins (capped at CPU count)"
+    )
+
+    upload_concurrency: int = Field(
+        32,
+        description="Number of ZIP uploads in flight to the object store, independent of num_workers"
+    )
+
+    buffer_mb: int = Field(
+        1024,
+        description="Megabytes of ZIP data held in memory awaiting upload"
+    )
+
+    tasks_per_worker: int = Field(
+        4,
+        description="Bins submitted to each zip process at a time; bounds pending work however large the archive"
+    )
+
+    state_file: str | None = Field(
+        None,
+        description="Path to a state file recording uploaded bins; when set, bins whose raw files are unchanged since their last upload are skipped"
     )
 
     @field_validator('num_workers')
@@ -1,19 +1,29 @@
+import json
+import os
+
 from prefect import task, get_run_logger
+from prefect.artifacts import create_table_artifact
 import docker
 from dotenv import dotenv_values
 
 from src.params.params_ifcb_zip_storage import IFCBZipStorageParams
 
+SUMMARY_PREFIX = "SUMMARY "
+
 
 @task(log_prints=True)
-def run_ifcb_zip_storage(params: IFCBZipStorageParams, image: str):
+def run_ifcb_zip_storage(params: IFCBZipStorageParams, image: str) -> dict | None:
     """
     Run IFCB ZIP generation and storage in a Docker container.
 
     The container will:
     1. Use pyifcb to iterate through IFCB data
-    2. Generate ZIP streams for each fileset
-    3. Upload to object store defined by storage YAML
+    2. Generate ZIP streams for each fileset in a process pool
+    3. Upload them concurrently to object store defined by storage YAML
+
+    With a state_file, bins unchanged since their last upload are skipped.
+    Returns the container's summary counts (bins, skipped, uploaded, new,
+    changed, failed), which are also published as a table artifact.
     """
     client = docker.from_env()
     logger = get_run_logger()
@@ -23,6 +33,9 @@ def run_ifcb_zip_storage(params: IFCBZipStorageParams, image: str):
         params.data_dir: {'bind': '/data/ifcb', 'mode': 'ro'},
         params.storage_yaml: {'bind': '/config/storage.yaml', 'mode': 'ro'}
     }
+    if params.state_file:
+        # SQLite keeps its journal next to the state file, so mount its directory
+        volumes[os.path.dirname(os.path.abspath(params.state_file))] = {'bind': '/state', 'mode': 'rw'}
 
     # Load environment variables from env file
     environment = {}
@@ -36,8 +49,13 @@ def run_ifcb_zip_storage(params: IFCBZipStorageParams, image: str):
         "/app/src/process_ifcb_zips.py",
         "--data-dir", "/data/ifcb",
         "--storage-config", "/config/storage.yaml",
-        "--num-workers", str(params.num_workers)
+        "--num-workers", str(params.num_workers),
+        "--upload-concurrency", str(params.upload_concurrency),
+        "--buffer-mb", str(params.buffer_mb),
+        "--tasks-per-worker", str(params.tasks_per_worker)
     ]
+    if params.state_file:
+        command_args.extend(["--state-file", f"/state/{os.path.basename(params.state_file)}"])
 
     logger.info(f'Running IFCB ZIP storage with command: {" ".join(command_args)}')
 
@@ -52,9 +70,14 @@ def run_ifcb_zip_storage(params: IFCBZipStorageParams, image: str):
         )
 
         # Stream logs in real-time
+        summary = None
         try:
             for log_line in container.logs(stream=True, follow=True):
-                logger.info(log_line.decode('utf-8').rstrip())
+                text = log_line.decode('utf-8').rstrip()
+                logger.info(text)
+                for line in text.splitlines():
+                    if line.startswith(SUMMARY_PREFIX):
+                        summary = json.loads(line[len(SUMMARY_PREFIX):])
 
             # Wait for container to finish
             result = container.wait()
@@ -71,6 +94,18 @@ def run_ifcb_zip_storage(params: IFCBZipStorageParams, image: str):
                 pass
 
         logger.info("IFCB ZIP storage completed successfully")
+        if summary is not None:
+            logger.info(
+                f"Bins: {summary['bins']} | Skipped: {summary['skipped']} | "
+                f"Uploaded: {summary['uploaded']} ({summary['new']} new, {summary['changed']} changed) | "
+                f"Failed: {summary['failed']}"
+            )
+            create_table_artifact(
+                key="ifcb-zip-storage-summary",
+                table=[summary],
+                description="Bins skipped as unchanged, uploaded (new or changed) and failed in this IFCB ZIP storage run"
+            )
+        return summary
 
     except docker.errors.ContainerError as e:
         logger.error(f"Container failed with stderr: {e.stderr.decode('utf-8') if e.stderr else 'No stderr'}")
@@ -1,7 +1,13 @@
+import json
+import os
+import re
+import time
+
 from prefect import task
 import docker
 
 from prefect import get_run_logger
+from prefect.artifacts import create_progress_artifact, create_table_artifact, update_progress_artifact
 
 from src.prov import on_task_complete
 from src.params.params_amplify import YOLOInferenceParams, YOLOVisualizationParams
@@ -54,48 +60,275 @@ def _build_command_args(
         command_args.extend(["--files-per-call", str(yolo_inference_params.files_per_call)])
     if yolo_inference_params.convert_workers is not None:
         command_args.extend(["--convert-workers", str(yolo_inference_params.convert_workers)])
+    command_args.extend(["--staging-mode", yolo_inference_params.staging_mode.value])
+    command_args.extend(["--staging-memory-mb", str(yolo_inference_params.staging_memory_mb)])
+    if yolo_inference_params.stream_discovery:
+        command_args.append("--stream-discovery")
+    if yolo_inference_params.decode_workers:
+        command_args.extend(["--decode-workers", str(yolo_inference_params.decode_workers)])
+    if yolo_inference_params.gate_threshold > 0:
+        command_args.extend(["--gate-threshold", str(yolo_inference_params.gate_threshold)])
+        command_args.extend(["--gate-fill", yolo_inference_params.gate_fill.value])
+    if yolo_inference_params.tile_size > 0:
+        command_args.extend(["--tile-size", str(yolo_inference_params.tile_size)])
+        command_args.extend(["--tile-overlap", str(yolo_inference_params.tile_overlap)])
+        command_args.extend(["--tile-merge-iou", str(yolo_inference_params.tile_merge_iou)])
+    if yolo_inference_params.workers_per_device != 1:
+        command_args.extend(["--workers-per-device", str(yolo_inference_params.workers_per_device)])
+    command_args.extend(["--stall-timeout", str(yolo_inference_params.stall_timeout_s)])
+    command_args.extend(["--max-restarts", str(yolo_inference_params.max_restarts)])
+    if yolo_inference_params.save_detections:
+        command_args.append("--save-detections")
+    if yolo_inference_params.cache_dir:
+        command_args.extend(["--cache-dir", "/cache"])
+        command_args.extend(["--cache-max-gb", str(yolo_inference_params.cache_max_gb)])
+    if yolo_inference_params.num_shards > 1:
+        command_args.extend(["--num-shards", str(yolo_inference_params.num_shards)])
+        command_args.extend(["--shard-index", str(yolo_inference_params.shard_index)])
+    if yolo_inference_params.coordinate:
+        command_args.append("--coordinate")
+    if yolo_inference_params.num_shards > 1 or yolo_inference_params.coordinate:
+        command_args.extend(["--claim-ttl", str(yolo_inference_params.claim_ttl_s)])
+    if yolo_inference_params.node_name:
+        command_args.extend(["--node-name", yolo_inference_params.node_name])
 
     return command_args
 
 
-@task(on_completion=[on_task_complete], log_prints=True)
-def run_yolo_inference(yolo_inference_params: YOLOInferenceParams, yolo_visualization_params: YOLOVisualizationParams, yolo_image: str):
-    """
-    Run YOLO in a Docker container.
-    """
-    
-    client = docker.from_env()
-    logger = get_run_logger()
-    
-    # Set up volumes
+def _build_volumes(yolo_inference_params: YOLOInferenceParams) -> dict:
     volumes = {
         yolo_inference_params.data_dir: {'bind': '/data', 'mode': 'rw'},
         yolo_inference_params.output_dir: {'bind': '/output', 'mode': 'rw'},
         yolo_inference_params.model_weights_path: {'bind': '/input/weights.pt', 'mode': 'ro'}
     }
+    if yolo_inference_params.cache_dir:
+        volumes[yolo_inference_params.cache_dir] = {'bind': '/cache', 'mode': 'rw'}
+    return volumes
+
+
+def _build_device_requests(yolo_inference_params: YOLOInferenceParams) -> list:
+    # A CPU-only run must not ask Docker for GPUs the node may not have.
+    devices = [d.strip().lower() for d in yolo_inference_params.device.split(",") if d.strip()]
+    if any(d != "cpu" for d in devices):
+        return [docker.types.DeviceRequest(device_ids=["all"], capabilities=[["gpu"]])]
+    return []
+
+
+def _artifact_key(base: str, yolo_inference_params: YOLOInferenceParams) -> str:
+    """Artifact key of one node, so that the nodes of a sharded run do not share one."""
+    if yolo_inference_params.node_name:
+        suffix = yolo_inference_params.node_name
+    elif yolo_inference_params.num_shards > 1:
+        suffix = f"shard{yolo_inference_params.shard_index}"
+    else:
+        return base
+    # Keys may only hold lowercase letters, digits and dashes.
+    return f"{base}-{re.sub(r'[^a-z0-9-]+', '-', suffix.lower())}"
+
+
+PROGRESS_PREFIX = "PROGRESS "
+# Seconds between progress lines in the Prefect log; the artifact updates on every event.
+PROGRESS_LOG_INTERVAL = 60
+# Container output kept for the error report if the run fails.
+FAILURE_LOG_TAIL = 200
+
+
+def _iter_lines(chunks):
+    """Split a Docker log stream into lines; chunks need not be line-aligned."""
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8", errors="replace").rstrip()
+    if pending:
+        yield pending.decode("utf-8", errors="replace").rstrip()
+
+
+def _format_duration(seconds: float | None) -> str:
+    if seconds is None:
+        return "unknown"
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{secs:02d}s"
+
+
+class _ProgressRelay:
+    """
+    Turns the container's PROGRESS lines into a progress artifact and a
+    rate-limited log line. Worker chatter goes to debug; warnings and errors
+    are still logged as they arrive.
+    """
+
+    def __init__(self, logger, key: str = "yolo-inference-progress"):
+        self.logger = logger
+        self.key = key
+        self.artifact_id = None
+        self.last = None
+        self.last_logged = 0.0
+
+    def handle(self, line: str) -> None:
+        if line.startswith(PROGRESS_PREFIX):
+            try:
+                self._progress(json.loads(line[len(PROGRESS_PREFIX):]))
+            except json.JSONDecodeError:
+                self.logger.debug(line)
+        elif "ERROR" in line or "Traceback" in line:
+            self.logger.error(line)
+        elif "WARNING" in line:
+            self.logger.warning(line)
+        else:
+            self.logger.debug(line)
+
+    def _progress(self, progress: dict) -> None:
+        self.last = progress
+        percent = progress.get("percent") or 0.0
+        description = self._describe(progress)
+        if self.artifact_id is None:
+            self.artifact_id = create_progress_artifact(
+                progress=percent, key=self.key, description=description
+            )
+        else:
+            update_progress_artifact(self.artifact_id, percent, description=description)
+
+        now = time.monotonic()
+        if now - self.last_logged >= PROGRESS_LOG_INTERVAL:
+            self.logger.info(description)
+            self.last_logged = now
+
+    def finish(self) -> None:
+        if self.last is not None:
+            self.logger.info(self._describe(self.last))
+
+    @staticmethod
+    def _describe(progress: dict) -> str:
+        total = progress.get("files_total") or 0
+        if not progress.get("total_final"):
+            total = f"{total}+ (discovery running)"
+        settled = progress["files_done"] + progress.get("files_skipped", 0) + progress.get("errors", 0)
+        files_rate = progress.get("files_per_s") or 0
+        frames_rate = progress.get("frames_per_s") or 0
+        return (
+            f"{settled}/{total} files ({progress.get('percent') or 0:.1f}%), "
+            f"{progress.get('errors', 0)} errors, "
+            f"{files_rate:.1f} files/s, {frames_rate:.1f} frames/s, "
+            f"ETA {_format_duration(progress.get('eta_s'))}"
+        )
+
+
+def _read_stage_metrics(metrics_dir: str, since: float) -> list[dict]:
+    """Last snapshot each process of this run wrote under <output_dir>/metrics."""
+    rows = []
+    if not os.path.isdir(metrics_dir):
+        return rows
+    for filename in sorted(os.listdir(metrics_dir)):
+        if not filename.endswith(".jsonl"):
+            continue
+        latest = None
+        with open(os.path.join(metrics_dir, filename)) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("time", 0) >= since:
+                    latest = record
+        if latest is None:
+            continue
+
+        stages = latest.get("stages", {})
+        counters = latest.get("counters", {})
+        rates = latest.get("rates", {})
+        row = {
+            "worker": latest["name"],
+            "elapsed_s": latest["elapsed_s"],
+            "files": counters.get("files", counters.get("files_queued", 0)),
+            "frames": counters.get("frames", ""),
+            "frames_gated": counters.get("frames_gated", ""),
+            "tiles": counters.get("tiles", ""),
+            "errors": counters.get("errors", ""),
+            "files_per_s": rates.get("files_per_s", ""),
+            "frames_per_s": rates.get("frames_per_s", ""),
+            "mb_staged": round(counters["bytes_staged"] / 1e6, 1) if "bytes_staged" in counters else "",
+        }
+        for stage, values in stages.items():
+            row[f"{stage}_s"] = round(values["seconds"], 2)
+        rows.append(row)
+    return rows
+
+
+def _publish_stage_metrics(
+    output_dir: str, since: float, logger, key: str = "yolo-inference-stage-metrics"
+) -> None:
+    rows = _read_stage_metrics(os.path.join(output_dir, "metrics"), since)
+    if not rows:
+        logger.warning("No stage metrics found for this run")
+        return
+    # Every row needs the same columns for the table to render.
+    columns = []
+    for row in rows:
+        columns.extend(key for key in row if key not in columns)
+    table = [{column: row.get(column, "") for column in columns} for row in rows]
+    create_table_artifact(
+        key=key,
+        table=table,
+        description="Per-worker stage timings and throughput for the YOLO inference run",
+    )
+
+
+@task(on_completion=[on_task_complete], log_prints=True)
+def run_yolo_inference(yolo_inference_params: YOLOInferenceParams, yolo_visualization_params: YOLOVisualizationParams, yolo_image: str, docker_host: str | None = None):
+    """
+    Run YOLO in a Docker container, on the local Docker daemon or the one at docker_host.
+    """
+    
+    client = docker.DockerClient(base_url=docker_host) if docker_host else docker.from_env()
+    logger = get_run_logger()
     
+    volumes = _build_volumes(yolo_inference_params)
     command_args = _build_command_args(yolo_inference_params, yolo_visualization_params)
+    device_requests = _build_device_requests(yolo_inference_params)
     
     logger.info(f'Running container with command: {" ".join(command_args)}')
+    started = time.time()
     
     try:
         container = client.containers.run(
             yolo_image,
             command_args,
             volumes=volumes,
-            device_requests=[docker.types.DeviceRequest(device_ids=["all"], capabilities=[["gpu"]])],
+            device_requests=device_requests,
             ipc_mode="host",
-            remove=True,
-            detach=False,
-            stdout=True,
-            stderr=True,
-            stream=True
+            remove=False,  # Don't auto-remove so we can get logs on failure
+            detach=True,
         )
-        
-        # Stream output
-        for line in container:
-            logger.info(line.decode('utf-8').rstrip())
-            
+
+        # Stream output as it is produced; PROGRESS lines drive the artifact
+        relay = _ProgressRelay(logger, _artifact_key("yolo-inference-progress", yolo_inference_params))
+        try:
+            for line in _iter_lines(container.logs(stream=True, follow=True)):
+                relay.handle(line)
+        except Exception as log_error:
+            logger.error(f"Error streaming logs: {log_error}")
+        relay.finish()
+
+        result = container.wait()
+        exit_code = result['StatusCode']
+
+        _publish_stage_metrics(
+            yolo_inference_params.output_dir, started, logger,
+            _artifact_key("yolo-inference-stage-metrics", yolo_inference_params),
+        )
+
+        if exit_code != 0:
+            tail = container.logs(stdout=True, stderr=True, tail=FAILURE_LOG_TAIL).decode('utf-8', errors='replace')
+            container.remove()
+            logger.error(f"Container failed with exit code {exit_code}")
+            logger.error(f"Last {FAILURE_LOG_TAIL} lines of container output:\n{tail}")
+            raise RuntimeError(f"Docker container failed with exit code {exit_code}")
+
+        container.remove()
+
     except docker.errors.ContainerError as e:
         logger.error(f"Container failed with stderr: {e.stderr.decode('utf-8') if e.stderr else 'No stderr'}")
         raise RuntimeError(f"Docker container failed with exit code {e.exit_status}")
@@ -0,0 +1,47 @@
+from prefect import get_run_logger, task
+from prefect.deployments import run_deployment
+
+from src.params.params_amplify import YOLOInferenceParams, YOLOShardingParams, YOLOVisualizationParams
+
+
+def plan_shard_params(
+    yolo_inference_params: YOLOInferenceParams,
+    yolo_sharding_params: YOLOShardingParams,
+    num_nodes: int,
+) -> list[YOLOInferenceParams]:
+    """
+    One copy of the inference parameters per node. Node names are fixed by
+    position, so re-running the same fan-out resumes each node's own manifest
+    journal.
+    """
+    shard_params = []
+    for index in range(num_nodes):
+        if yolo_sharding_params.coordinate:
+            update = {"num_shards": 1, "shard_index": 0, "coordinate": True, "node_name": f"node{index}"}
+        else:
+            update = {"num_shards": num_nodes, "shard_index": index, "coordinate": False, "node_name": None}
+        shard_params.append(yolo_inference_params.model_copy(update=update))
+    return shard_params
+
+
+@task(log_prints=True)
+def run_yolo_deployment(
+    deployment_name: str,
+    yolo_inference_params: YOLOInferenceParams,
+    yolo_visualization_params: YOLOVisualizationParams,
+) -> None:
+    """Run one node's share through a yolo_infer deployment and wait for it to finish."""
+    logger = get_run_logger()
+    node = yolo_inference_params.node_name or f"shard{yolo_inference_params.shard_index}"
+    logger.info(f"Starting {node} on deployment {deployment_name}")
+    flow_run = run_deployment(
+        name=deployment_name,
+        parameters={
+            "yolo_inference_params": yolo_inference_params.model_dump(mode="json"),
+            "yolo_visualization_params": yolo_visualization_params.model_dump(mode="json"),
+        },
+        timeout=None,
+    )
+    if not flow_run.state.is_completed():
+        raise RuntimeError(f"{node} on {deployment_name} ended in state {flow_run.state.name}")
+    logger.info(f"{node} on {deployment_name} completed")
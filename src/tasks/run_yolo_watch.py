@@ -0,0 +1,170 @@
+import json
+import os
+import time
+
+from prefect import task
+import docker
+
+from prefect import get_run_logger
+
+from src.prov import on_task_complete
+from src.params.params_amplify import YOLOInferenceParams, YOLOVisualizationParams, YOLOWatchParams
+from src.tasks.run_yolo_inference import (
+    FAILURE_LOG_TAIL,
+    _build_command_args,
+    _build_device_requests,
+    _build_volumes,
+    _publish_stage_metrics,
+)
+
+# Control files the watching container polls; see
+# docker/amplify-ultralytics/watch_control.py.
+WATCH_DIRNAME = ".watch"
+STATUS_FILENAME = "status.json"
+DRAIN_FILENAME = "drain"
+STOP_FILENAME = "stop"
+
+
+def _read_watch_status(output_dir: str) -> dict | None:
+    try:
+        with open(os.path.join(output_dir, WATCH_DIRNAME, STATUS_FILENAME)) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _output_dir_of(container) -> str:
+    """Host directory mounted at /output in a watching container."""
+    for mount in container.attrs.get("Mounts", []):
+        if mount.get("Destination") == "/output":
+            return mount["Source"]
+    raise RuntimeError(f"Container {container.name} has no /output mount")
+
+
+def _fail_with_logs(container, logger, message: str):
+    tail = container.logs(stdout=True, stderr=True, tail=FAILURE_LOG_TAIL).decode('utf-8', errors='replace')
+    container.remove(force=True)
+    logger.error(message)
+    logger.error(f"Last {FAILURE_LOG_TAIL} lines of container output:\n{tail}")
+    raise RuntimeError(message)
+
+
+@task(on_completion=[on_task_complete], log_prints=True)
+def start_yolo_watch(
+    yolo_inference_params: YOLOInferenceParams,
+    yolo_visualization_params: YOLOVisualizationParams,
+    yolo_watch_params: YOLOWatchParams,
+    yolo_image: str,
+) -> str:
+    """
+    Start yolo_inference.py --watch in a detached container and return its id
+    once the daemon has completed its first poll of data_dir.
+    """
+    client = docker.from_env()
+    logger = get_run_logger()
+    name = yolo_watch_params.container_name
+
+    try:
+        existing = client.containers.get(name)
+    except docker.errors.NotFound:
+        existing = None
+    if existing is not None:
+        if existing.status == "running":
+            raise RuntimeError(f"A YOLO watch daemon named {name} is already running")
+        logger.info(f"Removing exited container {name} from a previous daemon")
+        existing.remove()
+
+    # A status file left by the previous daemon must not pass for this one's.
+    status_path = os.path.join(yolo_inference_params.output_dir, WATCH_DIRNAME, STATUS_FILENAME)
+    if os.path.exists(status_path):
+        os.remove(status_path)
+
+    command_args = _build_command_args(yolo_inference_params, yolo_visualization_params)
+    command_args.extend(["--watch", "--watch-interval", str(yolo_watch_params.watch_interval)])
+
+    logger.info(f'Starting watch container {name} with command: {" ".join(command_args)}')
+    container = client.containers.run(
+        yolo_image,
+        command_args,
+        name=name,
+        volumes=_build_volumes(yolo_inference_params),
+        device_requests=_build_device_requests(yolo_inference_params),
+        ipc_mode="host",
+        remove=False,
+        detach=True,
+    )
+
+    deadline = time.monotonic() + yolo_watch_params.startup_timeout_s
+    while True:
+        status = _read_watch_status(yolo_inference_params.output_dir)
+        if status is not None and status.get("state") == "running":
+            break
+        container.reload()
+        if container.status == "exited":
+            _fail_with_logs(container, logger, f"Watch container {name} exited during start-up")
+        if time.monotonic() > deadline:
+            container.stop()
+            _fail_with_logs(
+                container, logger,
+                f"Watch container {name} did not start polling within {yolo_watch_params.startup_timeout_s}s",
+            )
+        time.sleep(2)
+
+    logger.info(f"YOLO watch daemon {name} is polling {yolo_inference_params.data_dir}")
+    return container.id
+
+
+def _end_yolo_watch(yolo_watch_params: YOLOWatchParams, request_filename: str) -> None:
+    client = docker.from_env()
+    logger = get_run_logger()
+    name = yolo_watch_params.container_name
+
+    try:
+        container = client.containers.get(name)
+    except docker.errors.NotFound:
+        logger.warning(f"No YOLO watch container named {name}; nothing to do")
+        return
+
+    output_dir = _output_dir_of(container)
+    status = _read_watch_status(output_dir) or {}
+    if container.status == "running":
+        request_path = os.path.join(output_dir, WATCH_DIRNAME, request_filename)
+        with open(request_path, "w"):
+            pass
+        logger.info(f"Requested {request_filename} of {name}; waiting for it to exit")
+
+    try:
+        result = container.wait(timeout=yolo_watch_params.shutdown_timeout_s)
+    except Exception:
+        _fail_with_logs(
+            container, logger,
+            f"Watch container {name} did not exit within {yolo_watch_params.shutdown_timeout_s}s",
+        )
+    exit_code = result['StatusCode']
+
+    _publish_stage_metrics(output_dir, status.get("started", 0), logger)
+
+    if exit_code != 0:
+        _fail_with_logs(container, logger, f"Watch container {name} failed with exit code {exit_code}")
+
+    final = _read_watch_status(output_dir) or {}
+    logger.info(
+        f"YOLO watch daemon {name} exited after queueing {final.get('queued', 0)} files "
+        f"in {final.get('batches', 0)} batches"
+    )
+    container.remove()
+
+
+@task(on_completion=[on_task_complete], log_prints=True)
+def drain_yolo_watch(yolo_watch_params: YOLOWatchParams) -> None:
+    """Stop the daemon polling, let it finish every queued batch, and remove it."""
+    _end_yolo_watch(yolo_watch_params, DRAIN_FILENAME)
+
+
+@task(on_completion=[on_task_complete], log_prints=True)
+def stop_yolo_watch(yolo_watch_params: YOLOWatchParams) -> None:
+    """
+    Stop the daemon polling and drop batches not yet claimed; files in them
+    are picked up again by the next start.
+    """
+    _end_yolo_watch(yolo_watch_params, STOP_FILENAME)